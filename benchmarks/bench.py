@@ -0,0 +1,345 @@
+"""
+Benchmarks for the Crop Calendar Planner.
+
+Every operation runs against synthetic data, and storage runs against
+an in-process fake of the crop_calendar spreadsheet, so the suite needs
+no network or credentials:
+
+    python3 -m benchmarks.bench              # quick sizes
+    python3 -m benchmarks.bench --full       # up to 100k plants, 1M rows
+    python3 -m benchmarks.bench --save       # save the run as the baseline
+    python3 -m benchmarks.bench --compare    # compare with the baseline
+
+For each operation the suite reports throughput, p50 and p99 latency
+and the peak memory allocated by one call. --compare exits with status
+1 if any operation's p50 got slower than the threshold allows.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+import run
+from classes.batch_runner import results_table, schedule_rows
+from classes.fake_sheets import FakeSpreadsheet, synthetic_plant_rows
+from classes.plant import Plant
+from classes.plant_catalog import PlantCatalog
+from classes.schedule_engine import ScheduleEngine
+from classes.schedule_export import EXPORTERS, export_results
+from classes.storage import RESULTS_HEADER, SheetsStorage
+from classes.table_creator import TableCreator
+from classes.user_data import UserData
+
+SIZES = {
+    "quick": {"plants": (10, 1000, 10000), "results": (1, 1000, 100000)},
+    "full": {"plants": (10, 1000, 100000), "results": (1, 10000, 1000000)}
+}
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+ROWS_PER_EMAIL = 10
+MIN_TIME = 0.5
+MAX_RUNS = 1000
+
+
+def synthetic_results(count):
+    """
+    Build user_results rows, ROWS_PER_EMAIL per email address.
+
+    Args:
+        count (int): The number of result rows.
+
+    Returns:
+        list: The rows, header row first.
+    """
+    rows = [list(RESULTS_HEADER)]
+    for number in range(count):
+        rows.append([
+            f"user{number // ROWS_PER_EMAIL}@example.com",
+            f"Plant {number % 97}", "Planting Date", "2024-04-01",
+            "2024-07-01"
+        ])
+    return rows
+
+
+def sheets_storage(plant_rows, result_rows, index_dir, latency=0.0):
+    """
+    Create a SheetsStorage backed by an in-memory FakeSpreadsheet.
+    """
+    return SheetsStorage(
+        spreadsheet=FakeSpreadsheet({
+            "plant_list": plant_rows,
+            "user_results": result_rows
+        }, latency=latency),
+        index_path=os.path.join(index_dir, f"index-{len(result_rows)}.json")
+    )
+
+
+@contextlib.contextmanager
+def answers(action, date):
+    """
+    Answer run.py's action and date prompts and swallow its output.
+    """
+    get_action, get_date = run.get_action, run.get_date
+    run.get_action, run.get_date = (lambda: action), (lambda: date)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        run.get_action, run.get_date = get_action, get_date
+
+
+def quiet(func):
+    """
+    Wrap func so anything it prints is discarded.
+    """
+    def call():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return func()
+    return call
+
+
+def measure(func, items=1, min_time=MIN_TIME, max_runs=MAX_RUNS):
+    """
+    Time func until min_time has passed or max_runs calls were made.
+
+    Args:
+        func (callable): The operation, called without arguments.
+        items (int): The number of items one call handles, used for
+            the throughput.
+        min_time (float): The minimum time to spend timing.
+        max_runs (int): The maximum number of timed calls.
+
+    Returns:
+        dict: runs, p50_ms, p99_ms, items_per_s and peak_kib.
+    """
+    func()  # Warm up caches and lazy imports
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < max_runs and (
+            not timings or time.perf_counter() - started < min_time):
+        call_started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - call_started)
+
+    timings.sort()
+    p50 = statistics.median(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    return {
+        "runs": len(timings),
+        "p50_ms": p50 * 1000,
+        "p99_ms": p99 * 1000,
+        "items_per_s": items / p50 if p50 else 0.0,
+        "peak_kib": peak / 1024
+    }
+
+
+def operations(sizes, index_dir, latency=0.0):
+    """
+    Yield the benchmarked operations.
+
+    Args:
+        sizes (dict): Catalog and results sheet sizes, from SIZES.
+        index_dir (str): A directory for the email index files.
+        latency (float): Seconds the fake spreadsheet adds to every
+            request.
+
+    Yields:
+        tuple: The operation's name, a callable and the number of
+        items one call handles.
+    """
+    for count in sizes["plants"]:
+        rows = synthetic_plant_rows(count)
+        catalog = PlantCatalog(rows)
+        ids = catalog.ids[:10]
+        table_creator = TableCreator(rows)
+        engine = ScheduleEngine(catalog)
+        date = datetime(2024, 4, 1)
+        season = np.arange(
+            "2024-03-01", "2024-10-01", 14, dtype="datetime64[D]"
+        )
+
+        yield (f"plant_construct[{count}]",
+               lambda rows=rows: [Plant(*row) for row in rows[1:]], count)
+        yield (f"catalog_build[{count}]",
+               lambda rows=rows: PlantCatalog(rows), count)
+        edited = [list(row) for row in rows]
+        edited[1][1] += " (edited)"
+        yield (f"catalog_update[{count}]",
+               lambda catalog=PlantCatalog(rows), rows=rows, edited=edited:
+               _update_one(catalog, rows, edited), 1)
+        yield (f"catalog_search[{count}]",
+               lambda catalog=catalog:
+               catalog.search_index.by_name_substring("bean"), 1)
+        yield (f"schedule_rows[{count}]",
+               lambda catalog=catalog, ids=ids: schedule_rows(
+                   [catalog.get(i) for i in ids], 'P', date), len(ids))
+        yield (f"get_selected_plants[{count}]",
+               lambda catalog=catalog, ids=ids: _selected(catalog, ids),
+               len(ids))
+        yield (f"schedule_engine[{count}]",
+               lambda engine=engine: engine.schedule(
+                   engine.plant_ids, "2024-04-01"), count)
+        yield (f"season_timeline[{count}]",
+               lambda engine=engine, dates=season: engine.season_timeline(
+                   engine.plant_ids, dates), count * len(season))
+        yield (f"create_main_table[{count}]",
+               lambda table_creator=table_creator:
+               table_creator.create_main_table(4).get_string(), count)
+        yield (f"render_page[{count}]",
+               lambda table_creator=table_creator: _render_page(
+                   table_creator), 1)
+
+    for rows_shown in (10, 100):
+        records = [
+            dict(zip(RESULTS_HEADER, row))
+            for row in synthetic_results(rows_shown)[1:]
+        ]
+        yield (f"display_user_data[{rows_shown}]",
+               quiet(lambda records=records: run.display_user_data(records)),
+               rows_shown)
+        yield (f"results_table[{rows_shown}]",
+               lambda records=records: results_table(
+                   [list(record.values())[1:] for record in records]
+               ).get_string(), rows_shown)
+
+    plant_rows = synthetic_plant_rows(sizes["plants"][0])
+    for count in sizes["results"]:
+        result_rows = synthetic_results(count)
+        storage = sheets_storage(
+            plant_rows, result_rows, index_dir, latency
+        )
+        email = result_rows[-1][0]
+        new_rows = UserData(
+            "bench@example.com",
+            [row[1:] for row in synthetic_results(ROWS_PER_EMAIL)[1:]]
+        )
+
+        yield (f"sheets_load_plants[{count}]", storage.load_plants, 1)
+        yield (f"sheets_index_rebuild[{count}]", storage.rebuild_index,
+               count)
+        yield (f"sheets_fetch_results[{count}]",
+               lambda storage=storage, email=email:
+               storage.fetch_results(email), 1)
+        for fmt in EXPORTERS:
+            yield (f"sheets_export_{fmt}[{count}]",
+                   lambda storage=storage, fmt=fmt: _export(storage, fmt),
+                   count)
+        yield (f"sheets_append_results[{count}]",
+               lambda storage=storage, new_rows=new_rows:
+               storage.append_results(new_rows), ROWS_PER_EMAIL)
+
+
+def _selected(catalog, ids):
+    with answers('P', "2024-04-01"):
+        return run.get_selected_plants(catalog, ids)
+
+
+def _export(storage, fmt):
+    with open(os.devnull, "w", newline="") as sink:
+        return export_results(storage, sink, fmt)
+
+
+def _update_one(catalog, rows, edited):
+    # Alternate between the two versions so every call patches a plant.
+    return catalog.update(edited if catalog.rows is rows else rows)
+
+
+def _render_page(table_creator):
+    TableCreator._rendered.clear()
+    return table_creator.render_page(0, 120, 40)
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare a run with a baseline.
+
+    Args:
+        results (dict): This run's results by operation name.
+        baseline (dict): The baseline results by operation name.
+        threshold (float): The largest allowed p50 ratio.
+
+    Returns:
+        list: The names of the operations that regressed.
+    """
+    regressions = []
+    print(f"\n{'operation':<34}{'baseline':>12}{'now':>12}{'ratio':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["p50_ms"]
+        ratio = result["p50_ms"] / before if before else 1.0
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print(f"{name:<34}{before:>10.3f}ms{result['p50_ms']:>10.3f}ms"
+              f"{ratio:>8.2f}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--full", action="store_true",
+                        help="use the full sizes (slow, needs a few GB)")
+    parser.add_argument("--only", metavar="TEXT",
+                        help="run only operations whose name contains TEXT")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="milliseconds added to every Sheets request")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                        help="the baseline file")
+    parser.add_argument("--save", action="store_true",
+                        help="save this run as the baseline")
+    parser.add_argument("--compare", action="store_true",
+                        help="compare this run with the baseline")
+    parser.add_argument("--threshold", type=float, default=1.5,
+                        help="p50 ratio counted as a regression")
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{'operation':<34}{'runs':>6}{'p50':>12}{'p99':>12}"
+          f"{'items/s':>14}{'peak':>12}")
+    with tempfile.TemporaryDirectory() as index_dir:
+        sizes = SIZES["full" if args.full else "quick"]
+        latency = args.latency / 1000
+        for name, func, items in operations(sizes, index_dir, latency):
+            if args.only and args.only not in name:
+                continue
+            result = measure(func, items)
+            results[name] = result
+            print(f"{name:<34}{result['runs']:>6}"
+                  f"{result['p50_ms']:>10.3f}ms{result['p99_ms']:>10.3f}ms"
+                  f"{result['items_per_s']:>14,.0f}"
+                  f"{result['peak_kib']:>9,.0f}KiB")
+
+    status = 0
+    if args.compare:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        if compare(results, baseline, args.threshold):
+            status = 1
+    if args.save:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump({
+                "python": sys.version.split()[0],
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results
+            }, baseline_file, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
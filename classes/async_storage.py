@@ -0,0 +1,129 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = 4
+
+
+class AsyncStorage:
+    """
+    An asyncio front end for a StorageBackend.
+
+    gspread only has a blocking client, so every storage call runs on a
+    small thread pool and is awaited from an event loop that runs in its
+    own background thread. Independent calls can then overlap, and the
+    terminal UI can keep drawing (for example a progress indicator)
+    while a request is in flight.
+
+    Attributes:
+    -----------
+    storage : StorageBackend
+        The wrapped storage backend.
+
+    Methods:
+    --------
+    call(func, *args)
+        Coroutine that runs a blocking function on the thread pool.
+    load_plants(), append_results(user_data), fetch_results(email),
+    prepare()
+        Coroutine versions of the StorageBackend methods.
+    gather(*coroutines)
+        Coroutine that runs independent requests concurrently.
+    submit(coroutine)
+        Starts a coroutine on the event loop from ordinary code.
+    close()
+        Stops the event loop and the thread pool.
+    """
+
+    def __init__(self, storage, max_workers=DEFAULT_WORKERS):
+        """
+        Initializes the wrapper and starts its event loop thread.
+
+        Parameters:
+        -----------
+        storage : StorageBackend
+            The storage backend to wrap.
+        max_workers : int
+            The number of requests that can run at the same time.
+        """
+        self.storage = storage
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="storage"
+        )
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(self._executor)
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="storage-loop", daemon=True
+        )
+        self._thread.start()
+
+    async def call(self, func, *args):
+        """
+        Run a blocking function on the thread pool.
+
+        Parameters:
+        -----------
+        func : callable
+            The blocking function.
+        *args
+            Arguments passed to func.
+
+        Returns:
+        --------
+        The value returned by func.
+        """
+        return await self._loop.run_in_executor(None, func, *args)
+
+    async def load_plants(self):
+        return await self.call(self.storage.load_plants)
+
+    async def append_results(self, user_data):
+        return await self.call(self.storage.append_results, user_data)
+
+    async def fetch_results(self, email):
+        return await self.call(self.storage.fetch_results, email)
+
+    async def prepare(self):
+        return await self.call(self.storage.prepare)
+
+    async def gather(self, *coroutines):
+        """
+        Run independent requests concurrently.
+
+        Parameters:
+        -----------
+        *coroutines
+            The requests to run.
+
+        Returns:
+        --------
+        list
+            Their results, in the order given.
+        """
+        return await asyncio.gather(*coroutines)
+
+    def submit(self, coroutine):
+        """
+        Start a coroutine on the event loop from ordinary (non-async)
+        code and return straight away.
+
+        Parameters:
+        -----------
+        coroutine : coroutine
+            The coroutine to run, e.g. storage.append_results(user_data).
+
+        Returns:
+        --------
+        concurrent.futures.Future
+            A future for the coroutine's result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def close(self):
+        """
+        Stop the event loop and shut down the thread pool.
+        """
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+        self._loop.close()
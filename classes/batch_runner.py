@@ -0,0 +1,673 @@
+import csv
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from prettytable import PrettyTable
+
+from classes.metrics import timed
+from classes.storage import RESULTS_HEADER
+from classes.user_data import UserData
+
+PLAN_FIELDS = ("email", "plants", "action", "date")
+PLANT_SEPARATOR = re.compile(r"[\s;,]+")
+DATE_TYPES = {'P': "Planting Date", 'H': "Harvest Date"}
+STORAGE_CHUNK = 200
+PARALLEL_CHUNK = 500
+# Chunks queued per worker process. Bounds memory while keeping every
+# worker busy.
+INFLIGHT_PER_WORKER = 2
+
+
+@timed("compute.schedule_rows")
+def schedule_rows(plants, action, input_date):
+    """
+    Calculate the result rows for one plan, as the interactive planner
+    does: the harvest date is the planting date plus the plant's total
+    growth time, and the other way around.
+
+    Parameters:
+    -----------
+    plants : list
+        Plant or PlantView objects.
+    action : str
+        'P' if input_date is the planting date, 'H' if it is the
+        harvest date.
+    input_date : datetime
+        The date the user entered.
+
+    Returns:
+    --------
+    list
+        One [plant, date type, date, corresponding date] row per plant.
+    """
+    date_type = DATE_TYPES[action]
+    sign = 1 if action == 'P' else -1
+    date = input_date.strftime('%Y-%m-%d')
+    return [
+        [
+            plant.name, date_type, date,
+            (input_date + sign * timedelta(
+                days=plant.total_growth_time()
+            )).strftime('%Y-%m-%d')
+        ]
+        for plant in plants
+    ]
+
+
+def read_plans(lines, fmt="csv"):
+    """
+    Read plan records from CSV or JSON Lines one at a time.
+
+    CSV input needs a header row with the columns email, plants, action
+    and date. JSON Lines input has one object with those keys per line.
+
+    Parameters:
+    -----------
+    lines : iterable
+        The input lines, e.g. an open file.
+    fmt : str
+        'csv' or 'jsonl'.
+
+    Yields:
+    -------
+    tuple
+        The input line number and the record as a dict.
+    """
+    if fmt == "jsonl":
+        for line_number, line in enumerate(lines, start=1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    # Reported as invalid by parse_plan().
+                    yield line_number, None
+    else:
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+
+
+def parse_plan(record):
+    """
+    Validate a plan record.
+
+    Parameters:
+    -----------
+    record : dict
+        A record from read_plans(). 'plants' is a list of ids, a
+        single numeric id or a string of ids separated by spaces,
+        commas or semicolons.
+
+    Returns:
+    --------
+    tuple
+        The email, the list of plant ids, the action and the date.
+
+    Raises:
+    -------
+    ValueError
+        If a field is missing or invalid.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("not a JSON object")
+    missing = [field for field in PLAN_FIELDS if not record.get(field)]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+
+    plant_ids = record["plants"]
+    if isinstance(plant_ids, str):
+        plant_ids = PLANT_SEPARATOR.split(plant_ids.strip())
+    elif isinstance(plant_ids, int) and not isinstance(plant_ids, bool):
+        plant_ids = [plant_ids]
+    elif not isinstance(plant_ids, list):
+        raise ValueError("plants must be a list or a string of plant ids")
+    action = str(record["action"]).strip().upper()
+    if action not in DATE_TYPES:
+        raise ValueError(f"action must be P or H, not '{record['action']}'")
+    date = datetime.strptime(str(record["date"]).strip(), "%Y-%m-%d")
+    return (
+        str(record["email"]).strip(), [str(i) for i in plant_ids],
+        action, date
+    )
+
+
+def plan_key(email, plant_ids, action, date):
+    """
+    Return an idempotency key for a plan, so storing the same plan
+    twice (for example when a batch is rerun) stores it once.
+    """
+    return hashlib.sha1(json.dumps(
+        [email, plant_ids, action, date.strftime('%Y-%m-%d')]
+    ).encode()).hexdigest()
+
+
+def results_table(rows):
+    """
+    Build the table used to show a user's results.
+
+    Parameters:
+    -----------
+    rows : list
+        [plant, date type, date, corresponding date] rows.
+
+    Returns:
+    --------
+    PrettyTable
+        The results table.
+    """
+    results = PrettyTable()
+
+    results.border = False
+    results.align = "l"
+    results.padding_width = 3
+    results.field_names = [
+        "Plant", "Date Type", "Date", "Corresponding Date"
+    ]
+    results.add_rows(rows)
+    return results
+
+
+def render_csv(user_data):
+    """
+    Render one plan's results as CSV rows, without a header row.
+
+    Parameters:
+    -----------
+    user_data : UserData
+        One plan's email and result rows.
+
+    Returns:
+    --------
+    str
+        One line per result row.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        [user_data.email] + row for row in user_data.get_data()
+    )
+    return buffer.getvalue()
+
+
+def render_jsonl(user_data):
+    """
+    Render one plan's results as JSON Lines objects keyed by
+    RESULTS_HEADER.
+
+    Parameters:
+    -----------
+    user_data : UserData
+        One plan's email and result rows.
+
+    Returns:
+    --------
+    str
+        One line per result row.
+    """
+    return "".join(
+        json.dumps(dict(zip(RESULTS_HEADER, [user_data.email] + row)))
+        + "\n"
+        for row in user_data.get_data()
+    )
+
+
+def render_report(user_data):
+    """
+    Render one plan's results as the email address followed by a
+    results table.
+
+    Parameters:
+    -----------
+    user_data : UserData
+        One plan's email and result rows.
+
+    Returns:
+    --------
+    str
+        The report section.
+    """
+    return (
+        f"\n {user_data.email}\n\n"
+        f"{results_table(user_data.get_data()).get_string()}\n"
+    )
+
+
+# Functions that render one plan's results in each output format.
+RENDERERS = {
+    "csv": render_csv,
+    "jsonl": render_jsonl,
+    "report": render_report
+}
+
+
+class BatchStats:
+    """
+    Counters for a batch run.
+
+    Attributes:
+    -----------
+    records : int
+        Plan records read.
+    rows : int
+        Result rows written.
+    errors : int
+        Records skipped because they were invalid.
+    elapsed : float
+        Seconds the run took.
+    """
+
+    def __init__(self):
+        self.records = 0
+        self.rows = 0
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def report(self):
+        """
+        Returns a one-line summary with the throughput.
+
+        Returns:
+        --------
+        str
+            The summary.
+        """
+        rate = self.records / self.elapsed if self.elapsed else 0.0
+        return (
+            f"{self.records} plans, {self.rows} rows, {self.errors} errors"
+            f" in {self.elapsed:.2f}s ({rate:,.0f} plans/s)"
+        )
+
+
+class TextResultWriter:
+    """
+    Writes results to a text stream in one of the RENDERERS formats:
+    CSV with a RESULTS_HEADER header row, JSON Lines objects keyed by
+    RESULTS_HEADER, or a report with one results table per plan.
+
+    Attributes:
+    -----------
+    format : str
+        The output format, a RENDERERS key.
+
+    Methods:
+    --------
+    write(key, user_data)
+        Renders and writes one plan's results.
+    write_rendered(text)
+        Writes results rendered elsewhere.
+    close()
+        Finishes the output.
+    """
+
+    def __init__(self, stream, fmt="csv"):
+        """
+        Initializes the writer, writing the CSV header row if needed.
+
+        Parameters:
+        -----------
+        stream : file
+            The text stream results are written to.
+        fmt : str
+            'csv', 'jsonl' or 'report'.
+        """
+        self._stream = stream
+        self.format = fmt
+        self._render = RENDERERS[fmt]
+        if fmt == "csv":
+            csv.writer(stream).writerow(RESULTS_HEADER)
+
+    def write(self, key, user_data):
+        """
+        Renders and writes one plan's results.
+
+        Parameters:
+        -----------
+        key : str
+            The plan's idempotency key. Text output doesn't use it.
+        user_data : UserData
+            The plan's email and result rows.
+        """
+        self._stream.write(self._render(user_data))
+
+    def write_rendered(self, text):
+        """
+        Writes results already rendered in this writer's format, for
+        example by a worker process.
+
+        Parameters:
+        -----------
+        text : str
+            The rendered results.
+        """
+        self._stream.write(text)
+
+    def close(self):
+        """
+        Finishes the output. The stream is left open for the caller to
+        close.
+        """
+
+
+class StorageResultWriter:
+    """
+    Writes results to a StorageBackend, STORAGE_CHUNK plans per
+    append_batch() call. Each plan's key is derived from its content,
+    so rerunning a batch doesn't store its plans twice on backends that
+    check keys.
+
+    Attributes:
+    -----------
+    format : None
+        Storage takes results unrendered.
+
+    Methods:
+    --------
+    write(key, user_data)
+        Queues one plan's results, storing a chunk when it is full.
+    close()
+        Stores the plans still queued.
+    """
+
+    format = None
+
+    def __init__(self, storage):
+        """
+        Initializes the writer.
+
+        Parameters:
+        -----------
+        storage : StorageBackend
+            Where the results are stored.
+        """
+        self._storage = storage
+        self._pending = []
+
+    def write(self, key, user_data):
+        """
+        Queues one plan's results, storing the queued plans once there
+        are STORAGE_CHUNK of them.
+
+        Parameters:
+        -----------
+        key : str
+            The plan's idempotency key.
+        user_data : UserData
+            The plan's email and result rows.
+        """
+        self._pending.append((key, user_data))
+        if len(self._pending) >= STORAGE_CHUNK:
+            self._flush()
+
+    def _flush(self):
+        """
+        Store the queued plans with one append_batch() call. Every key
+        is rechecked, since an earlier run may have stored any of them.
+        """
+        if self._pending:
+            self._storage.append_batch(
+                self._pending, recheck=[key for key, _ in self._pending]
+            )
+            self._pending = []
+
+    def close(self):
+        """
+        Stores the plans still queued.
+        """
+        self._flush()
+
+
+class BatchRunner:
+    """
+    Computes schedules for a stream of plans without the interactive
+    menu. Plans are read, scheduled and written one at a time, so
+    memory use doesn't grow with the size of the input.
+
+    Attributes:
+    -----------
+    catalog : PlantCatalog
+        The plant catalog.
+
+    Methods:
+    --------
+    schedule(record)
+        Validates one plan record and returns its key and results.
+    run(plans, writer)
+        Schedules every plan and writes the results.
+    """
+
+    def __init__(self, catalog, errors=sys.stderr):
+        """
+        Initializes the runner.
+
+        Parameters:
+        -----------
+        catalog : PlantCatalog
+            The plant catalog.
+        errors : file
+            Where invalid records are reported.
+        """
+        self.catalog = catalog
+        self.errors = errors
+
+    def schedule(self, record):
+        """
+        Validates one plan record and computes its schedule.
+
+        Parameters:
+        -----------
+        record : dict
+            A record from read_plans().
+
+        Returns:
+        --------
+        tuple
+            The plan's idempotency key and a UserData with its rows.
+
+        Raises:
+        -------
+        ValueError
+            If the record is invalid or names an unknown plant.
+        """
+        email, plant_ids, action, date = parse_plan(record)
+        unknown = [i for i in plant_ids if i not in self.catalog]
+        if unknown:
+            raise ValueError(f"unknown plant ids {', '.join(unknown)}")
+        plants = [self.catalog.get(i) for i in plant_ids]
+        return (
+            plan_key(email, plant_ids, action, date),
+            UserData(email, schedule_rows(plants, action, date))
+        )
+
+    def run(self, plans, writer):
+        """
+        Schedules every plan and writes the results. Invalid records
+        are reported and skipped.
+
+        Parameters:
+        -----------
+        plans : iterable
+            (line number, record) pairs from read_plans().
+        writer : TextResultWriter or StorageResultWriter
+            Where the results go.
+
+        Returns:
+        --------
+        BatchStats
+            The counters for the run.
+        """
+        stats = BatchStats()
+        started = time.perf_counter()
+        for line_number, record in plans:
+            stats.records += 1
+            try:
+                key, user_data = self.schedule(record)
+            except ValueError as error:
+                stats.errors += 1
+                print(f" Line {line_number}: {error}", file=self.errors)
+                continue
+            writer.write(key, user_data)
+            stats.rows += len(user_data.get_data())
+        writer.close()
+        stats.elapsed = time.perf_counter() - started
+        return stats
+
+
+# The BatchRunner of a ParallelBatchRunner worker process, built once
+# per process by _init_worker().
+_worker_runner = None
+
+
+def _init_worker(catalog_rows):
+    """
+    Build the worker's catalog from the catalog rows, which are sent
+    once per process instead of with every chunk.
+    """
+    from classes.plant_catalog import PlantCatalog
+
+    global _worker_runner
+    _worker_runner = BatchRunner(PlantCatalog(catalog_rows))
+
+
+def _run_chunk(chunk, fmt):
+    """
+    Schedule one chunk of plans in a worker process.
+
+    Returns the invalid records, the number of result rows and either
+    the chunk's rendered text (when fmt is given) or its (key, email,
+    rows) entries.
+    """
+    errors, rows, entries = [], 0, []
+    for line_number, record in chunk:
+        try:
+            key, user_data = _worker_runner.schedule(record)
+        except ValueError as error:
+            errors.append((line_number, str(error)))
+            continue
+        rows += len(user_data.get_data())
+        entries.append((key, user_data.email, user_data.get_data()))
+
+    if fmt is None:
+        return errors, rows, entries
+    render = RENDERERS[fmt]
+    return errors, rows, "".join(
+        render(UserData(email, data)) for _, email, data in entries
+    )
+
+
+class ParallelBatchRunner:
+    """
+    Runs a batch across a pool of worker processes.
+
+    The input is split into chunks that are scheduled (and, for text
+    output, rendered) by the workers, while the parent process only
+    reads plans and writes results. Results are written in input order,
+    and at most INFLIGHT_PER_WORKER chunks per worker are in flight, so
+    memory use stays bounded however large the input is.
+
+    Attributes:
+    -----------
+    catalog : PlantCatalog
+        The plant catalog.
+    workers : int
+        The number of worker processes.
+    chunk_size : int
+        The number of plans sent to a worker at a time.
+
+    Methods:
+    --------
+    run(plans, writer)
+        Schedules every plan and writes the results.
+    """
+
+    def __init__(self, catalog, workers=None, chunk_size=PARALLEL_CHUNK,
+                 errors=sys.stderr):
+        """
+        Initializes the runner.
+
+        Parameters:
+        -----------
+        catalog : PlantCatalog
+            The plant catalog.
+        workers : int, optional
+            The number of worker processes. Defaults to the number of
+            CPUs.
+        chunk_size : int
+            The number of plans sent to a worker at a time.
+        errors : file
+            Where invalid records are reported.
+        """
+        self.catalog = catalog
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.errors = errors
+
+    def run(self, plans, writer):
+        """
+        Schedules every plan and writes the results. Invalid records
+        are reported and skipped.
+
+        Parameters:
+        -----------
+        plans : iterable
+            (line number, record) pairs from read_plans().
+        writer : TextResultWriter or StorageResultWriter
+            Where the results go.
+
+        Returns:
+        --------
+        BatchStats
+            The counters for the run.
+        """
+        # Imported here, as multiprocessing slows down starting the
+        # interactive app, which imports this module too.
+        from concurrent.futures import ProcessPoolExecutor
+
+        stats = BatchStats()
+        started = time.perf_counter()
+        plans = iter(plans)
+        inflight = deque()
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.catalog.rows,)
+        ) as pool:
+            max_inflight = self.workers * INFLIGHT_PER_WORKER
+            chunks = iter(
+                lambda: list(itertools.islice(plans, self.chunk_size)), []
+            )
+            for chunk in chunks:
+                stats.records += len(chunk)
+                inflight.append(
+                    pool.submit(_run_chunk, chunk, writer.format)
+                )
+                if len(inflight) >= max_inflight:
+                    self._write(inflight.popleft().result(), writer, stats)
+            while inflight:
+                self._write(inflight.popleft().result(), writer, stats)
+
+        writer.close()
+        stats.elapsed = time.perf_counter() - started
+        return stats
+
+    def _write(self, result, writer, stats):
+        """
+        Write one chunk's results and report its invalid records.
+        """
+        errors, rows, payload = result
+        for line_number, error in errors:
+            print(f" Line {line_number}: {error}", file=self.errors)
+        stats.errors += len(errors)
+        stats.rows += rows
+        if writer.format is None:
+            for key, email, data in payload:
+                writer.write(key, UserData(email, data))
+        else:
+            writer.write_rendered(payload)
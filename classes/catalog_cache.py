@@ -0,0 +1,236 @@
+import json
+import os
+import time
+
+from classes.metrics import timed
+from classes.storage import PLANT_HEADER, local_path
+
+CACHE_ENV = "CROP_CALENDAR_CACHE"
+CACHE_TTL_ENV = "CROP_CALENDAR_CACHE_TTL"
+DEFAULT_CACHE = ".plant_catalog.json"
+DEFAULT_TTL = 300
+LOCK_TIMEOUT = 60
+CACHE_KEYS = {"source", "version", "checked_at", "rows"}
+
+
+class CatalogCache:
+    """
+    A plant catalog cache on local disk, shared by every session process.
+
+    Within the TTL the cached catalog is used without any network call.
+    After that the storage is asked for its catalog version, and the
+    catalog is only downloaded again if the version has changed. If the
+    storage keeps row versions, only the rows whose version changed are
+    downloaded and patched into the cached copy. If the storage cannot
+    be reached, the stale copy is used.
+
+    Attributes:
+    -----------
+    path : str
+        The cache file.
+    ttl : float
+        Seconds a cached catalog is used before its version is checked.
+
+    Methods:
+    --------
+    load(storage)
+        Returns the plant catalog, refreshing the cache if needed.
+    from_env()
+        Creates a cache configured by environment variables.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE, ttl=DEFAULT_TTL):
+        """
+        Initializes the cache.
+
+        Parameters:
+        -----------
+        path : str
+            The cache file.
+        ttl : float
+            Seconds a cached catalog is used before its version is
+            checked again.
+        """
+        self.path = path
+        self.ttl = ttl
+        self._locked = False
+        self._parsed = (None, None)
+
+    @classmethod
+    def from_env(cls):
+        """
+        Creates a cache configured by CROP_CALENDAR_CACHE and
+        CROP_CALENDAR_CACHE_TTL.
+
+        Returns:
+        --------
+        CatalogCache
+            The configured cache.
+        """
+        return cls(
+            local_path(CACHE_ENV, DEFAULT_CACHE),
+            float(os.environ.get(CACHE_TTL_ENV, DEFAULT_TTL))
+        )
+
+    @timed("catalog.load")
+    def load(self, storage):
+        """
+        Returns the plant catalog from the cache, refreshing it from
+        storage when the TTL has run out and the catalog has changed.
+
+        Parameters:
+        -----------
+        storage : StorageBackend
+            The storage to refresh from.
+
+        Returns:
+        --------
+        list
+            The plant rows, header row first.
+        """
+        cached = self._read()
+        if cached and cached.get("source") != storage.name:
+            cached = None
+
+        if cached and time.time() - cached["checked_at"] < self.ttl:
+            return cached["rows"]
+
+        if cached and not self._acquire_lock():
+            # Another session is refreshing the cache right now.
+            return cached["rows"]
+
+        try:
+            return self._refresh(storage, cached)
+        except Exception:
+            if cached:
+                return cached["rows"]
+            raise
+        finally:
+            self._release_lock()
+
+    def _refresh(self, storage, cached):
+        """
+        Check the catalog version and download the catalog only if it
+        differs from the cached one.
+        """
+        version = storage.catalog_version()
+        if cached and version is not None and version == cached["version"]:
+            rows = cached["rows"]
+            row_versions = cached.get("row_versions")
+        else:
+            rows, row_versions = self._sync(storage, cached)
+        self._write({
+            "source": storage.name,
+            "version": version,
+            "checked_at": time.time(),
+            "rows": rows,
+            "row_versions": row_versions
+        })
+        return rows
+
+    def _sync(self, storage, cached):
+        """
+        Download the rows whose row version changed, or every row if
+        the storage keeps no row versions or plants were added, removed
+        or reordered since the cache was written.
+        """
+        row_versions = storage.plant_row_versions()
+        if row_versions is None:
+            return self._normalize(storage.load_plants()), None
+
+        row_versions = [list(pair) for pair in row_versions]
+        old_versions = cached.get("row_versions") if cached else None
+        if (not old_versions
+                or [pair[0] for pair in row_versions]
+                != [pair[0] for pair in old_versions]):
+            return self._normalize(storage.load_plants()), row_versions
+
+        changed = [
+            position for position, (new, old)
+            in enumerate(zip(row_versions, old_versions)) if new != old
+        ]
+        # A new list, so catalogs built from the old rows keep them.
+        rows = list(cached["rows"])
+        for position, row in zip(changed, storage.load_plant_rows(changed)):
+            rows[position + 1] = row
+        return self._normalize(rows), row_versions
+
+    @staticmethod
+    def _normalize(rows):
+        """
+        Cut the rows to the catalog columns, dropping the Row Version
+        column, so full and partial downloads give identical rows.
+        """
+        return [row[:len(PLANT_HEADER)] for row in rows]
+
+    def _read(self):
+        """
+        Read the cache file, returning None if it is missing or broken.
+        The file is only parsed again when it has been replaced, so
+        rereading an unchanged cache costs one stat and returns the
+        same rows.
+        """
+        try:
+            with open(self.path) as cache_file:
+                key = self._file_key(cache_file)
+                if key == self._parsed[0]:
+                    return self._parsed[1]
+                cached = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(cached, dict) or not CACHE_KEYS <= cached.keys():
+            return None
+        self._parsed = (key, cached)
+        return cached
+
+    def _write(self, cached):
+        """
+        Replace the cache file atomically so other sessions never read
+        a partly written catalog.
+        """
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as cache_file:
+            json.dump(cached, cache_file)
+            cache_file.flush()
+            # The rename keeps the file's identity, so the next _read
+            # knows it need not parse what was just written.
+            self._parsed = (self._file_key(cache_file), cached)
+        os.replace(temp_path, self.path)
+
+    @staticmethod
+    def _file_key(cache_file):
+        """
+        Identify a version of the cache file without reading it.
+        """
+        stat = os.fstat(cache_file.fileno())
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _acquire_lock(self):
+        """
+        Take the refresh lock so only one session refreshes at a time.
+        A lock older than LOCK_TIMEOUT is assumed to be left behind by
+        a crashed session and is taken over.
+        """
+        lock_path = f"{self.path}.lock"
+        try:
+            if time.time() - os.path.getmtime(lock_path) > LOCK_TIMEOUT:
+                os.remove(lock_path)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL))
+            self._locked = True
+        except FileExistsError:
+            self._locked = False
+        return self._locked
+
+    def _release_lock(self):
+        """
+        Release the refresh lock if this cache holds it.
+        """
+        if self._locked:
+            self._locked = False
+            try:
+                os.remove(f"{self.path}.lock")
+            except OSError:
+                pass
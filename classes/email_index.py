@@ -0,0 +1,162 @@
+import json
+import os
+from bisect import bisect_left
+
+
+class EmailIndex:
+    """
+    An index from email address to the sheet row ranges holding
+    that user's results.
+
+    Attributes:
+    -----------
+    ranges_by_email : dict
+        Maps each email to a sorted list of [first_row, last_row] ranges
+        (1-based, inclusive, as used in A1 notation).
+    indexed_rows : int
+        The last sheet row that has been scanned into the index.
+    generation : str
+        The sheet generation the index was built for. Compacting the
+        sheet moves rows and starts a new generation.
+
+    Methods:
+    --------
+    add(email, first_row, last_row)
+        Records that an email owns a range of rows.
+    add_rows(emails, first_row)
+        Indexes a run of consecutive rows from the Email column.
+    ranges(email)
+        Returns the row ranges for an email.
+    load(path)
+        Reads an index saved with save().
+    save(path)
+        Writes the index to a JSON file.
+    """
+
+    def __init__(self, ranges_by_email=None, indexed_rows=0, generation=''):
+        """
+        Initializes the index, empty unless saved data is given.
+
+        Parameters:
+        -----------
+        ranges_by_email : dict, optional
+            Previously built email to row range mapping.
+        indexed_rows : int, optional
+            The last sheet row covered by ranges_by_email.
+        generation : str, optional
+            The sheet generation ranges_by_email was built for.
+        """
+        self.ranges_by_email = ranges_by_email or {}
+        self.indexed_rows = indexed_rows
+        self.generation = generation
+
+    def add(self, email, first_row, last_row):
+        """
+        Records that an email owns rows first_row to last_row,
+        merging the range with any range it overlaps or touches.
+
+        Parameters:
+        -----------
+        email : str
+            The user's email address.
+        first_row : int
+            The first row of the range.
+        last_row : int
+            The last row of the range.
+        """
+        ranges = self.ranges_by_email.setdefault(email, [])
+        position = bisect_left(ranges, [first_row, last_row])
+
+        if position > 0 and ranges[position - 1][1] >= first_row - 1:
+            position -= 1
+            first_row = ranges[position][0]
+            last_row = max(last_row, ranges[position][1])
+            del ranges[position]
+
+        while (position < len(ranges)
+               and ranges[position][0] <= last_row + 1):
+            last_row = max(last_row, ranges[position][1])
+            del ranges[position]
+
+        ranges.insert(position, [first_row, last_row])
+
+    def add_rows(self, emails, first_row):
+        """
+        Indexes a run of consecutive rows read from the Email column.
+
+        Parameters:
+        -----------
+        emails : list
+            The email of each row, in sheet order. Blank rows are
+            skipped.
+        first_row : int
+            The sheet row of the first email.
+        """
+        for offset, email in enumerate(emails):
+            if email:
+                row = first_row + offset
+                self.add(email, row, row)
+        self.indexed_rows = max(
+            self.indexed_rows, first_row + len(emails) - 1
+        )
+
+    def ranges(self, email):
+        """
+        Returns the row ranges holding an email's results.
+
+        Parameters:
+        -----------
+        email : str
+            The user's email address.
+
+        Returns:
+        --------
+        list
+            A list of (first_row, last_row) tuples.
+        """
+        return [tuple(r) for r in self.ranges_by_email.get(email, [])]
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads an index saved with save().
+
+        Parameters:
+        -----------
+        path : str
+            The index file.
+
+        Returns:
+        --------
+        EmailIndex
+            The saved index, or an empty one if the file is missing
+            or unreadable.
+        """
+        try:
+            with open(path) as index_file:
+                saved = json.load(index_file)
+            return cls(
+                saved["ranges"], saved["indexed_rows"],
+                saved.get("generation", '')
+            )
+        except (OSError, ValueError, KeyError):
+            return cls()
+
+    def save(self, path):
+        """
+        Writes the index to a JSON file. The file is replaced
+        atomically so concurrent sessions never read a partial index.
+
+        Parameters:
+        -----------
+        path : str
+            The index file.
+        """
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as index_file:
+            json.dump({
+                "ranges": self.ranges_by_email,
+                "indexed_rows": self.indexed_rows,
+                "generation": self.generation
+            }, index_file)
+        os.replace(temp_path, path)
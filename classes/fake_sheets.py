@@ -0,0 +1,568 @@
+import fcntl
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+from classes.storage import PLANT_HEADER
+
+FAKE_SHEETS_ENV = "CROP_CALENDAR_FAKE_SHEETS"
+FAKE_LATENCY_ENV = "CROP_CALENDAR_FAKE_LATENCY"
+FAKE_ERROR_RATE_ENV = "CROP_CALENDAR_FAKE_ERROR_RATE"
+FAKE_QUOTA_ENV = "CROP_CALENDAR_FAKE_QUOTA"
+DEFAULT_WORKSHEETS = ("plant_list", "user_results")
+QUOTA_WINDOW = 60.0
+RANGE = re.compile(r"^([A-Z]+)(\d+)(?::([A-Z]+)(\d*))?$")
+CATEGORIES = (
+    "Legume", "Root Vegetable", "Fruit Vegetable", "Leafy Green", "Bulb",
+    "Herb"
+)
+SYLLABLES = ("to", "ma", "car", "rot", "bean", "pea", "let", "tuce", "on",
+             "ion", "gar", "lic", "ba", "sil", "kale", "chard")
+
+# Holds the fake backend's local files when the fake spreadsheet is only
+# in memory, see fake_local_path().
+_local_directory = None
+_local_directory_lock = threading.Lock()
+
+
+def column_number(letters):
+    """
+    Convert a column name such as 'A' or 'AB' to its 1-based number.
+
+    Parameters:
+    -----------
+    letters : str
+        The column name.
+
+    Returns:
+    --------
+    int
+        The column number.
+    """
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+def fake_local_path(default):
+    """
+    Return where the fake backend keeps a local file, such as the email
+    index, that real runs keep at default. With CROP_CALENDAR_FAKE_SHEETS
+    set it is named after that file, e.g. 'fake.json.email_index.json'.
+    Otherwise it is in a temporary directory removed at exit, as the
+    fake spreadsheet itself is.
+
+    Parameters:
+    -----------
+    default : str
+        The file real runs use.
+
+    Returns:
+    --------
+    str
+        The fake backend's file.
+    """
+    global _local_directory
+    name = os.path.basename(default)
+    path = os.environ.get(FAKE_SHEETS_ENV)
+    if path:
+        return f"{path}.{name.lstrip('.')}"
+    with _local_directory_lock:
+        if _local_directory is None:
+            _local_directory = tempfile.TemporaryDirectory(
+                prefix="crop_calendar_fake_"
+            )
+    return os.path.join(_local_directory.name, name)
+
+
+def quota_error(code=429):
+    """
+    Build the gspread APIError the Sheets API raises when a request is
+    over quota.
+
+    Parameters:
+    -----------
+    code : int
+        The HTTP status code.
+
+    Returns:
+    --------
+    gspread.exceptions.APIError
+        The error.
+    """
+    import requests
+    from gspread.exceptions import APIError
+
+    response = requests.Response()
+    response.status_code = code
+    response._content = json.dumps({"error": {
+        "code": code,
+        "message": "Quota exceeded (simulated by FakeSpreadsheet)",
+        "status": "RESOURCE_EXHAUSTED"
+    }}).encode()
+    return APIError(response)
+
+
+def synthetic_plant_rows(count, seed=0):
+    """
+    Build plant_list rows for a synthetic catalog.
+
+    Parameters:
+    -----------
+    count : int
+        The number of plants.
+    seed : int
+        The random seed, so the same catalog is built every time.
+
+    Returns:
+    --------
+    list
+        The rows, header row first.
+    """
+    rng = random.Random(seed)
+    rows = [list(PLANT_HEADER)]
+    for plant_id in range(1, count + 1):
+        name = "".join(rng.choice(SYLLABLES) for _ in range(3)).title()
+        rows.append([
+            str(plant_id), f"{name} {plant_id}", rng.choice(CATEGORIES),
+            str(rng.randint(3, 20)), str(rng.randint(10, 30)),
+            str(rng.randint(20, 60)), str(rng.randint(10, 40)),
+            str(rng.randint(0, 50)) if rng.random() < 0.6 else "",
+            f"A {name.lower()} that grows well in "
+            f"{rng.choice(('sun', 'shade', 'pots', 'beds'))}."
+        ])
+    return rows
+
+
+class FakeWorksheet:
+    """
+    An in-memory stand-in for a gspread Worksheet, implementing the
+    calls the application makes. Every call goes through the parent
+    FakeSpreadsheet, which adds latency and errors if configured.
+
+    Attributes:
+    -----------
+    title : str
+        The worksheet title.
+    rows : list
+        The cell values, one list of strings per row.
+    """
+
+    def __init__(self, spreadsheet, title, rows=None):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.rows = [[str(value) for value in row] for row in rows or []]
+
+    def get_all_values(self):
+        with self.spreadsheet.request(read=True):
+            return [list(row) for row in self.rows]
+
+    def get_all_records(self, head=1):
+        from gspread.utils import numericise_all
+
+        with self.spreadsheet.request(read=True):
+            if len(self.rows) < head:
+                return []
+            keys = self.rows[head - 1]
+            return [
+                dict(zip(keys, numericise_all(
+                    row + [''] * (len(keys) - len(row))
+                )))
+                for row in self.rows[head:]
+            ]
+
+    def row_values(self, row):
+        with self.spreadsheet.request(read=True):
+            return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def col_values(self, col):
+        with self.spreadsheet.request(read=True):
+            return [row[col - 1] if len(row) >= col else ''
+                    for row in self.rows]
+
+    def get(self, cell_range):
+        with self.spreadsheet.request(read=True):
+            return self._values(cell_range)
+
+    def batch_get(self, ranges):
+        with self.spreadsheet.request(read=True):
+            return [self._values(cell_range) for cell_range in ranges]
+
+    def append_row(self, values, **kwargs):
+        return self.append_rows([values], **kwargs)
+
+    def append_rows(self, values, **kwargs):
+        with self.spreadsheet.request(read=False):
+            first_row = len(self.rows) + 1
+            self.rows.extend(
+                [str(value) for value in row] for row in values
+            )
+            width = max((len(row) for row in values), default=1)
+            return {"updates": {
+                "updatedRange": (
+                    f"{self.title}!A{first_row}:"
+                    f"{self._column_name(width)}{len(self.rows)}"
+                ),
+                "updatedRows": len(values)
+            }}
+
+    def update(self, cell_range, values, **kwargs):
+        with self.spreadsheet.request(read=False):
+            self._write(cell_range, values)
+            return {"updatedRows": len(values)}
+
+    def batch_update(self, data, **kwargs):
+        with self.spreadsheet.request(read=False):
+            for value_range in data:
+                self._write(value_range["range"], value_range["values"])
+            return {"totalUpdatedRows": sum(
+                len(value_range["values"]) for value_range in data
+            )}
+
+    def _write(self, cell_range, values):
+        first_row, first_column, _, _ = self._bounds(cell_range)
+        for offset, row in enumerate(values):
+            index = first_row - 1 + offset
+            while len(self.rows) <= index:
+                self.rows.append([])
+            target = self.rows[index]
+            end = first_column - 1 + len(row)
+            target.extend([''] * (end - len(target)))
+            target[first_column - 1:end] = [str(value) for value in row]
+
+    def delete_rows(self, start_index, end_index=None):
+        with self.spreadsheet.request(read=False):
+            del self.rows[start_index - 1:(end_index or start_index)]
+
+    def clear(self):
+        with self.spreadsheet.request(read=False):
+            self.rows = []
+
+    @property
+    def row_count(self):
+        return len(self.rows)
+
+    def _bounds(self, cell_range):
+        """
+        Parse an A1 range such as 'A2:E9' or 'A5:A' into first row,
+        first column, last row and last column. An open-ended range
+        runs to the last row.
+        """
+        match = RANGE.match(cell_range.split("!")[-1])
+        if not match:
+            raise ValueError(f"Unsupported range '{cell_range}'")
+        first_column = column_number(match.group(1))
+        first_row = int(match.group(2))
+        if match.group(3) is None:
+            return first_row, first_column, first_row, first_column
+        last_row = int(match.group(4)) if match.group(4) else len(self.rows)
+        return first_row, first_column, last_row, column_number(
+            match.group(3)
+        )
+
+    def _values(self, cell_range):
+        first_row, first_column, last_row, last_column = self._bounds(
+            cell_range
+        )
+        values = [
+            row[first_column - 1:last_column]
+            for row in self.rows[first_row - 1:last_row]
+        ]
+        # Like the API, drop trailing empty rows.
+        while values and not any(values[-1]):
+            values.pop()
+        return values
+
+    @staticmethod
+    def _column_name(number):
+        name = ""
+        while number:
+            number, remainder = divmod(number - 1, 26)
+            name = chr(ord('A') + remainder) + name
+        return name
+
+
+class _FakeSession:
+    """
+    Stands in for the HTTP session SheetsStorage closes in forked pool
+    workers.
+    """
+
+    def close(self):
+        pass
+
+
+class _FakeClient:
+    def __init__(self):
+        self.session = _FakeSession()
+
+
+class FakeSpreadsheet:
+    """
+    An offline stand-in for the crop_calendar spreadsheet, for tests,
+    benchmarks and load runs that must not use the real API or quota.
+
+    The worksheets live in memory and, if a path is given, in a JSON
+    file that is shared between processes. Each API call can be given
+    a latency, a random chance of failing with a quota error, and a
+    per-minute request quota like the real Sheets API.
+
+    Attributes:
+    -----------
+    path : str or None
+        The JSON file the worksheets are kept in, or None.
+    latency : float
+        Seconds added to every request.
+    error_rate : float
+        The chance of a request failing with a 429 quota error.
+    quota : int or None
+        Requests allowed per minute, or None for no limit.
+    requests : int
+        The number of requests made.
+
+    Methods:
+    --------
+    from_env()
+        Creates a FakeSpreadsheet configured by environment variables.
+    worksheets()
+        Returns every worksheet.
+    worksheet(title)
+        Returns a worksheet by title.
+    add_worksheet(title, rows, cols)
+        Adds an empty worksheet.
+    get_lastUpdateTime()
+        Returns a value that changes on every write.
+    request(read)
+        Context manager wrapped around every API call.
+    """
+
+    def __init__(self, worksheets=None, path=None, latency=0.0,
+                 error_rate=0.0, quota=None, seed=None):
+        """
+        Initializes the spreadsheet.
+
+        Parameters:
+        -----------
+        worksheets : dict, optional
+            Rows by worksheet title. Defaults to the file at path, or
+            empty 'plant_list' and 'user_results' worksheets.
+        path : str, optional
+            A JSON file to load the worksheets from and save them to.
+        latency : float
+            Seconds added to every request.
+        error_rate : float
+            The chance, from 0 to 1, of a request failing with a 429.
+        quota : int, optional
+            Requests allowed per minute before requests fail with 429.
+        seed : int, optional
+            Seed for the error injection, for repeatable runs.
+        """
+        self.path = path
+        self.latency = latency
+        self.error_rate = error_rate
+        self.quota = quota
+        self.requests = 0
+        self.client = _FakeClient()
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._window = []
+        self._loaded_mtime = None
+        self._updated = 0
+        self._worksheets = {}
+
+        if worksheets is None and path and os.path.exists(path):
+            self._load()
+        else:
+            if worksheets is None:
+                worksheets = {title: [] for title in DEFAULT_WORKSHEETS}
+            self._worksheets = {
+                title: FakeWorksheet(self, title, rows)
+                for title, rows in worksheets.items()
+            }
+
+    @classmethod
+    def from_env(cls):
+        """
+        Creates a FakeSpreadsheet configured by environment variables:
+        CROP_CALENDAR_FAKE_SHEETS (a JSON file, in memory if unset),
+        CROP_CALENDAR_FAKE_LATENCY (milliseconds per request),
+        CROP_CALENDAR_FAKE_ERROR_RATE (0 to 1) and
+        CROP_CALENDAR_FAKE_QUOTA (requests per minute).
+
+        Returns:
+        --------
+        FakeSpreadsheet
+            The configured spreadsheet.
+        """
+        quota = os.environ.get(FAKE_QUOTA_ENV)
+        return cls(
+            path=os.environ.get(FAKE_SHEETS_ENV),
+            latency=float(os.environ.get(FAKE_LATENCY_ENV, 0)) / 1000,
+            error_rate=float(os.environ.get(FAKE_ERROR_RATE_ENV, 0)),
+            quota=int(quota) if quota else None
+        )
+
+    def worksheets(self):
+        with self.request(read=True):
+            return list(self._worksheets.values())
+
+    def worksheet(self, title):
+        with self.request(read=True):
+            try:
+                return self._worksheets[title]
+            except KeyError:
+                from gspread.exceptions import WorksheetNotFound
+                raise WorksheetNotFound(title) from None
+
+    def add_worksheet(self, title, rows=0, cols=0):
+        with self.request(read=False):
+            worksheet = self._worksheets[title] = FakeWorksheet(self, title)
+            return worksheet
+
+    def get_lastUpdateTime(self):
+        with self.request(read=True):
+            return f"{self._updated}"
+
+    def request(self, read):
+        """
+        Context manager wrapped around every API call. It applies the
+        latency, quota and error injection, reloads the worksheets if
+        another process saved them, and saves them after a write.
+
+        Parameters:
+        -----------
+        read : bool
+            False if the call changes the spreadsheet.
+        """
+        return _Request(self, read)
+
+    def _throttle(self):
+        """
+        Apply the configured latency and raise quota errors.
+        """
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.quota is not None:
+            now = time.monotonic()
+            self._window = [
+                started for started in self._window
+                if now - started < QUOTA_WINDOW
+            ]
+            if len(self._window) >= self.quota:
+                raise quota_error()
+            self._window.append(now)
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise quota_error()
+
+    def _load(self):
+        """
+        Read the worksheets from the JSON file.
+        """
+        with open(self.path) as sheets_file:
+            fcntl.flock(sheets_file, fcntl.LOCK_SH)
+            data = json.load(sheets_file)
+            self._loaded_mtime = os.fstat(sheets_file.fileno()).st_mtime_ns
+        self._updated = data.get("updated", 0)
+        # Update handles in place, as callers cache them.
+        worksheets = self._worksheets
+        for title, rows in data["worksheets"].items():
+            if title in worksheets:
+                worksheets[title].rows = rows
+            else:
+                worksheets[title] = FakeWorksheet(self, title, rows)
+        self._worksheets = worksheets
+
+    def _refresh(self):
+        """
+        Reload the worksheets if the file changed since it was read.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return
+        if os.stat(self.path).st_mtime_ns != self._loaded_mtime:
+            self._load()
+
+    def _save(self):
+        """
+        Write the worksheets to the JSON file atomically.
+        """
+        self._updated += 1
+        if not self.path:
+            return
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as sheets_file:
+            json.dump({
+                "updated": self._updated,
+                "worksheets": {
+                    title: worksheet.rows
+                    for title, worksheet in self._worksheets.items()
+                }
+            }, sheets_file)
+        os.replace(temporary, self.path)
+        self._loaded_mtime = os.stat(self.path).st_mtime_ns
+
+    def _file_lock(self):
+        """
+        Open the lock file that serializes writes between processes.
+        """
+        if not self.path:
+            return None
+        lock = open(f"{self.path}.lock", "w")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+
+class _Request:
+    """
+    The context manager returned by FakeSpreadsheet.request().
+    """
+
+    def __init__(self, spreadsheet, read):
+        self.spreadsheet = spreadsheet
+        self.read = read
+        self._file_lock = None
+
+    def __enter__(self):
+        spreadsheet = self.spreadsheet
+        spreadsheet._lock.acquire()
+        try:
+            spreadsheet._throttle()
+            if not self.read:
+                self._file_lock = spreadsheet._file_lock()
+            spreadsheet._refresh()
+        except BaseException:
+            self._release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            if not self.read and exc_type is None:
+                self.spreadsheet._save()
+        finally:
+            self._release()
+
+    def _release(self):
+        if self._file_lock is not None:
+            self._file_lock.close()
+            self._file_lock = None
+        self.spreadsheet._lock.release()
+
+
+if __name__ == "__main__":
+    # Create a fake spreadsheet file with a synthetic catalog:
+    #     python3 -m classes.fake_sheets fake_sheets.json 500
+    import sys
+
+    path = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    FakeSpreadsheet({
+        "plant_list": synthetic_plant_rows(count),
+        "user_results": []
+    }, path=path)._save()
+    print(f" Fake spreadsheet with {count} plants written to {path}.")
@@ -0,0 +1,354 @@
+import atexit
+import bisect
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import types
+import uuid
+
+METRICS_ENV = "CROP_CALENDAR_METRICS"
+# Upper bounds of the latency histogram buckets in milliseconds. The
+# last bucket holds everything slower.
+BUCKETS_MS = (
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500,
+    5000, 10000
+)
+
+
+class Histogram:
+    """
+    A latency histogram with fixed, roughly logarithmic buckets, so
+    recording a sample costs the same however many there are.
+
+    Attributes:
+    -----------
+    counts : list
+        The number of samples in each of BUCKETS_MS, plus one bucket
+        for slower samples.
+    count : int
+        The number of samples.
+    total_ms : float
+        The sum of the samples.
+    max_ms : float
+        The slowest sample.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, milliseconds):
+        """
+        Records one sample.
+
+        Parameters:
+        -----------
+        milliseconds : float
+            The latency.
+        """
+        self.counts[bisect.bisect_left(BUCKETS_MS, milliseconds)] += 1
+        self.count += 1
+        self.total_ms += milliseconds
+        self.max_ms = max(self.max_ms, milliseconds)
+
+    def percentile(self, fraction):
+        """
+        Returns the upper bound of the bucket holding a percentile.
+
+        Parameters:
+        -----------
+        fraction : float
+            The percentile as a fraction, e.g. 0.99.
+
+        Returns:
+        --------
+        float
+            The latency in milliseconds.
+        """
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return (BUCKETS_MS[bucket] if bucket < len(BUCKETS_MS)
+                        else self.max_ms)
+        return 0.0
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.percentile(0.5),
+            "p99_ms": self.percentile(0.99),
+            "buckets": {
+                str(bound): count
+                for bound, count in zip(BUCKETS_MS + ("inf",), self.counts)
+                if count
+            }
+        }
+
+
+class SessionMetrics:
+    """
+    The timings and counters of one session.
+
+    Attributes:
+    -----------
+    session_id : str
+        A random id for the session.
+    started : float
+        When the session started, as a Unix timestamp.
+    timings : dict
+        A Histogram per operation name.
+    counters : dict
+        A count per counter name, e.g. 'sheets.calls.append_rows',
+        'sheets.quota_errors' or 'sheets.bytes_received'.
+
+    Methods:
+    --------
+    observe(name, seconds)
+        Records an operation's latency.
+    increment(name, amount)
+        Adds to a counter.
+    to_dict()
+        Returns the session's metrics as a JSON-ready dict.
+    """
+
+    def __init__(self):
+        self.session_id = uuid.uuid4().hex
+        self.started = time.time()
+        self.timings = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.timings.get(name)
+            if histogram is None:
+                histogram = self.timings[name] = Histogram()
+            histogram.observe(seconds * 1000)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "session": self.session_id,
+                "pid": os.getpid(),
+                "started": round(self.started, 3),
+                "ended": round(time.time(), 3),
+                "timings": {
+                    name: histogram.to_dict()
+                    for name, histogram in sorted(self.timings.items())
+                },
+                "counters": dict(sorted(self.counters.items()))
+            }
+
+
+# Metrics are switched on by setting CROP_CALENDAR_METRICS to the file
+# sessions are logged to. When it is not set, _session stays None,
+# @timed returns functions unwrapped and every record_* call returns
+# straight away.
+_log_path = os.environ.get(METRICS_ENV)
+_session = SessionMetrics() if _log_path else None
+
+
+def enabled():
+    """
+    Returns True if metrics are being collected.
+    """
+    return _session is not None
+
+
+def timed(name):
+    """
+    Decorator that records a function's latency under name. When
+    metrics are off the function is returned unchanged, so it costs
+    nothing.
+
+    Parameters:
+    -----------
+    name : str
+        The operation name, e.g. 'render.plant_page'.
+    """
+    def decorator(func):
+        if _session is None:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _session.observe(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def _timer(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _session.observe(name, time.perf_counter() - started)
+
+
+def timer(name):
+    """
+    Context manager that records the latency of a block under name.
+
+    Parameters:
+    -----------
+    name : str
+        The operation name.
+    """
+    return contextlib.nullcontext() if _session is None else _timer(name)
+
+
+def record_api_call(name, seconds):
+    """
+    Records one Sheets API call and its latency, including retries.
+    """
+    if _session is not None:
+        _session.increment(f"sheets.calls.{name}")
+        _session.observe(f"sheets.{name}", seconds)
+
+
+def record_quota_error(name):
+    """
+    Records a Sheets request rejected because of quota or server load.
+    """
+    if _session is not None:
+        _session.increment("sheets.quota_errors")
+        _session.increment(f"sheets.quota_errors.{name}")
+
+
+def instrument_http(session):
+    """
+    Counts the bytes sent and received by an HTTP session, e.g. the
+    authorized session gspread makes its requests with.
+
+    Parameters:
+    -----------
+    session : requests.Session
+        The session to instrument.
+    """
+    if _session is None:
+        return
+
+    def count_bytes(response, *args, **kwargs):
+        body = response.request.body or b""
+        _session.increment("sheets.requests")
+        _session.increment("sheets.bytes_sent", len(body))
+        _session.increment("sheets.bytes_received", len(response.content))
+        return response
+
+    session.hooks.setdefault("response", []).append(count_bytes)
+
+
+class InstrumentedStorage:
+    """
+    A proxy that times every method call on a StorageBackend under
+    'storage.<method>' and counts the errors it raises under
+    'storage.errors.<method>'. Methods returning a generator, such as
+    iter_results(), read as they are iterated, so each chunk is timed
+    instead of the call. Other attributes are passed through.
+    """
+
+    def __init__(self, storage):
+        self._storage = storage
+
+    def __getattr__(self, name):
+        value = getattr(self._storage, name)
+        if not callable(value) or name.startswith("_"):
+            return value
+
+        @functools.wraps(value)
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = value(*args, **kwargs)
+            except Exception:
+                _record_storage_error(name)
+                _session.observe(f"storage.{name}",
+                                 time.perf_counter() - started)
+                raise
+            if isinstance(result, types.GeneratorType):
+                return _timed_chunks(name, result)
+            _session.observe(f"storage.{name}", time.perf_counter() - started)
+            return result
+        return call
+
+
+def _timed_chunks(name, chunks):
+    """
+    Yield from a storage method's generator, timing each next() under
+    'storage.<name>' and counting the errors it raises.
+    """
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            except Exception:
+                _record_storage_error(name)
+                raise
+            finally:
+                _session.observe(f"storage.{name}",
+                                 time.perf_counter() - started)
+            yield chunk
+    finally:
+        chunks.close()
+
+
+def _record_storage_error(name):
+    _session.increment("storage.errors")
+    _session.increment(f"storage.errors.{name}")
+
+
+def instrument_storage(storage):
+    """
+    Wraps a StorageBackend in an InstrumentedStorage if metrics are on.
+
+    Parameters:
+    -----------
+    storage : StorageBackend
+        The backend.
+
+    Returns:
+    --------
+    StorageBackend or InstrumentedStorage
+        The backend to use.
+    """
+    return storage if _session is None else InstrumentedStorage(storage)
+
+
+def end_session():
+    """
+    Appends the session's metrics to the metrics log as one JSON line
+    and starts a new session. Sessions with nothing recorded are not
+    logged.
+    """
+    global _session
+    if _session is None:
+        return
+    session, _session = _session, SessionMetrics()
+    if not session.timings and not session.counters:
+        return
+    with open(_log_path, "a") as log:
+        log.write(json.dumps(session.to_dict()) + "\n")
+
+
+atexit.register(end_session)
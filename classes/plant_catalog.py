@@ -0,0 +1,385 @@
+
+import numpy as np
+
+from classes.metrics import timed
+from classes.plant import Plant
+from classes.plant_search import PlantSearchIndex
+
+STAGE_FIELDS = (
+    "germination", "seedling_stage", "vegetative_growth",
+    "flowering_root_development", "fruit_development"
+)
+STAGE_COLUMNS = slice(3, 8)
+
+
+def parse_stage(value):
+    """
+    Parse a stage duration cell, returning None if it is not a number.
+
+    Parameters:
+    -----------
+    value : str or int
+        The cell value.
+
+    Returns:
+    --------
+    int or None
+        The number of days, or None.
+    """
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+
+class PlantView:
+    """
+    A read-only view of one plant in a PlantCatalog.
+
+    Views have the same attributes and methods as Plant, but hold only
+    a reference to the catalog and a position, and read everything from
+    the catalog's columns, so creating one costs no parsing.
+    """
+
+    __slots__ = ("_catalog", "_position")
+
+    def __init__(self, catalog, position):
+        """
+        Initializes the view.
+
+        Parameters:
+        -----------
+        catalog : PlantCatalog
+            The catalog holding the plant.
+        position : int
+            The plant's position in the catalog.
+        """
+        self._catalog = catalog
+        self._position = position
+
+    @property
+    def id(self):
+        return self._catalog.ids[self._position]
+
+    @property
+    def name(self):
+        return self._catalog.names[self._position]
+
+    @property
+    def category(self):
+        return self._catalog.categories[self._position]
+
+    @property
+    def description(self):
+        return self._catalog.descriptions[self._position]
+
+    def stage(self, stage_number):
+        """
+        Returns the duration of a growth stage.
+
+        Parameters:
+        -----------
+        stage_number : int
+            The stage's index in STAGE_FIELDS.
+
+        Returns:
+        --------
+        int or None
+            The number of days, or None if the plant has no such stage.
+        """
+        if not self._catalog.stage_known[self._position, stage_number]:
+            return None
+        return int(self._catalog.stages[self._position, stage_number])
+
+    @property
+    def germination(self):
+        return self.stage(0)
+
+    @property
+    def seedling_stage(self):
+        return self.stage(1)
+
+    @property
+    def vegetative_growth(self):
+        return self.stage(2)
+
+    @property
+    def flowering_root_development(self):
+        return self.stage(3)
+
+    @property
+    def fruit_development(self):
+        return self.stage(4)
+
+    def total_growth_time(self):
+        """
+        Returns the precomputed total growth time of the plant.
+
+        Returns:
+        --------
+        int
+            The total number of days for all growth stages.
+        """
+        return int(self._catalog.total_growth[self._position])
+
+    summary = Plant.summary
+
+    def __repr__(self):
+        return f"<PlantView {self.id}: {self.name}>"
+
+
+class PlantCatalog:
+    """
+    The plant catalog in columnar form, built once when it is loaded.
+
+    Stage durations are kept in a typed integer matrix with a
+    precomputed total growth time column, and plants can be looked up
+    by id or by name in constant time.
+
+    Attributes:
+    -----------
+    rows : list
+        The catalog rows as loaded, header row first.
+    ids : list
+        The id of each plant, in catalog order.
+    names : list
+        The name of each plant.
+    categories : list
+        The category of each plant.
+    descriptions : list
+        The description of each plant.
+    stages : numpy.ndarray
+        An (n, 5) int32 matrix of stage durations, 0 where unknown.
+    stage_known : numpy.ndarray
+        An (n, 5) bool matrix, True where a stage duration is given.
+    total_growth : numpy.ndarray
+        The total growth time of each plant in days.
+    stage_offsets : numpy.ndarray
+        An (n, 6) int32 matrix of the day each stage starts, counted
+        from planting, with the harvest day in the last column.
+    search_index : PlantSearchIndex
+        Name, category and description indexes for searching.
+
+    Methods:
+    --------
+    position(plant_id)
+        Returns a plant's position in the catalog.
+    get(plant_id)
+        Returns a PlantView by id, or None.
+    by_name(name)
+        Returns a PlantView by name, or None.
+    view(position)
+        Returns the PlantView at a position.
+    update(data_list)
+        Patches the catalog to match new plant rows.
+    """
+
+    @timed("catalog.build")
+    def __init__(self, data_list):
+        """
+        Builds the catalog from plant rows.
+
+        Parameters:
+        -----------
+        data_list : list
+            The plant rows, header row first.
+        """
+        self._build(data_list)
+
+    def _build(self, data_list):
+        """
+        Build every column and index from scratch.
+        """
+        self.rows = data_list
+        rows = data_list[1:]
+
+        self.ids = [row[0] for row in rows]
+        self.names = [row[1] for row in rows]
+        self.categories = [row[2] for row in rows]
+        self.descriptions = [
+            row[8] if len(row) > 8 else '' for row in rows
+        ]
+
+        parsed = [
+            [parse_stage(value) for value in row[STAGE_COLUMNS]]
+            + [None] * (len(STAGE_FIELDS) - len(row[STAGE_COLUMNS]))
+            for row in rows
+        ]
+        self.stage_known = np.array(
+            [[value is not None for value in row] for row in parsed],
+            dtype=bool
+        ).reshape(len(rows), len(STAGE_FIELDS))
+        self.stages = np.array(
+            [[value or 0 for value in row] for row in parsed],
+            dtype=np.int32
+        ).reshape(len(rows), len(STAGE_FIELDS))
+        self.total_growth = self.stages.sum(axis=1, dtype=np.int32)
+        # Cumulative stage durations, so the start and end of any stage
+        # are two lookups instead of a sum per plant and date.
+        self.stage_offsets = np.zeros(
+            (len(rows), len(STAGE_FIELDS) + 1), dtype=np.int32
+        )
+        np.cumsum(self.stages, axis=1, out=self.stage_offsets[:, 1:])
+
+        self._by_id = {
+            plant_id: position for position, plant_id in enumerate(self.ids)
+        }
+        self._by_name = {
+            name.lower(): position for position, name in enumerate(self.names)
+        }
+        self.search_index = PlantSearchIndex(self)
+
+    @timed("catalog.update")
+    def update(self, data_list):
+        """
+        Patches the catalog to match new plant rows. Only the plants
+        whose rows changed are re-parsed and re-indexed, and only their
+        growth times are recomputed. If plants were added, removed or
+        reordered the catalog is rebuilt instead.
+
+        Parameters:
+        -----------
+        data_list : list
+            The new plant rows, header row first. They are not changed.
+
+        Returns:
+        --------
+        list or None
+            The positions of the plants that changed, or None if the
+            catalog was rebuilt.
+        """
+        if data_list is self.rows:
+            return []
+        rows = data_list[1:]
+        if (data_list[:1] != self.rows[:1]
+                or [row[0] for row in rows] != self.ids):
+            self._build(data_list)
+            return None
+
+        changed = [
+            position for position, (old, new)
+            in enumerate(zip(self.rows[1:], rows)) if old != new
+        ]
+        for position in changed:
+            self.search_index.remove_plant(position)
+            if self._by_name.get(self.names[position].lower()) == position:
+                del self._by_name[self.names[position].lower()]
+
+            row = rows[position]
+            self.names[position] = row[1]
+            self.categories[position] = row[2]
+            self.descriptions[position] = row[8] if len(row) > 8 else ''
+            stages = [parse_stage(value) for value in row[STAGE_COLUMNS]]
+            stages += [None] * (len(STAGE_FIELDS) - len(stages))
+            self.stage_known[position] = [
+                value is not None for value in stages
+            ]
+            self.stages[position] = [value or 0 for value in stages]
+            self.total_growth[position] = self.stages[position].sum()
+            self.stage_offsets[position, 1:] = np.cumsum(
+                self.stages[position]
+            )
+
+            self._by_name[row[1].lower()] = position
+            self.search_index.add_plant(position)
+
+        self.rows = data_list
+        return changed
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, plant_id):
+        return str(plant_id) in self._by_id
+
+    def __iter__(self):
+        return (self.view(position) for position in range(len(self)))
+
+    def position(self, plant_id):
+        """
+        Returns a plant's position in the catalog.
+
+        Parameters:
+        -----------
+        plant_id : str or int
+            The plant's id.
+
+        Returns:
+        --------
+        int
+            The plant's position.
+
+        Raises:
+        -------
+        KeyError
+            If the id is not in the catalog.
+        """
+        return self._by_id[str(plant_id)]
+
+    def view(self, position):
+        """
+        Returns the PlantView at a position.
+
+        Parameters:
+        -----------
+        position : int
+            The plant's position in the catalog.
+
+        Returns:
+        --------
+        PlantView
+            A view of the plant.
+        """
+        return PlantView(self, position)
+
+    def get(self, plant_id):
+        """
+        Returns a plant by id.
+
+        Parameters:
+        -----------
+        plant_id : str or int
+            The plant's id.
+
+        Returns:
+        --------
+        PlantView or None
+            A view of the plant, or None if the id is unknown.
+        """
+        position = self._by_id.get(str(plant_id))
+        return None if position is None else PlantView(self, position)
+
+    def by_name(self, name):
+        """
+        Returns a plant by name, ignoring case.
+
+        Parameters:
+        -----------
+        name : str
+            The plant's name.
+
+        Returns:
+        --------
+        PlantView or None
+            A view of the plant, or None if the name is unknown.
+        """
+        position = self._by_name.get(name.strip().lower())
+        return None if position is None else PlantView(self, position)
+
+    def subset_rows(self, positions):
+        """
+        Returns the catalog rows at the given positions, header first,
+        in the layout TableCreator expects.
+
+        Parameters:
+        -----------
+        positions : list
+            Catalog positions.
+
+        Returns:
+        --------
+        list
+            The header row followed by the selected rows.
+        """
+        return [self.rows[0]] + [self.rows[position + 1]
+                                 for position in positions]
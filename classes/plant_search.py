@@ -0,0 +1,231 @@
+import re
+
+WORD = re.compile(r"[a-z0-9]+")
+NGRAM_LENGTH = 3
+
+
+def words(text):
+    """
+    Split text into lower case words.
+
+    Parameters:
+    -----------
+    text : str
+        The text to split.
+
+    Returns:
+    --------
+    list
+        The words in the text.
+    """
+    return WORD.findall(text.lower())
+
+
+class PlantSearchIndex:
+    """
+    Inverted indexes over a PlantCatalog, built once when the catalog
+    is loaded, so searches never scan the whole catalog.
+
+    Every search returns catalog positions in catalog order.
+
+    Attributes:
+    -----------
+    catalog : PlantCatalog
+        The indexed catalog.
+
+    Methods:
+    --------
+    add_plant(position), remove_plant(position)
+        Keep the indexes up to date when a plant changes.
+    by_name_prefix(prefix)
+        Plants with a name word starting with prefix.
+    by_name_substring(text)
+        Plants whose name contains text.
+    by_category(category)
+        Plants in a category.
+    by_keywords(text)
+        Plants whose description contains every word of text.
+    categories()
+        The categories in the catalog.
+    """
+
+    def __init__(self, catalog):
+        """
+        Builds the indexes.
+
+        Parameters:
+        -----------
+        catalog : PlantCatalog
+            The catalog to index.
+        """
+        self.catalog = catalog
+        self._prefixes = {}
+        self._ngrams = {}
+        self._categories = {}
+        self._keywords = {}
+
+        for position in range(len(catalog)):
+            self.add_plant(position)
+
+    def _terms(self, position):
+        """
+        Return the index and key of every entry for one plant.
+        """
+        name = self.catalog.names[position].lower()
+        # Longer prefixes are answered from the n-gram index.
+        for word in words(name):
+            for end in range(1, min(len(word), NGRAM_LENGTH - 1) + 1):
+                yield self._prefixes, word[:end]
+        for start in range(len(name) - NGRAM_LENGTH + 1):
+            yield self._ngrams, name[start:start + NGRAM_LENGTH]
+
+        category = self.catalog.categories[position].strip().lower()
+        yield self._categories, category
+
+        for word in set(words(self.catalog.descriptions[position])):
+            yield self._keywords, word
+
+    def add_plant(self, position):
+        """
+        Add one plant to every index.
+
+        Parameters:
+        -----------
+        position : int
+            The plant's catalog position.
+        """
+        for index, key in self._terms(position):
+            index.setdefault(key, set()).add(position)
+
+    def remove_plant(self, position):
+        """
+        Remove one plant from every index. It must be called before the
+        plant's catalog entry is changed.
+
+        Parameters:
+        -----------
+        position : int
+            The plant's catalog position.
+        """
+        for index, key in self._terms(position):
+            positions = index.get(key)
+            if positions is not None:
+                positions.discard(position)
+                if not positions:
+                    del index[key]
+
+    def by_name_prefix(self, prefix):
+        """
+        Plants with a word in their name starting with prefix.
+
+        Parameters:
+        -----------
+        prefix : str
+            The start of a word.
+
+        Returns:
+        --------
+        list
+            The matching catalog positions.
+        """
+        prefix = prefix.strip().lower()
+        if len(prefix) < NGRAM_LENGTH:
+            return sorted(self._prefixes.get(prefix, ()))
+
+        names = self.catalog.names
+        return [
+            position for position in self._ngram_candidates(prefix)
+            if any(word.startswith(prefix)
+                   for word in words(names[position]))
+        ]
+
+    def by_name_substring(self, text):
+        """
+        Plants whose name contains text. Texts shorter than the n-gram
+        length match the start of a name word instead.
+
+        Parameters:
+        -----------
+        text : str
+            The text to look for.
+
+        Returns:
+        --------
+        list
+            The matching catalog positions.
+        """
+        text = text.strip().lower()
+        if len(text) < NGRAM_LENGTH:
+            return self.by_name_prefix(text)
+
+        names = self.catalog.names
+        return [
+            position for position in self._ngram_candidates(text)
+            if text in names[position].lower()
+        ]
+
+    def _ngram_candidates(self, text):
+        """
+        Return the sorted positions of names containing every n-gram of
+        text. Candidates still need checking against the whole text.
+        """
+        postings = sorted((
+            self._ngrams.get(text[start:start + NGRAM_LENGTH], set())
+            for start in range(len(text) - NGRAM_LENGTH + 1)
+        ), key=len)
+        return sorted(set.intersection(*postings))
+
+    def by_category(self, category):
+        """
+        Plants in a category, ignoring case.
+
+        Parameters:
+        -----------
+        category : str
+            The category name.
+
+        Returns:
+        --------
+        list
+            The matching catalog positions.
+        """
+        return sorted(
+            self._categories.get(category.strip().lower(), ())
+        )
+
+    def by_keywords(self, text):
+        """
+        Plants whose description contains every word of text.
+
+        Parameters:
+        -----------
+        text : str
+            One or more keywords.
+
+        Returns:
+        --------
+        list
+            The matching catalog positions.
+        """
+        keywords = words(text)
+        if not keywords:
+            return []
+        postings = sorted(
+            (self._keywords.get(word, set()) for word in keywords), key=len
+        )
+        return sorted(set.intersection(*postings))
+
+    def categories(self):
+        """
+        The categories in the catalog.
+
+        Returns:
+        --------
+        list
+            The category names as they appear in the catalog.
+        """
+        return sorted(
+            self.catalog.categories[min(positions)]
+            for category, positions in self._categories.items()
+            if category
+        )
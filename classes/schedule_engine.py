@@ -0,0 +1,287 @@
+import numpy as np
+
+
+class ScheduleEngine:
+    """
+    Computes planting and harvest dates for many plants and many dates
+    at once with NumPy datetime64 arithmetic.
+
+    The growth times come from the catalog's precomputed total growth
+    column, so a schedule for any number of (plant, date) pairs is a
+    single vectorized add or subtract.
+
+    Attributes:
+    -----------
+    catalog : PlantCatalog
+        The plant catalog the schedules are computed from.
+    plant_ids : numpy.ndarray
+        The id of each catalog plant, in catalog order.
+    names : numpy.ndarray
+        The name of each catalog plant.
+    growth_days : numpy.ndarray
+        The total growth time of each plant as timedelta64[D].
+
+    Methods:
+    --------
+    positions(plant_ids)
+        Returns the catalog positions of the given plant ids.
+    schedule(plant_ids, dates, action)
+        Schedules (plant, date) pairs element by element.
+    season_table(plant_ids, dates, action)
+        Schedules every plant against every date.
+    stage_timeline(plant_ids, dates, action)
+        Schedules every growth stage of (plant, date) pairs.
+    season_timeline(plant_ids, dates, action)
+        Schedules every growth stage of every plant for every date.
+    format_dates(dates)
+        Formats a datetime64 array as YYYY-MM-DD strings.
+    to_frame(columns)
+        Converts a schedule to a pandas DataFrame.
+    """
+
+    def __init__(self, catalog):
+        """
+        Initializes the engine from the plant catalog.
+
+        Parameters:
+        -----------
+        catalog : PlantCatalog
+            The plant catalog.
+        """
+        self.catalog = catalog
+        self.plant_ids = np.array(catalog.ids, dtype=object)
+        self.names = np.array(catalog.names, dtype=object)
+        self.growth_days = catalog.total_growth.astype("timedelta64[D]")
+
+    def positions(self, plant_ids):
+        """
+        Returns the catalog positions of the given plant ids.
+
+        Parameters:
+        -----------
+        plant_ids : iterable
+            Plant ids as strings or integers.
+
+        Returns:
+        --------
+        numpy.ndarray
+            The catalog position of each id.
+
+        Raises:
+        -------
+        KeyError
+            If an id is not in the catalog.
+        """
+        return np.fromiter(
+            (self.catalog.position(plant_id) for plant_id in plant_ids),
+            dtype=np.intp
+        )
+
+    def schedule(self, plant_ids, dates, action='P'):
+        """
+        Schedules (plant, date) pairs element by element. plant_ids and
+        dates are broadcast against each other, so a single date can be
+        given for many plants.
+
+        Parameters:
+        -----------
+        plant_ids : iterable
+            Plant ids as strings or integers.
+        dates : array_like
+            Dates as datetime64 values or 'YYYY-MM-DD' strings.
+        action : str
+            'P' if the dates are planting dates, 'H' if they are
+            harvest dates.
+
+        Returns:
+        --------
+        dict
+            Columns 'plant_id', 'plant', 'planting_date' and
+            'harvest_date', each a NumPy array.
+
+        Raises:
+        -------
+        ValueError
+            If action is not 'P' or 'H'.
+        """
+        return self._schedule(self.positions(plant_ids), dates, action)
+
+    def _schedule(self, positions, dates, action):
+        """
+        schedule() for catalog positions instead of plant ids.
+        """
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        positions, dates = np.broadcast_arrays(positions, dates)
+        growth = self.growth_days[positions]
+
+        if action == 'P':
+            planting_dates = dates
+            harvest_dates = dates + growth
+        elif action == 'H':
+            planting_dates = dates - growth
+            harvest_dates = dates
+        else:
+            raise ValueError(f"Unknown action '{action}'")
+
+        return {
+            "plant_id": self.plant_ids[positions],
+            "plant": self.names[positions],
+            "planting_date": planting_dates,
+            "harvest_date": harvest_dates
+        }
+
+    def season_table(self, plant_ids, dates, action='P'):
+        """
+        Schedules every given plant against every given date, for
+        example every plant for each day of a season:
+
+            engine.season_table(
+                engine.plant_ids,
+                np.arange('2024-03-01', '2024-10-01', dtype='datetime64[D]')
+            )
+
+        Parameters:
+        -----------
+        plant_ids : iterable
+            Plant ids as strings or integers.
+        dates : array_like
+            Dates as datetime64 values or 'YYYY-MM-DD' strings.
+        action : str
+            'P' for planting dates or 'H' for harvest dates.
+
+        Returns:
+        --------
+        dict
+            The same columns as schedule(), with one entry for each
+            plant and date, grouped by plant.
+        """
+        return self._schedule(*self._cross(plant_ids, dates), action)
+
+    def stage_timeline(self, plant_ids, dates, action='P'):
+        """
+        Schedules every growth stage of (plant, date) pairs, broadcast
+        like schedule(). The stage dates are the planting date plus
+        the catalog's cumulative stage offsets, so nothing is summed
+        per plant or per date.
+
+        Parameters:
+        -----------
+        plant_ids : iterable
+            Plant ids as strings or integers.
+        dates : array_like
+            Dates as datetime64 values or 'YYYY-MM-DD' strings.
+        action : str
+            'P' if the dates are planting dates, 'H' if they are
+            harvest dates.
+
+        Returns:
+        --------
+        dict
+            The columns of schedule(), plus 'stage_start' and
+            'stage_end', datetime64 arrays with one column per stage in
+            STAGE_FIELDS order, and 'stage_known', False where a
+            stage's duration isn't given (its start and end are equal).
+
+        Raises:
+        -------
+        ValueError
+            If action is not 'P' or 'H'.
+        """
+        return self._stage_timeline(
+            self.positions(plant_ids), dates, action
+        )
+
+    def _stage_timeline(self, positions, dates, action):
+        """
+        stage_timeline() for catalog positions instead of plant ids.
+        """
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        positions, dates = np.broadcast_arrays(positions, dates)
+        offsets = self.catalog.stage_offsets[positions].astype(
+            "timedelta64[D]"
+        )
+
+        if action == 'P':
+            planting_dates = dates
+        elif action == 'H':
+            planting_dates = dates - offsets[..., -1]
+        else:
+            raise ValueError(f"Unknown action '{action}'")
+
+        stage_dates = planting_dates[..., np.newaxis] + offsets
+        return {
+            "plant_id": self.plant_ids[positions],
+            "plant": self.names[positions],
+            "planting_date": planting_dates,
+            "harvest_date": stage_dates[..., -1],
+            "stage_start": stage_dates[..., :-1],
+            "stage_end": stage_dates[..., 1:],
+            "stage_known": self.catalog.stage_known[positions]
+        }
+
+    def season_timeline(self, plant_ids, dates, action='P'):
+        """
+        Schedules every growth stage of every given plant for every
+        given date, grouped by plant like season_table().
+
+        Parameters:
+        -----------
+        plant_ids : iterable
+            Plant ids as strings or integers.
+        dates : array_like
+            Dates as datetime64 values or 'YYYY-MM-DD' strings.
+        action : str
+            'P' for planting dates or 'H' for harvest dates.
+
+        Returns:
+        --------
+        dict
+            The same columns as stage_timeline().
+        """
+        return self._stage_timeline(*self._cross(plant_ids, dates), action)
+
+    def _cross(self, plant_ids, dates):
+        """
+        Pair the catalog position of every plant id with every date,
+        grouped by plant. Each id is looked up once, and the positions
+        are repeated rather than the ids.
+        """
+        positions = self.positions(plant_ids)
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        return np.repeat(positions, len(dates)), np.tile(dates, len(positions))
+
+    @staticmethod
+    def format_dates(dates):
+        """
+        Formats a datetime64 array as YYYY-MM-DD strings.
+
+        Parameters:
+        -----------
+        dates : numpy.ndarray
+            The dates to format.
+
+        Returns:
+        --------
+        numpy.ndarray
+            The formatted dates.
+        """
+        return np.datetime_as_string(dates, unit="D")
+
+    @staticmethod
+    def to_frame(columns):
+        """
+        Converts a schedule to a pandas DataFrame.
+
+        Parameters:
+        -----------
+        columns : dict
+            A schedule from schedule() or season_table().
+
+        Returns:
+        --------
+        pandas.DataFrame
+            One row per scheduled plant and date.
+        """
+        import pandas as pd
+
+        return pd.DataFrame(columns)
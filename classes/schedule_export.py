@@ -0,0 +1,205 @@
+import csv
+import hashlib
+import io
+import itertools
+from datetime import date, datetime, timedelta, timezone
+
+from classes.batch_runner import DATE_TYPES
+from classes.storage import EXPORT_CHUNK_ROWS, RESULTS_HEADER
+
+ICS_PRODID = "-//Crop Calendar Planner//EN"
+# Content lines longer than this many octets are folded (RFC 5545).
+ICS_LINE_OCTETS = 75
+
+
+def iter_records(storage, email=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Stream stored results one record at a time, reading them from
+    storage a chunk at a time.
+
+    Parameters:
+    -----------
+    storage : StorageBackend
+        The storage to read from.
+    email : str, optional
+        The user whose results are read. Every user's results are read
+        if it is not given.
+    chunk_rows : int
+        The most records read per request.
+
+    Yields:
+    -------
+    dict
+        Records keyed by the RESULTS_HEADER columns.
+    """
+    if email is None:
+        chunks = storage.iter_all_results(chunk_rows)
+    else:
+        chunks = storage.iter_results(email, chunk_rows)
+    for chunk in chunks:
+        yield from chunk
+
+
+def csv_lines(records):
+    """
+    Render records as CSV, one line at a time, with a RESULTS_HEADER
+    header line.
+
+    Parameters:
+    -----------
+    records : iterable
+        Records keyed by the RESULTS_HEADER columns.
+
+    Yields:
+    -------
+    str
+        CSV lines.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(values)
+        return buffer.getvalue()
+
+    yield line(RESULTS_HEADER)
+    for record in records:
+        yield line([record.get(column, '') for column in RESULTS_HEADER])
+
+
+def ics_text(value):
+    """
+    Escape a value for an iCalendar TEXT property.
+    """
+    return (
+        str(value).replace("\\", "\\\\").replace(";", "\\;")
+        .replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def ics_line(line):
+    """
+    Fold a content line into lines of at most ICS_LINE_OCTETS octets,
+    each continuation starting with a space, and end it with CRLF.
+    """
+    encoded = line.encode()
+    if len(encoded) <= ICS_LINE_OCTETS:
+        return line + "\r\n"
+    parts, current, size = [], "", 0
+    for char in line:
+        char_size = len(char.encode())
+        # Continuation lines lose one octet to the leading space.
+        limit = ICS_LINE_OCTETS - (1 if parts else 0)
+        if size + char_size > limit:
+            parts.append(current)
+            current, size = "", 0
+        current += char
+        size += char_size
+    parts.append(current)
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def ics_lines(records, stamp=None):
+    """
+    Render records as an iCalendar file, one line at a time. Each
+    record becomes two all-day events, one on its planting date and
+    one on its harvest date. Event UIDs are derived from the record,
+    so importing an export again updates events instead of adding
+    duplicates. Records with unreadable dates are skipped.
+
+    Parameters:
+    -----------
+    records : iterable
+        Records keyed by the RESULTS_HEADER columns.
+    stamp : datetime, optional
+        The DTSTAMP of every event. Defaults to now.
+
+    Yields:
+    -------
+    str
+        Folded, CRLF-terminated content lines, a whole event at a
+        time.
+    """
+    stamp = (stamp or datetime.now(timezone.utc)).strftime("%Y%m%dT%H%M%SZ")
+    yield ics_line("BEGIN:VCALENDAR")
+    yield ics_line("VERSION:2.0")
+    yield ics_line(f"PRODID:{ICS_PRODID}")
+    yield ics_line("CALSCALE:GREGORIAN")
+    for record in records:
+        try:
+            planting = date.fromisoformat(str(record["Date"]))
+            harvest = date.fromisoformat(str(record["Corresponding Date"]))
+        except (KeyError, ValueError):
+            continue
+        if record.get("Date Type") == DATE_TYPES['H']:
+            planting, harvest = harvest, planting
+
+        plant = record.get("Plant", "")
+        description = ics_text(
+            f"{plant}: planting {planting.isoformat()},"
+            f" harvest {harvest.isoformat()}"
+        )
+        for action, day in (("Plant", planting), ("Harvest", harvest)):
+            uid = hashlib.sha1(
+                f"{record.get('Email', '')}|{plant}|{action}|{day}".encode()
+            ).hexdigest()
+            # One string per event. Only the text properties can be
+            # long enough to need folding.
+            yield (
+                "BEGIN:VEVENT\r\n"
+                f"UID:{uid}@crop-calendar\r\n"
+                f"DTSTAMP:{stamp}\r\n"
+                f"DTSTART;VALUE=DATE:{day:%Y%m%d}\r\n"
+                f"DTEND;VALUE=DATE:{day + timedelta(days=1):%Y%m%d}\r\n"
+                + ics_line(f"SUMMARY:{ics_text(f'{action} {plant}')}")
+                + ics_line(f"DESCRIPTION:{description}")
+                + "END:VEVENT\r\n"
+            )
+    yield ics_line("END:VCALENDAR")
+
+
+# Functions that render a stream of records in each export format.
+EXPORTERS = {
+    "csv": csv_lines,
+    "ics": ics_lines
+}
+
+
+def export_results(storage, stream, fmt="csv", email=None,
+                   chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Export stored results to a text stream. Records are read, rendered
+    and written one chunk at a time, so memory use doesn't grow with
+    the number of results.
+
+    Parameters:
+    -----------
+    storage : StorageBackend
+        The storage to read from.
+    stream : file
+        Where the export is written. Files should be opened with
+        newline='', so line endings are written as rendered.
+    fmt : str
+        'csv' or 'ics'.
+    email : str, optional
+        The user whose results are exported. Every user's results are
+        exported if it is not given.
+    chunk_rows : int
+        The most records read per storage request.
+
+    Returns:
+    --------
+    int
+        The number of records exported.
+    """
+    counter = itertools.count()
+    # zip() takes a number from counter for every record it passes on,
+    # so the next number is the record count.
+    records = (
+        record for record, _
+        in zip(iter_records(storage, email, chunk_rows), counter)
+    )
+    stream.writelines(EXPORTERS[fmt](records))
+    return next(counter)
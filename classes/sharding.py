@@ -0,0 +1,333 @@
+import os
+import zlib
+
+from classes.storage import (
+    DEFAULT_CHUNK_ROWS, EXPORT_CHUNK_ROWS, RESULTS_SHEET, CompactionStats,
+    SheetsStorage, StorageBackend
+)
+
+SHARDS_ENV = "CROP_CALENDAR_RESULT_SHARDS"
+# Comma-separated names of the spreadsheets shards are spread over, in
+# turn. Defaults to the main spreadsheet only.
+SPREADSHEETS_ENV = "CROP_CALENDAR_RESULT_SPREADSHEETS"
+
+
+def shard_index(email, shards):
+    """
+    Return the shard an email's results are stored in. The hash is
+    stable across processes and Python versions, unlike hash().
+
+    Parameters:
+    -----------
+    email : str
+        The email address.
+    shards : int
+        The number of shards.
+
+    Returns:
+    --------
+    int
+        The shard, from 0 to shards - 1.
+    """
+    return zlib.crc32(email.encode()) % shards
+
+
+def results_sheet_name(shard):
+    """
+    Return the results worksheet of a shard. Shard 0 keeps the
+    unsharded 'user_results' worksheet, so existing results stay in
+    place.
+    """
+    return RESULTS_SHEET if shard == 0 else f"{RESULTS_SHEET}_{shard}"
+
+
+class ShardedStorage(StorageBackend):
+    """
+    Stores results across several shards, each user's results in the
+    shard picked by a hash of their email address. Reads and writes
+    for one user touch only their shard, so every shard's email index
+    and sheet stay a fraction of the size. The plant catalog is read
+    from one storage.
+
+    Attributes:
+    -----------
+    shards : list
+        The shard storages.
+    catalog : StorageBackend
+        The storage the plant catalog is read from.
+
+    Methods:
+    --------
+    shard_for(email)
+        Returns the shard an email's results are stored in.
+    """
+
+    def __init__(self, shards, catalog=None):
+        """
+        Initializes the storage.
+
+        Parameters:
+        -----------
+        shards : list
+            The shard storages, in shard order.
+        catalog : StorageBackend, optional
+            The storage the plant catalog is read from. Defaults to
+            the first shard.
+        """
+        self.shards = list(shards)
+        self.catalog = catalog or self.shards[0]
+
+    @property
+    def name(self):
+        return self.catalog.name
+
+    @property
+    def spreadsheet(self):
+        """
+        The main spreadsheet, which holds the plant catalog.
+        """
+        return self.catalog.spreadsheet
+
+    def shard_for(self, email):
+        """
+        Returns the shard an email's results are stored in.
+
+        Parameters:
+        -----------
+        email : str
+            The email address.
+
+        Returns:
+        --------
+        StorageBackend
+            The shard.
+        """
+        return self.shards[shard_index(email, len(self.shards))]
+
+    def load_plants(self):
+        return self.catalog.load_plants()
+
+    def plant_row_versions(self):
+        return self.catalog.plant_row_versions()
+
+    def load_plant_rows(self, positions):
+        return self.catalog.load_plant_rows(positions)
+
+    def catalog_version(self):
+        return self.catalog.catalog_version()
+
+    def append_results(self, user_data):
+        return self.shard_for(user_data.email).append_results(user_data)
+
+    def append_batch(self, batches, recheck=()):
+        # One write per shard that has results in the batch.
+        recheck = set(recheck)
+        by_shard = {}
+        for key, user_data in batches:
+            shard = self.shard_for(user_data.email)
+            by_shard.setdefault(id(shard), (shard, []))[1].append(
+                (key, user_data)
+            )
+        return sum(
+            shard.append_batch(
+                shard_batches,
+                [key for key, _ in shard_batches if key in recheck]
+            )
+            for shard, shard_batches in by_shard.values()
+        )
+
+    def fetch_results(self, email):
+        return self.shard_for(email).fetch_results(email)
+
+    def iter_results(self, email, chunk_rows=DEFAULT_CHUNK_ROWS):
+        return self.shard_for(email).iter_results(email, chunk_rows)
+
+    def iter_all_results(self, chunk_rows=EXPORT_CHUNK_ROWS):
+        # Shard after shard, so admin exports see every user.
+        for shard in self.shards:
+            yield from shard.iter_all_results(chunk_rows)
+
+    def compact_results(self, chunk_rows=EXPORT_CHUNK_ROWS):
+        return merge_stats(
+            shard.compact_results(chunk_rows) for shard in self.shards
+        )
+
+    def reset_connections(self):
+        for shard in self.shards:
+            shard.reset_connections()
+
+    def prepare(self):
+        # Shards set themselves up on first use, so a session only
+        # pays for the shard its user's results are in.
+        self.catalog.prepare()
+
+
+def merge_stats(shard_stats):
+    """
+    Add up the CompactionStats of several shards.
+    """
+    total = None
+    for stats in shard_stats:
+        if total is None:
+            total = CompactionStats(stats.space_unit)
+        for counter in ("rows_scanned", "duplicates", "blank_rows",
+                        "rows_moved", "rows_resharded", "space_freed"):
+            setattr(total, counter,
+                    getattr(total, counter) + getattr(stats, counter))
+    return total or CompactionStats()
+
+
+def configured_spreadsheets():
+    """
+    Return the spreadsheet names in CROP_CALENDAR_RESULT_SPREADSHEETS.
+    """
+    return [
+        name.strip() for name
+        in os.environ.get(SPREADSHEETS_ENV, "").split(",") if name.strip()
+    ]
+
+
+def sheets_shards(primary, count, spreadsheets=()):
+    """
+    Create the shard storages for results sharded over count
+    worksheets. Shard i is stored in the worksheet
+    results_sheet_name(i) of the spreadsheet spreadsheets[i % len]
+    and keeps its email index in '<index path>.<i>'. Shards in the
+    same spreadsheet share one connection.
+
+    Parameters:
+    -----------
+    primary : SheetsStorage
+        The storage of the main spreadsheet.
+    count : int
+        The number of shards.
+    spreadsheets : list, optional
+        The names of the spreadsheets to spread shards over. Defaults
+        to the main spreadsheet only.
+
+    Returns:
+    --------
+    list
+        The shard storages. Shard 0 is primary itself, if it is in the
+        main spreadsheet.
+    """
+    names = list(spreadsheets) or [primary.spreadsheet_name]
+    parents = {primary.spreadsheet_name: primary}
+    shards = []
+    for shard in range(count):
+        name = names[shard % len(names)]
+        if name not in parents:
+            parents[name] = SheetsStorage(
+                index_path=primary.index_path,
+                creds_file=primary.creds_file, name=name
+            )
+        parent = parents[name]
+        if shard == 0 and parent is primary:
+            shards.append(primary)
+        else:
+            shards.append(parent.results_shard(
+                results_sheet_name(shard), f"{primary.index_path}.{shard}"
+            ))
+    return shards
+
+
+def sharded_storage(primary, count=None, spreadsheets=None):
+    """
+    Shard a SheetsStorage's results as configured.
+
+    Parameters:
+    -----------
+    primary : SheetsStorage
+        The storage of the main spreadsheet, which also holds the
+        plant catalog.
+    count : int, optional
+        The number of shards. Defaults to the
+        CROP_CALENDAR_RESULT_SHARDS environment variable, or 1.
+    spreadsheets : list, optional
+        The spreadsheets to spread shards over. Defaults to the
+        CROP_CALENDAR_RESULT_SPREADSHEETS environment variable, or the
+        main spreadsheet only.
+
+    Returns:
+    --------
+    StorageBackend
+        A ShardedStorage, or primary itself if there is one shard in
+        the main spreadsheet.
+    """
+    if count is None:
+        count = int(os.environ.get(SHARDS_ENV) or 1)
+    if spreadsheets is None:
+        spreadsheets = configured_spreadsheets()
+    if count < 1:
+        raise ValueError("The number of result shards must be at least 1")
+    if count == 1 and spreadsheets in ([], [primary.spreadsheet_name]):
+        return primary
+    return ShardedStorage(
+        sheets_shards(primary, count, spreadsheets), catalog=primary
+    )
+
+
+def reshard(old, new, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Move stored results from one shard layout to another, e.g. after
+    the number of shards was changed. Every old shard's misplaced rows
+    are moved to the new shard they belong in, see
+    SheetsStorage.reshard_results(). Shards that don't exist yet are
+    added.
+
+    Sessions should already use the new layout, so nothing new is
+    written to the old one. Results being moved are missing from the
+    new shard until the move reaches them.
+
+    Parameters:
+    -----------
+    old : list
+        The old shard storages.
+    new : ShardedStorage
+        The new layout.
+    chunk_rows : int
+        The most rows read or written per request.
+
+    Returns:
+    --------
+    CompactionStats
+        What was moved, over all shards.
+    """
+    # Old shards that the new layout doesn't use have every row moved.
+    return merge_stats(
+        shard.reshard_results(new.shard_for, chunk_rows) for shard in old
+    )
+
+
+def reshard_from(storage, old_count, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Move stored results from old_count shards to the configured
+    layout, see reshard().
+
+    Parameters:
+    -----------
+    storage : StorageBackend
+        The configured storage, as returned by get_storage().
+    old_count : int
+        The number of shards results were stored in before.
+    chunk_rows : int
+        The most rows read or written per request.
+
+    Returns:
+    --------
+    CompactionStats
+        What was moved, over all shards.
+
+    Raises:
+    -------
+    ValueError
+        If results aren't stored in Google Sheets.
+    """
+    if not isinstance(storage, ShardedStorage):
+        storage = ShardedStorage([storage])
+    if not isinstance(storage.catalog, SheetsStorage):
+        raise ValueError("Only results stored in Google Sheets are sharded")
+    old_shards = sheets_shards(
+        storage.catalog, old_count, configured_spreadsheets()
+    )
+    return reshard(old_shards, storage, chunk_rows)
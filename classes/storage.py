@@ -0,0 +1,1363 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+from classes import metrics
+from classes.email_index import EmailIndex
+
+SCOPE = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.file",
+    "https://www.googleapis.com/auth/drive"
+    ]
+
+PLANT_HEADER = [
+    "id", "Name", "Category", "Germination", "Seedling Stage",
+    "Vegetative Growth", "Flowering/Root Development",
+    "Fruit Development", "Description"
+]
+# An optional plant_list column after Description holding a value that
+# changes whenever its row is edited, so changed rows can be found
+# without downloading the whole catalog.
+PLANT_VERSION_HEADER = "Row Version"
+# An optional plant_list cell holding a value that changes whenever the
+# catalog is edited, for example written by the same trigger as the Row
+# Version column. Unlike the spreadsheet's modifiedTime, it doesn't
+# change when results are stored.
+CATALOG_VERSION_CELL = chr(ord('A') + len(PLANT_HEADER) + 1) + "1"
+RESULTS_HEADER = [
+    "Email", "Plant", "Date Type", "Date", "Corresponding Date"
+]
+# Results written through a WriteBehindQueue carry their idempotency
+# key in the column after RESULTS_HEADER.
+WRITE_KEY_HEADER = "Write Key"
+# The worksheet results are stored in, unless they are sharded (see
+# classes.sharding).
+RESULTS_SHEET = "user_results"
+# The user_results cell holding the sheet's generation. Compacting the
+# sheet moves rows, so it starts a new generation, which tells every
+# session to rebuild its email index.
+GENERATION_CELL = chr(ord('A') + len(RESULTS_HEADER) + 1) + "1"
+COMPACTING = "compacting"
+# A compaction that hasn't finished after this many seconds is assumed
+# to have crashed.
+COMPACTION_TIMEOUT = 3600
+
+# Result rows read per request when results are read a page at a time.
+DEFAULT_CHUNK_ROWS = 50
+# Result rows read per request when every user's results are read.
+EXPORT_CHUNK_ROWS = 5000
+
+QUOTA_ERROR_CODES = (429, 500, 503)
+MAX_RETRIES = 5
+
+STORAGE_ENV = "CROP_CALENDAR_STORAGE"
+DATABASE_ENV = "CROP_CALENDAR_DB"
+DEFAULT_DATABASE = "crop_calendar.db"
+INDEX_ENV = "CROP_CALENDAR_INDEX"
+DEFAULT_INDEX = ".email_index.json"
+
+UPDATED_RANGE = re.compile(r"![A-Z]+(\d+):[A-Z]+(\d+)$")
+
+
+def local_path(env, default, kind=None):
+    """
+    Return the local file set by an environment variable, such as the
+    email index. The fake backend doesn't share default files with
+    real runs: its own are kept next to the CROP_CALENDAR_FAKE_SHEETS
+    file, or in a temporary directory if the fake spreadsheet is only
+    in memory.
+
+    Args:
+        env (str): The environment variable.
+        default (str): The file used if it isn't set.
+        kind (str, optional): The storage backend, as for
+            get_storage().
+
+    Returns:
+        str: The path of the file.
+    """
+    if os.environ.get(env):
+        return os.environ[env]
+    kind = (kind or os.environ.get(STORAGE_ENV, 'sheets')).lower()
+    if kind != 'fake':
+        return default
+    from classes.fake_sheets import fake_local_path
+    return fake_local_path(default)
+
+
+def call_with_backoff(func, *args, **kwargs):
+    """
+    Call a Sheets API function, retrying with exponential backoff
+    when the request is rejected because of quota or server errors.
+
+    Args:
+        func (callable): The gspread call to make.
+        *args: Positional arguments passed to func.
+        **kwargs: Keyword arguments passed to func.
+
+    Returns:
+        The value returned by func.
+
+    Raises:
+        gspread.exceptions.APIError: If the call still fails after
+        MAX_RETRIES attempts, or fails with a non-retryable error.
+    """
+    from gspread.exceptions import APIError
+
+    name = getattr(func, "__name__", "call")
+    started = time.perf_counter()
+    delay = 1
+    try:
+        for attempt in range(MAX_RETRIES):
+            try:
+                return func(*args, **kwargs)
+            except APIError as error:
+                if error.code in QUOTA_ERROR_CODES:
+                    metrics.record_quota_error(name)
+                if (error.code not in QUOTA_ERROR_CODES
+                        or attempt == MAX_RETRIES - 1):
+                    raise
+                time.sleep(delay)
+                delay *= 2
+    finally:
+        metrics.record_api_call(name, time.perf_counter() - started)
+
+
+def is_permanent_error(error):
+    """
+    Return whether a failed storage request would fail the same way if
+    it were retried, like a Sheets API request rejected as invalid.
+
+    Args:
+        error (Exception): The error the request raised.
+
+    Returns:
+        bool: True for API errors other than quota and server errors.
+    """
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and code not in QUOTA_ERROR_CODES
+
+
+class CompactionStats:
+    """
+    Counters for a compaction of the stored results.
+
+    Attributes:
+    -----------
+    rows_scanned : int
+        Result rows read.
+    duplicates : int
+        Rows removed because a later row has the same email, plant,
+        date type and date.
+    blank_rows : int
+        Empty rows removed.
+    rows_moved : int
+        Kept rows rewritten at a new position.
+    rows_resharded : int
+        Rows moved to another shard.
+    space_freed : int
+        The space given back, in space_unit.
+    space_unit : str
+        'cells' for Google Sheets, 'bytes' for SQLite.
+    """
+
+    def __init__(self, space_unit="cells"):
+        self.rows_scanned = 0
+        self.duplicates = 0
+        self.blank_rows = 0
+        self.rows_moved = 0
+        self.rows_resharded = 0
+        self.space_freed = 0
+        self.space_unit = space_unit
+
+    def report(self):
+        """
+        Returns a one-line summary.
+
+        Returns:
+        --------
+        str
+            The summary.
+        """
+        resharded = (
+            f" {self.rows_resharded} rows moved to other shards,"
+            if self.rows_resharded else ""
+        )
+        return (
+            f"{self.rows_scanned} rows scanned, {self.duplicates}"
+            f" duplicates and {self.blank_rows} blank rows removed,"
+            f"{resharded} {self.rows_moved} rows moved,"
+            f" {self.space_freed:,} {self.space_unit} freed"
+        )
+
+
+class StorageBackend:
+    """
+    The operations the application needs from its data store.
+
+    Methods:
+    --------
+    load_plants()
+        Returns the plant catalog, header row first.
+    plant_row_versions()
+        Returns a version per catalog row, or None.
+    load_plant_rows(positions)
+        Returns some catalog rows.
+    append_results(user_data)
+        Stores the rows of a UserData object, returns the row count.
+    append_batch(batches, recheck)
+        Stores several keyed UserData objects in one write.
+    fetch_results(email)
+        Returns the stored records for an email address.
+    iter_results(email, chunk_rows)
+        Yields the stored records for an email address in chunks.
+    iter_all_results(chunk_rows)
+        Yields every stored record in chunks.
+    compact_results(chunk_rows)
+        Removes duplicate results, keeping the latest.
+    catalog_version()
+        Returns a value that changes whenever the catalog changes.
+    reset_connections()
+        Drops connections inherited from a parent process.
+    prepare()
+        Does one-off setup ahead of the first read or write.
+    """
+
+    name = None
+
+    def load_plants(self):
+        """
+        Load the plant catalog.
+
+        Returns:
+        --------
+        list
+            The plant rows as lists of strings, header row first.
+        """
+        raise NotImplementedError
+
+    def plant_row_versions(self):
+        """
+        Return a value per catalog row that changes whenever the row is
+        edited, read without downloading the rows themselves.
+
+        Returns:
+        --------
+        list or None
+            (id, version) pairs in catalog order, or None if the
+            backend keeps no row versions.
+        """
+        return None
+
+    def load_plant_rows(self, positions):
+        """
+        Load some rows of the plant catalog.
+
+        Parameters:
+        -----------
+        positions : list
+            Catalog positions, 0 being the first row after the header.
+
+        Returns:
+        --------
+        list
+            The rows at those positions, in the order given.
+        """
+        rows = self.load_plants()
+        return [rows[position + 1] for position in positions]
+
+    def append_results(self, user_data):
+        """
+        Append a user's schedule rows to the stored results.
+
+        Parameters:
+        -----------
+        user_data : UserData
+            The user's data object.
+
+        Returns:
+        --------
+        int
+            The number of result rows written.
+        """
+        raise NotImplementedError
+
+    def append_batch(self, batches, recheck=()):
+        """
+        Append several users' rows in one write. Backends that can't
+        write in bulk store each batch in turn.
+
+        Parameters:
+        -----------
+        batches : list
+            (key, UserData) pairs, the key identifying the write.
+        recheck : iterable
+            Keys an earlier attempt may already have stored. Batches
+            whose key is found in storage are skipped.
+
+        Returns:
+        --------
+        int
+            The number of result rows written.
+        """
+        return sum(
+            self.append_results(user_data) for _, user_data in batches
+        )
+
+    def fetch_results(self, email):
+        """
+        Fetch the stored results for an email address.
+
+        Parameters:
+        -----------
+        email : str
+            The user's email address.
+
+        Returns:
+        --------
+        list
+            A list of dicts keyed by the RESULTS_HEADER columns.
+        """
+        raise NotImplementedError
+
+    def iter_results(self, email, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        Read the stored results for an email address a chunk at a time,
+        so the first records can be shown before the rest are read.
+        Backends that can't read in chunks read everything at once.
+
+        Parameters:
+        -----------
+        email : str
+            The user's email address.
+        chunk_rows : int
+            The most records read per request.
+
+        Yields:
+        -------
+        list
+            Non-empty lists of dicts keyed by the RESULTS_HEADER
+            columns, in storage order.
+        """
+        results = self.fetch_results(email)
+        for start in range(0, len(results), chunk_rows):
+            yield results[start:start + chunk_rows]
+
+    def iter_all_results(self, chunk_rows=EXPORT_CHUNK_ROWS):
+        """
+        Read every user's stored results a chunk at a time, so they
+        can be processed in constant memory.
+
+        Parameters:
+        -----------
+        chunk_rows : int
+            The most records read per request.
+
+        Yields:
+        -------
+        list
+            Non-empty lists of dicts keyed by the RESULTS_HEADER
+            columns, in storage order.
+        """
+        raise NotImplementedError
+
+    def catalog_version(self):
+        """
+        Return a cheap-to-fetch value that changes whenever the plant
+        catalog changes, so a cached copy can be revalidated without
+        downloading it.
+
+        Returns:
+        --------
+        str or None
+            The catalog version, or None if the backend can't tell.
+        """
+        return None
+
+    def compact_results(self, chunk_rows=EXPORT_CHUNK_ROWS):
+        """
+        Remove duplicate results, rows with the same email, plant, date
+        type and date, keeping the one stored last. Results can still
+        be appended while it runs.
+
+        Parameters:
+        -----------
+        chunk_rows : int
+            The most rows read or written per request.
+
+        Returns:
+        --------
+        CompactionStats
+            The counters for the compaction.
+        """
+        raise NotImplementedError
+
+    def reset_connections(self):
+        """
+        Drop any open connections so a forked process opens its own
+        instead of sharing its parent's sockets or database handle.
+        """
+
+    def prepare(self):
+        """
+        Do any one-off setup (opening handles, warming indexes) ahead of
+        the first read or write, so it can overlap with other work.
+        """
+
+
+class SheetsStorage(StorageBackend):
+    """
+    Storage backed by the 'crop_calendar' Google Sheets document.
+
+    Results are looked up through an EmailIndex, so reading a user's
+    rows only fetches the ranges that belong to that user.
+
+    The client is authorized and the spreadsheet opened the first
+    time it is used, so creating the storage costs no network calls.
+
+    Attributes:
+    -----------
+    spreadsheet : gspread.Spreadsheet
+        The spreadsheet holding 'plant_list' and 'user_results'.
+    spreadsheet_name : str
+        The name of the spreadsheet.
+    index_path : str
+        The file the email index is kept in between sessions.
+    results_sheet : str
+        The worksheet results are stored in.
+    """
+
+    name = 'sheets'
+
+    def __init__(self, spreadsheet=None, index_path=None,
+                 creds_file='creds.json', name='crop_calendar',
+                 results_sheet=RESULTS_SHEET):
+        """
+        Initializes the storage.
+
+        Parameters:
+        -----------
+        spreadsheet : gspread.Spreadsheet, optional
+            An already opened spreadsheet. If not given, it is opened
+            on first use with the service account in creds_file.
+        index_path : str, optional
+            The email index file. Defaults to the CROP_CALENDAR_INDEX
+            environment variable, or '.email_index.json'.
+        creds_file : str
+            Path to the service account credentials.
+        name : str
+            The name of the spreadsheet to open.
+        results_sheet : str
+            The worksheet results are stored in. It is added to the
+            spreadsheet when it is first needed.
+        """
+        self._spreadsheet = spreadsheet
+        self.index_path = index_path or os.environ.get(
+            INDEX_ENV, DEFAULT_INDEX
+        )
+        self.creds_file = creds_file
+        self.spreadsheet_name = name
+        self.results_sheet = results_sheet
+        # Storages made by results_shard() share their parent's
+        # spreadsheet and worksheet handles.
+        self._parent = None
+        self._email_index = None
+        self._worksheets = None
+        self._has_header = False
+        self._open_lock = threading.Lock()
+        self._worksheets_lock = threading.Lock()
+        self._index_lock = threading.RLock()
+
+    @property
+    def spreadsheet(self):
+        """
+        The spreadsheet, authorizing and opening it on first access.
+
+        Returns:
+        --------
+        gspread.Spreadsheet
+            The opened spreadsheet.
+        """
+        if self._parent is not None:
+            return self._parent.spreadsheet
+        with self._open_lock:
+            if self._spreadsheet is None:
+                # gspread and google-auth take a quarter of a second to
+                # import, so they are only loaded once Sheets is used.
+                with metrics.timer("sheets.open"):
+                    import gspread
+                    from google.oauth2.service_account import Credentials
+
+                    creds = Credentials.from_service_account_file(
+                        self.creds_file
+                    )
+                    scoped_creds = creds.with_scopes(SCOPE)
+                    client = gspread.authorize(scoped_creds)
+                    metrics.instrument_http(client.http_client.session)
+                    self._spreadsheet = client.open(
+                        self.spreadsheet_name
+                    )
+        return self._spreadsheet
+
+    def worksheet(self, name):
+        """
+        Return a worksheet handle. Every handle is fetched with a single
+        metadata request the first time one is needed, then cached.
+
+        Parameters:
+        -----------
+        name : str
+            The worksheet title.
+
+        Returns:
+        --------
+        gspread.Worksheet
+            The worksheet.
+        """
+        if self._parent is not None:
+            return self._parent.worksheet(name)
+        with self._worksheets_lock:
+            if self._worksheets is None:
+                self._worksheets = {
+                    worksheet.title: worksheet for worksheet
+                    in call_with_backoff(self.spreadsheet.worksheets)
+                }
+        if name not in self._worksheets:
+            # Fall back to a direct lookup, which raises WorksheetNotFound
+            # if the worksheet really is missing.
+            self._worksheets[name] = call_with_backoff(
+                self.spreadsheet.worksheet, name
+            )
+        return self._worksheets[name]
+
+    def results_worksheet(self):
+        """
+        Return the results worksheet, adding it to the spreadsheet if
+        it doesn't exist yet.
+
+        Returns:
+        --------
+        gspread.Worksheet
+            The results worksheet.
+        """
+        from gspread.exceptions import APIError, WorksheetNotFound
+
+        try:
+            return self.worksheet(self.results_sheet)
+        except WorksheetNotFound:
+            pass
+        owner = self._parent or self
+        with owner._worksheets_lock:
+            try:
+                worksheet = call_with_backoff(
+                    self.spreadsheet.add_worksheet, self.results_sheet,
+                    rows=1000, cols=len(RESULTS_HEADER) + 2
+                )
+            except APIError:
+                # Another session added it first.
+                worksheet = call_with_backoff(
+                    self.spreadsheet.worksheet, self.results_sheet
+                )
+            owner._worksheets[self.results_sheet] = worksheet
+        return worksheet
+
+    def results_shard(self, results_sheet, index_path):
+        """
+        Return a storage for another results worksheet in the same
+        spreadsheet, sharing this storage's connection.
+
+        Parameters:
+        -----------
+        results_sheet : str
+            The worksheet the shard's results are stored in.
+        index_path : str
+            The shard's email index file.
+
+        Returns:
+        --------
+        SheetsStorage
+            The shard's storage.
+        """
+        shard = SheetsStorage(
+            index_path=index_path, creds_file=self.creds_file,
+            name=self.spreadsheet_name, results_sheet=results_sheet
+        )
+        shard._parent = self
+        return shard
+
+    def reset_connections(self):
+        if self._parent is not None:
+            self._parent.reset_connections()
+        elif self._spreadsheet is not None:
+            # The pooled HTTP connections reconnect on the next request.
+            self._spreadsheet.client.session.close()
+
+    def prepare(self):
+        self.email_index()
+
+    def load_plants(self):
+        plants = self.worksheet('plant_list')
+        return call_with_backoff(plants.get_all_values)
+
+    def plant_row_versions(self):
+        # The ids and the Row Version column (J) in a single request.
+        # Without a Row Version header the sheet has no row versions.
+        plants = self.worksheet('plant_list')
+        version_column = chr(ord('A') + len(PLANT_HEADER))
+        ids, versions = call_with_backoff(plants.batch_get, [
+            "A1:A", f"{version_column}1:{version_column}"
+        ])
+        if not versions or versions[0][:1] != [PLANT_VERSION_HEADER]:
+            return None
+        versions = versions[1:]
+        versions += [[]] * (len(ids) - 1 - len(versions))
+        return [
+            (plant_id[0] if plant_id else '', version[0] if version else '')
+            for plant_id, version in zip(ids[1:], versions)
+        ]
+
+    def load_plant_rows(self, positions):
+        if not positions:
+            return []
+        # One range per run of consecutive rows, all in one batch_get.
+        runs = []
+        for position in sorted(set(positions)):
+            if runs and runs[-1][1] == position - 1:
+                runs[-1][1] = position
+            else:
+                runs.append([position, position])
+
+        last_column = chr(ord('A') + len(PLANT_HEADER) - 1)
+        value_ranges = call_with_backoff(
+            self.worksheet('plant_list').batch_get, [
+                f"A{first + 2}:{last_column}{last + 2}"
+                for first, last in runs
+            ]
+        )
+        rows = {}
+        for (first, last), values in zip(runs, value_ranges):
+            values += [[]] * (last - first + 1 - len(values))
+            for position, row in enumerate(values, start=first):
+                rows[position] = row + [''] * (len(PLANT_HEADER) - len(row))
+        return [rows[position] for position in positions]
+
+    def catalog_version(self):
+        # Without a catalog version cell, fall back to the Drive
+        # modifiedTime of the spreadsheet, which also changes whenever
+        # results are stored.
+        version = self._cell_value(call_with_backoff(
+            self.worksheet('plant_list').get, CATALOG_VERSION_CELL
+        ))
+        if version:
+            return f"cell:{version}"
+        return call_with_backoff(self.spreadsheet.get_lastUpdateTime)
+
+    def append_results(self, user_data):
+        return self._append_rows([
+            [user_data.email] + result for result in user_data.get_data()
+        ])
+
+    def append_batch(self, batches, recheck=()):
+        recheck = set(recheck)
+        stored = self.stored_keys(
+            [(key, user_data.email) for key, user_data in batches
+             if key in recheck]
+        )
+        return self._append_rows([
+            [user_data.email] + result + [key]
+            for key, user_data in batches if key not in stored
+            for result in user_data.get_data()
+        ])
+
+    def stored_keys(self, writes):
+        """
+        Return the write keys that are already in the sheet. Only the
+        Write Key cells of each email's indexed rows are read.
+
+        Parameters:
+        -----------
+        writes : list
+            (key, email) pairs to look for.
+
+        Returns:
+        --------
+        set
+            The keys found.
+        """
+        if not writes:
+            return set()
+
+        index = self.email_index()
+        ranges = sorted({
+            row_range for _, email in writes
+            for row_range in index.ranges(email)
+        })
+        if not ranges:
+            return set()
+
+        key_column = chr(ord('A') + len(RESULTS_HEADER))
+        value_ranges = call_with_backoff(
+            self.results_worksheet().batch_get, [
+                f"{key_column}{first_row}:{key_column}{last_row}"
+                for first_row, last_row in ranges
+            ]
+        )
+        found = {
+            row[0] for value_range in value_ranges
+            for row in value_range if row
+        }
+        return {key for key, _ in writes if key in found}
+
+    def _append_rows(self, rows):
+        """
+        Append result rows in one request, adding the header row first
+        if the sheet is empty.
+        """
+        if not rows:
+            return 0
+        results_sheet = self.results_worksheet()
+
+        # Once a header has been seen it never needs checking again.
+        if (not self._has_header
+                and not call_with_backoff(results_sheet.row_values, 1)):
+            rows.insert(0, RESULTS_HEADER + [WRITE_KEY_HEADER])
+            header_rows = 1
+        else:
+            header_rows = 0
+
+        response = call_with_backoff(results_sheet.append_rows, rows)
+        self._has_header = True
+        self._index_appended(response, rows)
+
+        return len(rows) - header_rows
+
+    def _index_appended(self, response, rows):
+        """
+        Add freshly appended rows to the email index, if they directly
+        follow the rows it already covers. Anything else is picked up
+        by the catch-up scan on the next lookup.
+        """
+        with self._index_lock:
+            if self._email_index is not None:
+                self._index_response(response, rows)
+
+    def _index_response(self, response, rows):
+        """
+        Index the rows of an append_rows response.
+        """
+        match = UPDATED_RANGE.search(
+            response.get("updates", {}).get("updatedRange", "")
+        )
+        if not match:
+            return
+        first_row = int(match.group(1))
+        if first_row == self._email_index.indexed_rows + 1:
+            emails = [row[0] for row in rows]
+            if first_row == 1:
+                emails[0] = ''  # The header row belongs to nobody
+            self._email_index.add_rows(emails, first_row)
+            self._email_index.save(self.index_path)
+
+    def email_index(self):
+        """
+        Return the email index, brought up to date with the sheet.
+
+        The saved index is loaded once, then every call reads only the
+        Email column cells below the last indexed row, along with the
+        sheet generation. If the sheet has been compacted since the
+        index was built, the index is rebuilt.
+
+        Returns:
+        --------
+        EmailIndex
+            The up to date index.
+        """
+        with self._index_lock:
+            if self._email_index is None:
+                self._email_index = EmailIndex.load(self.index_path)
+
+            results_sheet = self.results_worksheet()
+            first_row = self._email_index.indexed_rows + 1
+            generation, new_cells = call_with_backoff(
+                results_sheet.batch_get, [GENERATION_CELL, f"A{first_row}:A"]
+            )
+            generation = self._cell_value(generation)
+            if generation != self._email_index.generation:
+                # The sheet has been compacted, so indexed rows may
+                # have moved.
+                self._email_index = EmailIndex(generation=generation)
+                first_row = 1
+                new_cells = call_with_backoff(results_sheet.get, "A1:A")
+            if new_cells:
+                emails = [row[0] if row else '' for row in new_cells]
+                if first_row == 1:
+                    emails[0] = ''
+                self._email_index.add_rows(emails, first_row)
+                self._email_index.save(self.index_path)
+
+            return self._email_index
+
+    def rebuild_index(self):
+        """
+        Discard the saved email index and rebuild it from the sheet.
+
+        Returns:
+        --------
+        EmailIndex
+            The rebuilt index.
+        """
+        with self._index_lock:
+            self._email_index = EmailIndex()
+            return self.email_index()
+
+    def compact_results(self, chunk_rows=EXPORT_CHUNK_ROWS):
+        results_sheet = self.results_worksheet()
+        self._start_compaction(results_sheet)
+        stats = CompactionStats()
+
+        # First pass: the last row of each (email, plant, date type,
+        # date) key.
+        latest = {}
+        last_row = 1
+        for first_row, rows in self._results_chunks(results_sheet,
+                                                    chunk_rows):
+            for row_number, row in enumerate(rows, start=first_row):
+                if row[0]:
+                    latest[tuple(row[:4])] = row_number
+            last_row = first_row + len(rows) - 1
+
+        # Second pass: keep only those rows.
+        stats.duplicates = self._keep_rows(
+            results_sheet, chunk_rows, last_row,
+            lambda row_number, row:
+                latest.get(tuple(row[:4]), row_number) == row_number,
+            stats
+        )
+        self._finish_compaction(results_sheet)
+        return stats
+
+    @property
+    def shard_key(self):
+        """
+        The spreadsheet and worksheet results are stored in.
+        """
+        return self.spreadsheet_name, self.results_sheet
+
+    def reshard_results(self, destination, chunk_rows=EXPORT_CHUNK_ROWS):
+        """
+        Move the results that belong in other shards to them.
+
+        Rows are first appended to the shards they belong in, then
+        removed here the way compaction removes duplicates, so sessions
+        can keep appending throughout. If it is interrupted between the
+        two, running it again finishes the move, and compact_results()
+        on the receiving shards removes the rows copied twice.
+
+        Parameters:
+        -----------
+        destination : callable
+            Takes an email address and returns the SheetsStorage of
+            the shard its results belong in.
+        chunk_rows : int
+            The most rows read or written per request.
+
+        Returns:
+        --------
+        CompactionStats
+            What was moved.
+
+        Raises:
+        -------
+        RuntimeError
+            If the results are being compacted or resharded.
+        """
+        results_sheet = self.results_worksheet()
+        self._start_compaction(results_sheet)
+        stats = CompactionStats()
+
+        # First pass: copy the rows that belong elsewhere, chunk_rows
+        # rows per shard per request.
+        outgoing = {}
+        last_row = 1
+        for first_row, rows in self._results_chunks(results_sheet,
+                                                    chunk_rows):
+            for row in rows:
+                if not row[0]:
+                    continue
+                shard = destination(row[0])
+                if shard.shard_key != self.shard_key:
+                    shard_rows = outgoing.setdefault(
+                        shard.shard_key, (shard, [])
+                    )[1]
+                    shard_rows.append(row)
+                    if len(shard_rows) >= chunk_rows:
+                        shard._append_rows(shard_rows)
+                        shard_rows.clear()
+            last_row = first_row + len(rows) - 1
+        for shard, shard_rows in outgoing.values():
+            shard._append_rows(shard_rows)
+
+        # Second pass: remove them here.
+        stats.rows_resharded = self._keep_rows(
+            results_sheet, chunk_rows, last_row,
+            lambda row_number, row:
+                destination(row[0]).shard_key == self.shard_key,
+            stats
+        )
+        self._finish_compaction(results_sheet)
+        return stats
+
+    def _keep_rows(self, results_sheet, chunk_rows, last_row, keep, stats):
+        """
+        Remove blank rows and the rows keep() rejects from rows 2 to
+        last_row, and return how many rows keep() rejected.
+
+        Sessions append below the last row, so only rows that were
+        there when the caller started are touched. Kept rows are moved
+        up over the rows already read, the rows left over are deleted
+        in one request, and nothing in between is ever blank, so
+        concurrent appends always land below.
+        """
+        removed = 0
+        write_row, pending = 2, []
+        for first_row, rows in self._results_chunks(
+                results_sheet, chunk_rows, last_row):
+            for row_number, row in enumerate(rows, start=first_row):
+                stats.rows_scanned += 1
+                if not row[0]:
+                    stats.blank_rows += 1
+                    continue
+                if not keep(row_number, row):
+                    removed += 1
+                    continue
+                if row_number != write_row:
+                    pending.append(row)
+                write_row += 1
+            if len(pending) >= chunk_rows:
+                self._rewrite_rows(results_sheet, write_row, pending,
+                                   stats)
+                pending = []
+        self._rewrite_rows(results_sheet, write_row, pending, stats)
+
+        if write_row <= last_row:
+            call_with_backoff(results_sheet.delete_rows, write_row, last_row)
+            stats.space_freed += (last_row - write_row + 1) * getattr(
+                results_sheet, "col_count", len(RESULTS_HEADER) + 1
+            )
+        return removed
+
+    def _results_chunks(self, results_sheet, chunk_rows, last_row=None):
+        """
+        Yield (first row, rows) for consecutive chunks of result rows
+        up to last_row, or to the end of the sheet. Rows are padded to
+        the result and Write Key columns, and cleared rows come back
+        as blank rows.
+        """
+        width = len(RESULTS_HEADER) + 1
+        last_column = chr(ord('A') + width - 1)
+        # A chunk ending in cleared rows comes back short too, so only
+        # one reaching the worksheet's last row ends the sheet.
+        sheet_rows = getattr(results_sheet, "row_count", 0)
+        first_row = 2
+        while last_row is None or first_row <= last_row:
+            end = first_row + chunk_rows - 1
+            if last_row is not None:
+                end = min(end, last_row)
+            values = call_with_backoff(
+                results_sheet.get, f"A{first_row}:{last_column}{end}"
+            )
+            rows = [row + [''] * (width - len(row)) for row in values]
+            if (last_row is None and len(rows) < end - first_row + 1
+                    and end >= sheet_rows):
+                yield first_row, rows
+                return
+            # Put back the cleared rows the API left out at the end.
+            rows.extend([''] * width
+                        for _ in range(end - first_row + 1 - len(rows)))
+            yield first_row, rows
+            first_row = end + 1
+
+    @staticmethod
+    def _rewrite_rows(results_sheet, write_row, rows, stats):
+        """
+        Write rows so the last one lands just above write_row.
+        """
+        if not rows:
+            return
+        first_row = write_row - len(rows)
+        last_column = chr(ord('A') + len(RESULTS_HEADER))
+        call_with_backoff(results_sheet.batch_update, [{
+            "range": f"A{first_row}:{last_column}{write_row - 1}",
+            "values": rows
+        }])
+        stats.rows_moved += len(rows)
+
+    def _start_compaction(self, results_sheet):
+        """
+        Mark the sheet as being compacted, so a second compaction
+        doesn't start and sessions rebuild their email index.
+
+        Raises:
+        -------
+        RuntimeError
+            If another compaction is running.
+        """
+        generation = self._cell_value(
+            call_with_backoff(results_sheet.get, GENERATION_CELL)
+        )
+        parts = generation.split(":")
+        if (parts[0] == COMPACTING and len(parts) == 3
+                and time.time() - float(parts[1]) < COMPACTION_TIMEOUT):
+            raise RuntimeError("The results are already being compacted")
+        self._set_generation(
+            results_sheet,
+            f"{COMPACTING}:{time.time():.0f}:{uuid.uuid4().hex}"
+        )
+
+    def _finish_compaction(self, results_sheet):
+        """
+        Start a new sheet generation, so every session rebuilds its
+        email index against the moved rows.
+        """
+        self._set_generation(results_sheet, uuid.uuid4().hex)
+        with self._index_lock:
+            self._email_index = None
+
+    @staticmethod
+    def _cell_value(values):
+        """
+        Return the value of a single-cell range, '' if it is empty.
+        """
+        return values[0][0] if values and values[0] else ''
+
+    @staticmethod
+    def _set_generation(results_sheet, generation):
+        call_with_backoff(results_sheet.batch_update, [{
+            "range": GENERATION_CELL, "values": [[generation]]
+        }])
+
+    def fetch_results(self, email):
+        ranges = self.email_index().ranges(email)
+        if not ranges:
+            return []
+
+        return self._read_ranges(email, ranges)
+
+    def iter_results(self, email, chunk_rows=DEFAULT_CHUNK_ROWS):
+        # Split the email's row ranges into pieces of at most
+        # chunk_rows rows in total, one batch_get per piece.
+        chunk, chunk_size = [], 0
+        for first_row, last_row in self.email_index().ranges(email):
+            while first_row <= last_row:
+                end = min(last_row, first_row + chunk_rows - chunk_size - 1)
+                chunk.append((first_row, end))
+                chunk_size += end - first_row + 1
+                first_row = end + 1
+                if chunk_size == chunk_rows:
+                    results = self._read_ranges(email, chunk)
+                    if results:
+                        yield results
+                    chunk, chunk_size = [], 0
+        if chunk:
+            results = self._read_ranges(email, chunk)
+            if results:
+                yield results
+
+    def iter_all_results(self, chunk_rows=EXPORT_CHUNK_ROWS):
+        # Consecutive row ranges after the header. The API leaves out
+        # trailing blank rows, so a range that comes back short may
+        # only have cleared rows at its end. It means the end of the
+        # sheet only once the range reaches the worksheet's last row.
+        results_sheet = self.results_worksheet()
+        sheet_rows = getattr(results_sheet, "row_count", 0)
+        first_row = 2
+        while True:
+            last_row = first_row + chunk_rows - 1
+            values = call_with_backoff(
+                results_sheet.get, f"A{first_row}:E{last_row}"
+            )
+            results = [
+                dict(zip(
+                    RESULTS_HEADER,
+                    row + [''] * (len(RESULTS_HEADER) - len(row))
+                ))
+                for row in values if row
+            ]
+            if results:
+                yield results
+            if len(values) < chunk_rows and last_row >= sheet_rows:
+                return
+            first_row = last_row + 1
+
+    def _read_ranges(self, email, ranges):
+        """
+        Read row ranges of user_results with one batch_get, keeping the
+        rows that belong to email.
+        """
+        results_sheet = self.results_worksheet()
+        value_ranges = call_with_backoff(results_sheet.batch_get, [
+            f"A{first_row}:E{last_row}" for first_row, last_row in ranges
+        ])
+
+        user_data = []
+        for value_range in value_ranges:
+            for row in value_range:
+                row = row + [''] * (len(RESULTS_HEADER) - len(row))
+                # Rows can move if the sheet is edited by hand, so only
+                # trust rows that still carry the requested email.
+                if row[0] == email:
+                    user_data.append(dict(zip(RESULTS_HEADER, row)))
+        return user_data
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    Local storage in a SQLite database with indexed tables.
+
+    Attributes:
+    -----------
+    path : str
+        The database file.
+    connection : sqlite3.Connection
+        The open database connection.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path=DEFAULT_DATABASE):
+        """
+        Opens (and if needed creates) the database.
+
+        Parameters:
+        -----------
+        path : str
+            The database file, or ':memory:' for a throwaway database.
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.create_tables()
+
+    def reset_connections(self):
+        self.connection = sqlite3.connect(
+            self.path, check_same_thread=False
+        )
+
+    def create_tables(self):
+        """
+        Create the plant_list and user_results tables and their indexes.
+        """
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS plant_list (
+                    row_id INTEGER PRIMARY KEY,
+                    id TEXT NOT NULL UNIQUE,
+                    name TEXT,
+                    category TEXT,
+                    germination TEXT,
+                    seedling_stage TEXT,
+                    vegetative_growth TEXT,
+                    flowering_root_development TEXT,
+                    fruit_development TEXT,
+                    description TEXT
+                );
+                CREATE TABLE IF NOT EXISTS user_results (
+                    row_id INTEGER PRIMARY KEY,
+                    email TEXT NOT NULL,
+                    plant TEXT,
+                    date_type TEXT,
+                    date TEXT,
+                    corresponding_date TEXT
+                );
+                CREATE INDEX IF NOT EXISTS user_results_email
+                    ON user_results (email);
+                CREATE TABLE IF NOT EXISTS applied_writes (
+                    write_key TEXT PRIMARY KEY
+                );
+            """)
+
+    def import_plants(self, rows):
+        """
+        Replace the plant catalog with the given rows.
+
+        Parameters:
+        -----------
+        rows : list
+            Plant rows in the 'plant_list' layout, header row first.
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM plant_list")
+            self.connection.executemany(
+                "INSERT INTO plant_list (id, name, category, germination, "
+                "seedling_stage, vegetative_growth, "
+                "flowering_root_development, fruit_development, "
+                "description) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (list(row) + [''] * len(PLANT_HEADER))[:len(PLANT_HEADER)]
+                    for row in rows[1:]
+                ]
+            )
+
+    def load_plants(self):
+        cursor = self.connection.execute(
+            "SELECT id, name, category, germination, seedling_stage, "
+            "vegetative_growth, flowering_root_development, "
+            "fruit_development, description "
+            "FROM plant_list ORDER BY row_id"
+        )
+        return [list(PLANT_HEADER)] + [list(row) for row in cursor]
+
+    def append_results(self, user_data):
+        rows = [
+            [user_data.email] + result for result in user_data.get_data()
+        ]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO user_results (email, plant, date_type, date, "
+                "corresponding_date) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    def append_batch(self, batches, recheck=()):
+        # A key is recorded in the same transaction as its rows, so
+        # every batch is checked, not only the ones in recheck.
+        written = 0
+        with self.connection:
+            for key, user_data in batches:
+                applied = self.connection.execute(
+                    "INSERT OR IGNORE INTO applied_writes (write_key) "
+                    "VALUES (?)", (key,)
+                )
+                if not applied.rowcount:
+                    continue
+                rows = [
+                    [user_data.email] + result
+                    for result in user_data.get_data()
+                ]
+                self.connection.executemany(
+                    "INSERT INTO user_results (email, plant, date_type, "
+                    "date, corresponding_date) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                written += len(rows)
+        return written
+
+    def fetch_results(self, email):
+        cursor = self.connection.execute(
+            "SELECT email, plant, date_type, date, corresponding_date "
+            "FROM user_results WHERE email = ? ORDER BY row_id",
+            (email,)
+        )
+        return [dict(zip(RESULTS_HEADER, row)) for row in cursor]
+
+    def iter_results(self, email, chunk_rows=DEFAULT_CHUNK_ROWS):
+        # Keyset pagination on the (email) index: each chunk starts
+        # after the last row_id of the previous one.
+        last_row_id = 0
+        while True:
+            rows = self.connection.execute(
+                "SELECT row_id, email, plant, date_type, date, "
+                "corresponding_date FROM user_results "
+                "WHERE email = ? AND row_id > ? ORDER BY row_id LIMIT ?",
+                (email, last_row_id, chunk_rows)
+            ).fetchall()
+            if not rows:
+                return
+            last_row_id = rows[-1][0]
+            yield [dict(zip(RESULTS_HEADER, row[1:])) for row in rows]
+            if len(rows) < chunk_rows:
+                return
+
+    def compact_results(self, chunk_rows=EXPORT_CHUNK_ROWS):
+        # One DELETE keeps the highest row_id of each key. It runs in a
+        # transaction, so concurrent appends wait for it.
+        stats = CompactionStats("bytes")
+        size = self._database_size()
+        with self.connection:
+            stats.rows_scanned = self.connection.execute(
+                "SELECT COUNT(*) FROM user_results"
+            ).fetchone()[0]
+            stats.duplicates = self.connection.execute(
+                "DELETE FROM user_results WHERE row_id NOT IN ("
+                "SELECT MAX(row_id) FROM user_results "
+                "GROUP BY email, plant, date_type, date)"
+            ).rowcount
+        self.connection.execute("VACUUM")
+        stats.space_freed = max(0, size - self._database_size())
+        return stats
+
+    def _database_size(self):
+        page_count = self.connection.execute("PRAGMA page_count").fetchone()
+        page_size = self.connection.execute("PRAGMA page_size").fetchone()
+        return page_count[0] * page_size[0]
+
+    def iter_all_results(self, chunk_rows=EXPORT_CHUNK_ROWS):
+        # Keyset pagination on the primary key, like iter_results().
+        last_row_id = 0
+        while True:
+            rows = self.connection.execute(
+                "SELECT row_id, email, plant, date_type, date, "
+                "corresponding_date FROM user_results "
+                "WHERE row_id > ? ORDER BY row_id LIMIT ?",
+                (last_row_id, chunk_rows)
+            ).fetchall()
+            if not rows:
+                return
+            last_row_id = rows[-1][0]
+            yield [dict(zip(RESULTS_HEADER, row[1:])) for row in rows]
+            if len(rows) < chunk_rows:
+                return
+
+
+def get_storage(kind=None):
+    """
+    Create the storage backend selected by config.
+
+    Parameters:
+    -----------
+    kind : str, optional
+        'sheets', 'sqlite' or 'fake' (SheetsStorage on an offline
+        FakeSpreadsheet, see classes.fake_sheets). Defaults to the
+        CROP_CALENDAR_STORAGE environment variable, or 'sheets' if it
+        is not set.
+
+    Returns:
+    --------
+    StorageBackend
+        The selected storage backend.
+
+    Raises:
+    -------
+    ValueError
+        If the backend name is not recognised.
+    """
+    kind = (kind or os.environ.get(STORAGE_ENV, 'sheets')).lower()
+    if kind == 'sqlite':
+        return SQLiteStorage(os.environ.get(DATABASE_ENV, DEFAULT_DATABASE))
+    if kind == 'sheets':
+        storage = SheetsStorage()
+    elif kind == 'fake':
+        from classes.fake_sheets import FakeSpreadsheet
+        storage = SheetsStorage(
+            spreadsheet=FakeSpreadsheet.from_env(),
+            index_path=local_path(INDEX_ENV, DEFAULT_INDEX, kind)
+        )
+        # Keeps the catalog cache from taking fake plants for real ones.
+        storage.name = 'fake'
+    else:
+        raise ValueError(f"Unknown storage backend '{kind}'")
+    # Imported here, as classes.sharding builds on this module.
+    from classes.sharding import sharded_storage
+    return sharded_storage(storage)
+
+
+if __name__ == "__main__":
+    # Seed the local database with the catalog from Google Sheets:
+    #     python3 -m classes.storage
+    sqlite_storage = get_storage('sqlite')
+    sqlite_storage.import_plants(get_storage('sheets').load_plants())
+    print(" Plant catalog copied into the SQLite database.")
@@ -0,0 +1,412 @@
+import random
+from datetime import date
+
+import numpy as np
+
+from classes.batch_runner import DATE_TYPES
+
+SUGGESTIONS_PER_SLOT = 3
+
+
+class _Node:
+    """
+    A node of an IntervalTree, holding one interval and the latest end
+    in its subtree.
+    """
+
+    __slots__ = (
+        "start", "end", "item", "priority", "max_end", "left", "right"
+    )
+
+    def __init__(self, start, end, item):
+        self.start = start
+        self.end = end
+        self.item = item
+        self.priority = random.random()
+        self.max_end = end
+        self.left = None
+        self.right = None
+
+    def update(self):
+        self.max_end = max(
+            self.end,
+            self.left.max_end if self.left else self.end,
+            self.right.max_end if self.right else self.end
+        )
+
+
+class IntervalTree:
+    """
+    A set of half-open [start, end) intervals, ordered by start in a
+    randomized balanced search tree (a treap). Each node also keeps the
+    latest end in its subtree, so a query skips every subtree that ends
+    before the queried range starts.
+
+    Adding an interval and checking a range for overlaps take O(log n)
+    expected time. Listing the k overlapping intervals or the free
+    slots between them takes O(log n + k).
+
+    Methods:
+    --------
+    add(start, end, item)
+        Adds an interval.
+    overlaps(start, end)
+        Returns the intervals overlapping a range, in start order.
+    is_free(start, end)
+        Returns True if no interval overlaps a range.
+    free_slots(start, end)
+        Returns the gaps between intervals within a range.
+    """
+
+    def __init__(self, intervals=()):
+        """
+        Initializes the tree.
+
+        Parameters:
+        -----------
+        intervals : iterable
+            (start, end, item) tuples to add.
+        """
+        self._root = None
+        self._size = 0
+        for start, end, item in intervals:
+            self.add(start, end, item)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        """
+        Yields every (start, end, item) interval in start order.
+        """
+        stack, node = [], self._root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.start, node.end, node.item
+            node = node.right
+
+    def add(self, start, end, item=None):
+        """
+        Adds an interval.
+
+        Parameters:
+        -----------
+        start, end : comparable
+            The interval's start and (exclusive) end, e.g. dates.
+        item : object
+            A value stored with the interval.
+        """
+        self._root = self._insert(self._root, _Node(start, end, item))
+        self._size += 1
+
+    def _insert(self, node, new):
+        """
+        Insert new below node and return the subtree's new root,
+        rotating new up while its priority is higher.
+        """
+        if node is None:
+            return new
+        if new.start < node.start:
+            node.left = self._insert(node.left, new)
+            if node.left.priority > node.priority:
+                node = self._rotate_right(node)
+        else:
+            node.right = self._insert(node.right, new)
+            if node.right.priority > node.priority:
+                node = self._rotate_left(node)
+        node.update()
+        return node
+
+    @staticmethod
+    def _rotate_right(node):
+        left = node.left
+        node.left, left.right = left.right, node
+        node.update()
+        left.update()
+        return left
+
+    @staticmethod
+    def _rotate_left(node):
+        right = node.right
+        node.right, right.left = right.left, node
+        node.update()
+        right.update()
+        return right
+
+    def overlaps(self, start, end):
+        """
+        Returns the intervals overlapping [start, end).
+
+        Parameters:
+        -----------
+        start, end : comparable
+            The range.
+
+        Returns:
+        --------
+        list
+            (start, end, item) tuples in start order.
+        """
+        found = []
+        self._collect(self._root, start, end, found)
+        return found
+
+    def _collect(self, node, start, end, found):
+        if node is None or node.max_end <= start:
+            return
+        self._collect(node.left, start, end, found)
+        if node.start < end:
+            if node.end > start:
+                found.append((node.start, node.end, node.item))
+            self._collect(node.right, start, end, found)
+
+    def is_free(self, start, end):
+        """
+        Returns True if no interval overlaps [start, end).
+
+        Parameters:
+        -----------
+        start, end : comparable
+            The range.
+
+        Returns:
+        --------
+        bool
+            True if the range is free.
+        """
+        node = self._root
+        while node is not None:
+            if node.start < end and node.end > start:
+                return False
+            # An overlap on the left must end after start. Otherwise
+            # only intervals starting later can overlap.
+            if node.left is not None and node.left.max_end > start:
+                node = node.left
+            elif node.start < end:
+                node = node.right
+            else:
+                return True
+        return True
+
+    def free_slots(self, start, end):
+        """
+        Returns the gaps within [start, end) that no interval covers.
+
+        Parameters:
+        -----------
+        start, end : comparable
+            The range.
+
+        Returns:
+        --------
+        list
+            (start, end) tuples in order.
+        """
+        slots = []
+        covered = start
+        for interval_start, interval_end, _ in self.overlaps(start, end):
+            if interval_start > covered:
+                slots.append((covered, interval_start))
+            covered = max(covered, interval_end)
+        if covered < end:
+            slots.append((covered, end))
+        return slots
+
+
+def schedule_intervals(records):
+    """
+    Convert stored results to growing intervals.
+
+    Parameters:
+    -----------
+    records : iterable
+        Stored records with the keys 'Plant', 'Date Type', 'Date' and
+        'Corresponding Date', as returned by fetch_results().
+
+    Returns:
+    --------
+    list
+        (planting date, harvest date, plant name) tuples. Records with
+        unreadable dates are skipped.
+    """
+    intervals = []
+    for record in records:
+        try:
+            date_value = date.fromisoformat(str(record["Date"]))
+            other = date.fromisoformat(str(record["Corresponding Date"]))
+        except (KeyError, ValueError):
+            continue
+        if record.get("Date Type") == DATE_TYPES['H']:
+            date_value, other = other, date_value
+        intervals.append((date_value, other, record.get("Plant", "")))
+    return intervals
+
+
+class SuccessionPlanner:
+    """
+    Packs growing intervals into a number of beds and suggests crops
+    for the slots left free.
+
+    Each bed is an IntervalTree, so checking whether a crop fits a bed
+    and finding a bed's free slots cost O(log n) however many schedules
+    a user has. Suggestions come from the catalog's total growth times
+    sorted once, so finding the crops that fit a slot is a binary
+    search.
+
+    Attributes:
+    -----------
+    catalog : PlantCatalog
+        The plant catalog suggestions are taken from.
+
+    Methods:
+    --------
+    conflicts(intervals)
+        Returns the pairs of intervals that overlap.
+    pack(intervals, beds)
+        Assigns intervals to beds.
+    suggest(days, limit)
+        Returns the plants that grow within a number of days.
+    plan(intervals, beds, season_end)
+        Packs intervals and suggests crops for every free slot.
+    """
+
+    def __init__(self, catalog):
+        """
+        Initializes the planner.
+
+        Parameters:
+        -----------
+        catalog : PlantCatalog
+            The plant catalog.
+        """
+        self.catalog = catalog
+        # Plants with a known growth time, shortest first.
+        order = np.argsort(catalog.total_growth, kind="stable")
+        order = order[catalog.total_growth[order] > 0]
+        self._order = order
+        self._growth = catalog.total_growth[order]
+
+    @staticmethod
+    def conflicts(intervals):
+        """
+        Returns the pairs of intervals that overlap, i.e. crops that
+        would need a bed each at the same time.
+
+        Parameters:
+        -----------
+        intervals : list
+            (start, end, item) tuples.
+
+        Returns:
+        --------
+        list
+            Pairs of overlapping (start, end, item) tuples.
+        """
+        tree = IntervalTree()
+        pairs = []
+        for interval in sorted(intervals, key=lambda value: value[:2]):
+            pairs.extend(
+                (earlier, interval)
+                for earlier in tree.overlaps(interval[0], interval[1])
+            )
+            tree.add(*interval)
+        return pairs
+
+    @staticmethod
+    def pack(intervals, beds):
+        """
+        Assigns intervals to beds, earliest start first, each to the
+        first bed that is free for its whole interval. Taken in start
+        order, this needs no more beds than the largest number of
+        intervals overlapping at once.
+
+        Parameters:
+        -----------
+        intervals : list
+            (start, end, item) tuples.
+        beds : int
+            The number of beds.
+
+        Returns:
+        --------
+        tuple
+            A list with an IntervalTree per bed, and the intervals that
+            didn't fit any bed.
+        """
+        trees = [IntervalTree() for _ in range(beds)]
+        unplaced = []
+        for interval in sorted(intervals, key=lambda value: value[:2]):
+            for tree in trees:
+                if tree.is_free(interval[0], interval[1]):
+                    tree.add(*interval)
+                    break
+            else:
+                unplaced.append(interval)
+        return trees, unplaced
+
+    def suggest(self, days, limit=SUGGESTIONS_PER_SLOT):
+        """
+        Returns the plants that are ready to harvest within a number of
+        days, longest growing first, so they make the most of a slot.
+
+        Parameters:
+        -----------
+        days : int
+            The length of the slot.
+        limit : int
+            The most plants to return.
+
+        Returns:
+        --------
+        list
+            PlantView objects.
+        """
+        fits = int(np.searchsorted(self._growth, days, side="right"))
+        return [
+            self.catalog.view(int(position))
+            for position in self._order[max(0, fits - limit):fits][::-1]
+        ]
+
+    def plan(self, intervals, beds, season_end, limit=SUGGESTIONS_PER_SLOT):
+        """
+        Packs intervals into beds and suggests crops for every free
+        slot between the first planting and season_end that is long
+        enough for at least one plant.
+
+        Parameters:
+        -----------
+        intervals : list
+            (start, end, item) tuples.
+        beds : int
+            The number of beds.
+        season_end : date
+            The last day crops can grow until.
+        limit : int
+            The most plants suggested per slot.
+
+        Returns:
+        --------
+        tuple
+            A list per bed of (start, end, item) tuples, where free
+            slots have a list of suggested PlantViews as their item,
+            and the intervals that didn't fit any bed.
+        """
+        trees, unplaced = self.pack(intervals, beds)
+        if not intervals:
+            return [[] for _ in trees], unplaced
+
+        season_start = min(interval[0] for interval in intervals)
+        plans = []
+        for tree in trees:
+            slots = [
+                (start, end, self.suggest((end - start).days, limit))
+                for start, end in tree.free_slots(season_start, season_end)
+            ]
+            plans.append(sorted(
+                list(tree) + [slot for slot in slots if slot[2]],
+                key=lambda entry: entry[:2]
+            ))
+        return plans, unplaced
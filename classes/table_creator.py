@@ -1,7 +1,24 @@
+import hashlib
+import json
+import math
+import shutil
+
 from prettytable import PrettyTable
 
+MAX_CACHED_TABLES = 32
+PADDING_WIDTH = 5
+# Screen lines used around the table by the plant menu: the title,
+# instructions, search and paging hints, prompt and an error message.
+RESERVED_LINES = 13
+MIN_PAGE_ROWS = 5
+
 
 class TableCreator:
+    # Rendered pages shared by every TableCreator, keyed on the layout
+    # and the ids and names on the page, so editing a plant only
+    # re-renders the pages it appears on.
+    _rendered = {}
+
     def __init__(self, data_list):
         """
         Initialize the TableCreator with the data list
@@ -12,47 +29,158 @@ class TableCreator:
         """
         self.data_list = data_list
         self.data_items = data_list[1:]  # Exclude the header row
+        self._item_width = None
+
+    def split_data(self, columns=2, items=None):
+        """
+        Split the data into columns, filling each column top to bottom.
+
+        Args:
+            columns (int): The number of columns. Defaults to two.
+            items (list, optional): The items to split. Defaults to
+                all data items.
+
+        Returns:
+            tuple: One list of items per column, all the same length.
+            Shorter columns are padded with empty items.
+        """
+        if items is None:
+            items = self.data_items
+        column_length = max(1, math.ceil(len(items) / columns))
 
-    def split_data(self):
+        split = []
+        for column in range(columns):
+            column_items = items[
+                column * column_length:(column + 1) * column_length
+            ]
+            column_items += [['', '']] * (column_length - len(column_items))
+            split.append(column_items)
+
+        return tuple(split)
+
+    def item_width(self):
+        """
+        Return the width of the widest "number. name" entry.
+
+        Returns:
+            int: The width in characters.
         """
-        Split the data into two columns.
+        if self._item_width is None:
+            self._item_width = max(
+                (len(f"{row[0]}. {row[1]}") for row in self.data_items),
+                default=0
+            )
+        return self._item_width
+
+    def layout(self, width, height):
+        """
+        Work out how many columns fit the terminal width and how many
+        rows of the table fit on one screen.
+
+        Args:
+            width (int): The terminal width.
+            height (int): The terminal height.
 
         Returns:
-            tuple: Two lists representing the items in the
-            first and second columns.
+            tuple: The number of columns and rows per page.
         """
-        total_list_items = len(self.data_items)
-        half_length = (total_list_items + 1) // 2
+        column_width = self.item_width() + 2 * PADDING_WIDTH
+        columns = max(1, (width - 1) // column_width)
+        rows = max(MIN_PAGE_ROWS, height - RESERVED_LINES)
+        return columns, rows
 
-        column1 = self.data_items[:half_length]
-        column2 = self.data_items[half_length:]
+    def page_count(self, width=None, height=None):
+        """
+        Return the number of pages the data takes up on the terminal.
 
-        if len(column1) > len(column2):
-            column2.append(['', ''])
+        Args:
+            width (int, optional): The terminal width. Defaults to the
+                width of the current terminal.
+            height (int, optional): The terminal height. Defaults to
+                the height of the current terminal.
 
-        return column1, column2
+        Returns:
+            int: The number of pages, at least one.
+        """
+        width, height = self._terminal_size(width, height)
+        columns, rows = self.layout(width, height)
+        return max(1, math.ceil(len(self.data_items) / (columns * rows)))
 
-    def create_main_table(self):
+    def create_main_table(self, columns=2, items=None):
         """
-        Create and return a PrettyTable with data split into two columns.
+        Create and return a PrettyTable with data split into columns.
+
+        Args:
+            columns (int): The number of columns. Defaults to two.
+            items (list, optional): The items to show. Defaults to all
+                data items.
 
         Returns:
-            PrettyTable: The table with two columns of data.
+            PrettyTable: The table with the columns of data.
         """
-        column1, column2 = self.split_data()
+        split = self.split_data(columns, items)
 
         table = PrettyTable()
 
         table.border = False
         table.align = "l"
         table.header = False
-        table.padding_width = 5
+        table.padding_width = PADDING_WIDTH
 
-        for row1, row2 in zip(column1, column2):
-            col1_display = f"{row1[0]}. {row1[1]}"
-            col2_display = (
-                f"{row2[0]}. {row2[1]}" if row2[0] and row2[1] else ""
-            )
-            table.add_row([col1_display, col2_display])
+        for row in zip(*split):
+            table.add_row([
+                f"{item[0]}. {item[1]}" if item[0] and item[1] else ""
+                for item in row
+            ])
 
         return table
+
+    def render_page(self, page, width=None, height=None):
+        """
+        Return one screen of the table as a string. Only the items on
+        that page are rendered, so the output stays the same size no
+        matter how big the catalog is. Pages are cached on what they
+        show, so a page is reused until a plant on it changes.
+
+        Args:
+            page (int): The page number, starting at zero.
+            width (int, optional): The terminal width. Defaults to the
+                width of the current terminal.
+            height (int, optional): The terminal height. Defaults to
+                the height of the current terminal.
+
+        Returns:
+            str: The rendered page.
+        """
+        width, height = self._terminal_size(width, height)
+        columns, rows = self.layout(width, height)
+        per_page = columns * rows
+        items = self.data_items[page * per_page:(page + 1) * per_page]
+        digest = hashlib.sha1(
+            json.dumps([item[:2] for item in items]).encode()
+        ).hexdigest()
+        return self._cached(
+            ("page", columns, rows, digest),
+            lambda: self.create_main_table(columns, items).get_string()
+        )
+
+    @staticmethod
+    def _terminal_size(width, height):
+        """
+        Fill in the current terminal size where none is given.
+        """
+        size = shutil.get_terminal_size()
+        return width or size.columns, height or size.lines
+
+    @staticmethod
+    def _cached(key, render):
+        """
+        Return the cached rendering for key, rendering it on a miss.
+        """
+        rendered = TableCreator._rendered.get(key)
+        if rendered is None:
+            if len(TableCreator._rendered) >= MAX_CACHED_TABLES:
+                TableCreator._rendered.clear()
+            rendered = render()
+            TableCreator._rendered[key] = rendered
+        return rendered
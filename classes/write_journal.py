@@ -0,0 +1,453 @@
+import fcntl
+import json
+import os
+import sys
+import threading
+import uuid
+
+from classes.storage import is_permanent_error
+from classes.user_data import UserData
+
+JOURNAL_ENV = "CROP_CALENDAR_JOURNAL"
+DEFAULT_JOURNAL = ".results_journal.jsonl"
+FLUSH_INTERVAL = 2.0
+MAX_BATCH_ROWS = 500
+
+
+class WriteJournal:
+    """
+    A crash-safe, append-only journal of results waiting to be stored.
+
+    Each line is a JSON record. 'write' records hold one user's rows
+    and an idempotency key, 'attempt' records mark keys that are being
+    sent to storage, 'ack' records mark keys that have been stored and
+    'dead' records mark keys storage rejected, whose writes are moved
+    to '<path>.dead'. Every record is fsync'd before append() returns,
+    and compact() drops everything but the pending writes.
+
+    Attributes:
+    -----------
+    path : str
+        The journal file.
+
+    Methods:
+    --------
+    append(user_data)
+        Journals a user's rows and returns their idempotency key.
+    pending()
+        Returns the writes that have not been acknowledged.
+    mark_attempted(keys)
+        Records that keys are about to be sent to storage.
+    acknowledge(keys)
+        Records that keys have been stored.
+    dead_letter(writes, error)
+        Moves writes that storage rejected out of the pending ones.
+    compact()
+        Rewrites the journal with only the pending writes.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL):
+        """
+        Initializes the journal.
+
+        Parameters:
+        -----------
+        path : str
+            The journal file. It is created on the first write.
+        """
+        self.path = path
+
+    def _write(self, record):
+        """
+        Append one record and fsync it. The file lock keeps records
+        from concurrent sessions from interleaving.
+        """
+        line = (json.dumps(record) + "\n").encode()
+        fd = self._open_locked(os.O_RDWR | os.O_APPEND | os.O_CREAT)
+        try:
+            # End a torn line left by a crash first, so only it is lost
+            # and not this record too.
+            size = os.fstat(fd).st_size
+            if size and os.pread(fd, 1, size - 1) != b"\n":
+                line = b"\n" + line
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _open_locked(self, flags):
+        """
+        Open the journal file and take its lock. If compact() replaced
+        the file while we waited for the lock, the new one is opened
+        instead.
+        """
+        while True:
+            fd = os.open(self.path, flags, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if os.fstat(fd).st_ino == os.stat(self.path).st_ino:
+                    return fd
+            except FileNotFoundError:
+                pass
+            except BaseException:
+                os.close(fd)
+                raise
+            os.close(fd)
+
+    def _records(self):
+        """
+        Read every complete record. A torn last line left by a crash
+        is ignored.
+        """
+        try:
+            with open(self.path) as journal:
+                lines = journal.readlines()
+        except FileNotFoundError:
+            return []
+
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records
+
+    def append(self, user_data):
+        """
+        Journals a user's rows.
+
+        Parameters:
+        -----------
+        user_data : UserData
+            The rows to store.
+
+        Returns:
+        --------
+        str
+            The idempotency key of the write.
+        """
+        key = uuid.uuid4().hex
+        self._write({
+            "op": "write",
+            "key": key,
+            "email": user_data.email,
+            "rows": user_data.get_data()
+        })
+        return key
+
+    def pending(self):
+        """
+        Returns the writes that have not been acknowledged.
+
+        Returns:
+        --------
+        list
+            Dicts with 'key', 'email', 'rows' and 'attempted', the
+            last being True if an earlier flush may have stored them.
+        """
+        writes = {}
+        attempted = set()
+        for record in self._records():
+            op = record.get("op")
+            if op == "write":
+                writes[record["key"]] = record
+            elif op == "attempt":
+                attempted.update(record["keys"])
+            elif op in ("ack", "dead"):
+                for key in record["keys"]:
+                    writes.pop(key, None)
+        return [
+            dict(write, attempted=write["key"] in attempted)
+            for write in writes.values()
+        ]
+
+    def mark_attempted(self, keys):
+        """
+        Records that keys are about to be sent to storage, so a crash
+        mid-request makes the next flush check before resending.
+
+        Parameters:
+        -----------
+        keys : list
+            The idempotency keys.
+        """
+        self._write({"op": "attempt", "keys": list(keys)})
+
+    def acknowledge(self, keys):
+        """
+        Records that keys have been stored.
+
+        Parameters:
+        -----------
+        keys : list
+            The idempotency keys.
+        """
+        self._write({"op": "ack", "keys": list(keys)})
+
+    def dead_letter(self, writes, error):
+        """
+        Moves writes that storage rejected out of the pending ones, so
+        they don't hold up the writes after them. Their rows are kept
+        in '<path>.dead' with the error, to be looked at by hand.
+
+        Parameters:
+        -----------
+        writes : list
+            The pending writes, as returned by pending().
+        error : Exception
+            Why storage rejected them.
+        """
+        lines = "".join(
+            json.dumps({
+                "key": write["key"],
+                "email": write["email"],
+                "rows": write["rows"],
+                "error": str(error)
+            }) + "\n"
+            for write in writes
+        ).encode()
+        fd = os.open(f"{self.path}.dead",
+                     os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, lines)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._write({
+            "op": "dead", "keys": [write["key"] for write in writes]
+        })
+
+    def compact(self):
+        """
+        Rewrites the journal with only the pending writes, so stored
+        writes don't pile up while others are failing. The new journal
+        is written to a temporary file and renamed over the old one, so
+        a crash leaves one or the other.
+        """
+        try:
+            fd = self._open_locked(os.O_RDWR)
+        except FileNotFoundError:
+            return
+        try:
+            records = self._records()
+            pending = self.pending()
+            if not pending:
+                os.ftruncate(fd, 0)
+                os.fsync(fd)
+                return
+            attempted = [write["key"] for write in pending
+                         if write["attempted"]]
+            lines = [
+                {key: value for key, value in write.items()
+                 if key != "attempted"}
+                for write in pending
+            ]
+            if attempted:
+                lines.append({"op": "attempt", "keys": attempted})
+            if len(lines) >= len(records):
+                return
+            temporary = f"{self.path}.tmp"
+            with open(temporary, "w") as journal:
+                journal.writelines(json.dumps(line) + "\n" for line in lines)
+                journal.flush()
+                os.fsync(journal.fileno())
+            os.replace(temporary, self.path)
+        finally:
+            os.close(fd)
+
+
+class WriteBehindQueue:
+    """
+    Stores results in the background from a WriteJournal.
+
+    enqueue() only writes to the local journal, so saving costs local
+    disk latency. A flusher thread sends journaled writes to storage in
+    bulk, one append per batch, using each write's key so a retry never
+    stores a write twice. Writes left behind by a crashed session are
+    picked up by the next flush in any session.
+
+    Attributes:
+    -----------
+    storage : StorageBackend
+        Where the results are stored.
+    journal : WriteJournal
+        The local journal.
+
+    Methods:
+    --------
+    enqueue(user_data)
+        Journals a user's rows and wakes the flusher.
+    start()
+        Starts the background flusher thread.
+    flush(wait)
+        Sends pending writes to storage.
+    drain()
+        Flushes until nothing is pending.
+    pending_count()
+        Returns the number of writes waiting to be stored.
+    """
+
+    def __init__(self, storage, journal, interval=FLUSH_INTERVAL):
+        """
+        Initializes the queue.
+
+        Parameters:
+        -----------
+        storage : StorageBackend
+            Where the results are stored.
+        journal : WriteJournal
+            The local journal.
+        interval : float
+            Seconds between background flushes when nothing wakes the
+            flusher earlier.
+        """
+        self.storage = storage
+        self.journal = journal
+        self.interval = interval
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def enqueue(self, user_data):
+        """
+        Journals a user's rows and wakes the flusher.
+
+        Parameters:
+        -----------
+        user_data : UserData
+            The rows to store.
+
+        Returns:
+        --------
+        str
+            The idempotency key of the write.
+        """
+        key = self.journal.append(user_data)
+        self._wake.set()
+        return key
+
+    def start(self):
+        """
+        Starts the background flusher thread.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="write-behind", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        """
+        Flusher loop. Errors are left in the journal and retried on the
+        next round.
+        """
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def flush(self, wait=False):
+        """
+        Sends pending writes to storage in batches. Only one process
+        flushes at a time.
+
+        Parameters:
+        -----------
+        wait : bool
+            If another process is flushing, wait for it to finish
+            instead of returning straight away.
+
+        Returns:
+        --------
+        int
+            The number of rows stored.
+        """
+        with self._flush_lock:
+            lock_fd = os.open(f"{self.journal.path}.lock",
+                              os.O_WRONLY | os.O_CREAT, 0o600)
+            try:
+                try:
+                    fcntl.flock(lock_fd, fcntl.LOCK_EX
+                                | (0 if wait else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    return 0
+                return self._flush_pending()
+            finally:
+                os.close(lock_fd)
+
+    def _flush_pending(self):
+        """
+        Send every pending write, MAX_BATCH_ROWS rows at a time.
+        """
+        stored = 0
+        pending = self.journal.pending()
+        while pending:
+            batch, rows = [], 0
+            while pending and (not batch or rows < MAX_BATCH_ROWS):
+                write = pending.pop(0)
+                batch.append(write)
+                rows += len(write["rows"])
+
+            stored += self._store(batch)
+        self.journal.compact()
+        return stored
+
+    def _store(self, batch):
+        """
+        Send one batch of pending writes. If storage rejects the batch
+        outright, each write is sent on its own, and the ones rejected
+        again are dead-lettered. Other errors leave the batch pending.
+        """
+        keys = [write["key"] for write in batch]
+        recheck = [write["key"] for write in batch if write["attempted"]]
+        self.journal.mark_attempted(keys)
+        try:
+            stored = self.storage.append_batch(
+                [
+                    (write["key"], UserData(write["email"], write["rows"]))
+                    for write in batch
+                ],
+                recheck=recheck
+            )
+        except Exception as error:
+            if not is_permanent_error(error):
+                raise
+            if len(batch) > 1:
+                return sum(self._store([write]) for write in batch)
+            self.journal.dead_letter(batch, error)
+            print(f"Storage rejected the results of {batch[0]['email']}: "
+                  f"{error}. They were moved to {self.journal.path}.dead",
+                  file=sys.stderr)
+            return 0
+        self.journal.acknowledge(keys)
+        return stored
+
+    def drain(self):
+        """
+        Flushes until nothing is pending, for example before showing a
+        user their stored data or before exiting.
+
+        Returns:
+        --------
+        int
+            The number of rows stored.
+        """
+        stored = 0
+        while self.pending_count():
+            stored += self.flush(wait=True)
+        return stored
+
+    def pending_count(self):
+        """
+        Returns the number of writes waiting to be stored.
+
+        Returns:
+        --------
+        int
+            The number of pending writes.
+        """
+        return len(self.journal.pending())
@@ -1,13 +1,37 @@
 const Pty = require('node-pty');
 const fs = require('fs');
+const { spawn } = require('child_process');
+
+// With CROP_CALENDAR_POOL_SIZE set, sessions are handed to a pool of warm
+// Python workers (pool.py) instead of starting run.py from scratch.
+const POOL_SIZE = parseInt(process.env.CROP_CALENDAR_POOL_SIZE || '0');
+const SESSION_SCRIPT = POOL_SIZE > 0 ? 'session.py' : 'run.py';
 
 exports.install = function () {
 
     ROUTE('/');
     WEBSOCKET('/', socket, ['raw']);
 
+    if (POOL_SIZE > 0) {
+        startPool();
+    }
+
 };
 
+function startPool() {
+
+    const pool = spawn('python3', ['pool.py'], {
+        cwd: process.env.PWD,
+        env: process.env,
+        stdio: 'inherit'
+    });
+
+    pool.on('exit', function (code, signal) {
+        console.log("Worker pool exited, restarting");
+        setTimeout(startPool, 1000);
+    });
+}
+
 function socket() {
 
     this.encodedecode = false;
@@ -16,7 +40,7 @@ function socket() {
     this.on('open', function (client) {
 
         // Spawn terminal
-        client.tty = Pty.spawn('python3', ['run.py'], {
+        client.tty = Pty.spawn('python3', [SESSION_SCRIPT], {
             name: 'xterm-color',
             cols: 80,
             rows: 24,
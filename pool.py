@@ -0,0 +1,245 @@
+"""
+A pool of warm Crop Calendar Planner workers.
+
+The pool process imports run.py, creates the storage backend and loads
+the plant catalog once, then forks worker processes that inherit all of
+it. session.py hands the terminal of each new websocket session to a
+free worker over a unix socket, so a session starts without paying for
+interpreter startup, imports, authorization or the catalog download.
+
+Configuration (environment variables):
+    CROP_CALENDAR_POOL_SIZE      Number of workers (default 4).
+    CROP_CALENDAR_POOL_QUEUE     Sessions that may wait for a free
+                                 worker (default 64).
+    CROP_CALENDAR_POOL_RECYCLE   Sessions a worker serves before it is
+                                 replaced by a fresh one (default 100).
+    CROP_CALENDAR_POOL_SOCKET    Path of the pool's unix socket.
+"""
+import json
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import traceback
+
+import run
+from classes import metrics
+
+POOL_SIZE_ENV = "CROP_CALENDAR_POOL_SIZE"
+POOL_QUEUE_ENV = "CROP_CALENDAR_POOL_QUEUE"
+POOL_RECYCLE_ENV = "CROP_CALENDAR_POOL_RECYCLE"
+POOL_SOCKET_ENV = "CROP_CALENDAR_POOL_SOCKET"
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "crop_calendar.sock")
+
+# Terminal settings a session may pass on to its worker.
+SESSION_ENV_KEYS = ("TERM", "COLUMNS", "LINES")
+
+
+class SessionClosed(Exception):
+    """
+    Raised in a worker when the session on the other end has gone away.
+    """
+
+
+def socket_path():
+    """
+    Return the path of the pool's unix socket.
+
+    Returns:
+        str: The socket path.
+    """
+    return os.environ.get(POOL_SOCKET_ENV, DEFAULT_SOCKET)
+
+
+def warm_up():
+    """
+    Do the slow per-process work once, before any worker is forked:
+    import the Sheets client, authorize and load the plant catalog.
+    """
+    storage = run.get_storage_backend()
+    run.get_plant_catalog()
+    if storage.name == 'sheets':
+        storage.spreadsheet  # Authorizes and opens the spreadsheet
+
+
+def run_session(fds, session_env):
+    """
+    Run one interactive session on the terminal received from
+    session.py.
+
+    Args:
+        fds (list): The session's stdin, stdout and stderr descriptors.
+        session_env (dict): Terminal settings from the session.
+    """
+    saved_fds = [os.dup(fd) for fd in (0, 1, 2)]
+    for target, fd in zip((0, 1, 2), fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    os.environ.update(session_env)
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", buffering=1, closefd=False)
+    sys.stderr = open(2, "w", buffering=1, closefd=False)
+
+    try:
+        signal.signal(signal.SIGUSR1, interrupt_session)
+        run.welcome_message()
+        run.main_menu()
+    except (SessionClosed, EOFError, OSError, KeyboardInterrupt):
+        pass
+    except Exception:
+        traceback.print_exc()
+    finally:
+        signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+        metrics.end_session()
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except OSError:
+            pass
+        sys.stdin, sys.stdout, sys.stderr = (
+            sys.__stdin__, sys.__stdout__, sys.__stderr__
+        )
+        for target, fd in zip((0, 1, 2), saved_fds):
+            os.dup2(fd, target)
+            os.close(fd)
+
+
+def watch_connection(connection, main_thread_id):
+    """
+    Interrupt the session if session.py exits, for example when the
+    websocket closes and its terminal is killed.
+
+    Args:
+        connection (socket.socket): The connection to session.py.
+        main_thread_id (int): The thread running the session.
+    """
+    try:
+        connection.recv(1)
+    except OSError:
+        pass
+    signal.pthread_kill(main_thread_id, signal.SIGUSR1)
+
+
+def interrupt_session(signum, frame):
+    """
+    Signal handler that ends the current session.
+    """
+    raise SessionClosed()
+
+
+def serve(listener, recycle_after):
+    """
+    Worker loop: take sessions off the listening socket one at a time
+    and exit after recycle_after sessions.
+
+    Args:
+        listener (socket.socket): The pool's listening socket.
+        recycle_after (int): Sessions to serve before exiting.
+    """
+    run.get_storage_backend().reset_connections()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+
+    for _ in range(recycle_after):
+        connection, _ = listener.accept()
+        with connection:
+            message, fds, _, _ = socket.recv_fds(connection, 4096, 3)
+            if len(fds) != 3:
+                for fd in fds:
+                    os.close(fd)
+                continue
+            session_env = {
+                key: value for key, value in json.loads(message).items()
+                if key in SESSION_ENV_KEYS
+            }
+            connection.sendall(b"1")  # Tell the session it was picked up
+
+            watcher = threading.Thread(
+                target=watch_connection,
+                args=(connection, threading.get_ident()),
+                daemon=True
+            )
+            watcher.start()
+            try:
+                run_session(fds, session_env)
+            finally:
+                # Wake the watcher and wait for it, so its signal can't
+                # reach the next session.
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                watcher.join()
+    os._exit(0)
+
+
+def spawn_worker(listener, recycle_after):
+    """
+    Fork a worker process.
+
+    Args:
+        listener (socket.socket): The pool's listening socket.
+        recycle_after (int): Sessions the worker serves before exiting.
+
+    Returns:
+        int: The worker's process id.
+    """
+    pid = os.fork()
+    if pid == 0:
+        try:
+            serve(listener, recycle_after)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def main():
+    """
+    Warm up, open the pool socket and keep the configured number of
+    workers running, replacing each one that exits.
+    """
+    size = int(os.environ.get(POOL_SIZE_ENV, 4))
+    queue = int(os.environ.get(POOL_QUEUE_ENV, 64))
+    recycle_after = int(os.environ.get(POOL_RECYCLE_ENV, 100))
+    path = socket_path()
+
+    warm_up()
+    # Log the warm-up on its own, so it isn't counted in the first
+    # session of every worker.
+    metrics.end_session()
+
+    if os.path.exists(path):
+        os.remove(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(queue)
+
+    workers = set()
+
+    def stop(signum, frame):
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        os.remove(path)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(size):
+        workers.add(spawn_worker(listener, recycle_after))
+    print(f" Crop Calendar pool ready: {size} workers on {path}")
+
+    while True:
+        pid, _ = os.wait()
+        workers.discard(pid)
+        workers.add(spawn_worker(listener, recycle_after))
+
+
+if __name__ == "__main__":
+    main()
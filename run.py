@@ -1,26 +1,175 @@
-import gspread
-from google.oauth2.service_account import Credentials
-from classes.table_creator import TableCreator
+# Modules that import NumPy or asyncio take most of the startup time,
+# so they are imported where they are used, once the welcome screen
+# is showing.
+from classes.table_creator import MIN_PAGE_ROWS, TableCreator
 from classes.user_data import UserData
-from datetime import datetime, timedelta
-from classes.plant import Plant
+from classes.storage import get_storage, local_path
+from classes.catalog_cache import CatalogCache
+from classes.batch_runner import (
+    BatchRunner, ParallelBatchRunner, StorageResultWriter, TextResultWriter,
+    read_plans, results_table, schedule_rows
+)
+from classes.metrics import instrument_storage, timed
+from classes.write_journal import (
+    DEFAULT_JOURNAL, JOURNAL_ENV, WriteBehindQueue, WriteJournal
+)
+from datetime import date, datetime
 from prettytable import PrettyTable
+import argparse
+import concurrent.futures
+import itertools
 import os
 import platform
+import shutil
+import sys
+import threading
+
+_storage = None
+_storage_lock = threading.Lock()
+_async_storage = None
+_plant_catalog = None
+_catalog_cache = None
+_catalog_lock = threading.Lock()
+_write_queue = None
+# Screen lines around a page of stored data: the heading, the table
+# header and the prompt.
+USER_DATA_RESERVED_LINES = 8
+
+
+def get_storage_backend():
+    """
+    Return the storage backend, creating it on first use.
 
-SCOPE = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive.file",
-    "https://www.googleapis.com/auth/drive"
-    ]
+    Returns:
+        StorageBackend: The configured storage backend.
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = instrument_storage(get_storage())
+    return _storage
+
+
+def get_async_storage():
+    """
+    Return the asyncio front end for the storage backend, creating it
+    on first use.
+
+    Returns:
+        AsyncStorage: The async storage wrapper.
+    """
+    from classes.async_storage import AsyncStorage
+
+    global _async_storage
+    storage = get_storage_backend()
+    with _storage_lock:
+        if _async_storage is None:
+            _async_storage = AsyncStorage(storage)
+    return _async_storage
+
+
+def get_write_queue():
+    """
+    Return the write-behind queue for stored results, creating it and
+    starting its flusher on first use. Writes a previous session left
+    in the journal are flushed along with new ones.
+
+    Returns:
+        WriteBehindQueue: The write-behind queue.
+    """
+    global _write_queue
+    storage = get_storage_backend()
+    with _storage_lock:
+        if _write_queue is None:
+            journal = WriteJournal(local_path(JOURNAL_ENV, DEFAULT_JOURNAL))
+            _write_queue = WriteBehindQueue(storage, journal)
+            _write_queue.start()
+    return _write_queue
+
+
+def get_plant_catalog():
+    """
+    Return the plant catalog, loading it on first use from the shared
+    on-disk catalog cache. If a background load is in progress, wait
+    for it to finish.
+
+    Returns:
+        PlantCatalog: The plant catalog.
+    """
+    from classes.plant_catalog import PlantCatalog
+
+    global _plant_catalog, _catalog_cache
+    with _catalog_lock:
+        if _plant_catalog is None:
+            _catalog_cache = CatalogCache.from_env()
+            _plant_catalog = PlantCatalog(
+                _catalog_cache.load(get_storage_backend())
+            )
+    return _plant_catalog
 
-CREDS = Credentials.from_service_account_file('creds.json')
-SCOPED_CREDS = CREDS.with_scopes(SCOPE)
-GSPPRED_CLIENT = gspread.authorize(SCOPED_CREDS)
-SHEET = GSPPRED_CLIENT.open('crop_calendar')
 
-plants = SHEET.worksheet('plant_list')
-data_plants = plants.get_all_values()
+def refresh_plant_catalog():
+    """
+    Bring the plant catalog up to date with storage. Within the cache
+    TTL this costs nothing. After that only edited plants are
+    downloaded, and the catalog is patched in place, so the search
+    index, growth times and rendered pages of every other plant are
+    kept.
+
+    Returns:
+        PlantCatalog: The plant catalog.
+    """
+    catalog = get_plant_catalog()
+    with _catalog_lock:
+        try:
+            catalog.update(_catalog_cache.load(get_storage_backend()))
+        except Exception:
+            # Keep planning with the catalog already loaded.
+            pass
+    return catalog
+
+
+def start_catalog_load():
+    """
+    Start loading the plant catalog in the background so it is ready
+    by the time the user leaves the welcome screen. The storage is
+    prepared (worksheet handles, email index) at the same time. The
+    slow imports happen on the background thread too, so the welcome
+    screen isn't kept waiting for them.
+    """
+    def load():
+        async_storage = get_async_storage()
+        # If this fails the catalog stays unloaded, and the next
+        # get_plant_catalog() call retries in the foreground and
+        # reports the error.
+        async_storage.submit(async_storage.gather(
+            async_storage.call(get_plant_catalog),
+            async_storage.prepare()
+        ))
+
+    threading.Thread(target=load, daemon=True).start()
+
+
+def wait_with_progress(future, message):
+    """
+    Show a spinner while a background storage request finishes.
+
+    Args:
+        future (concurrent.futures.Future): The request.
+        message (str): The text shown next to the spinner.
+
+    Returns:
+        The request's result.
+    """
+    spinner = itertools.cycle("|/-\\")
+    # Polled with wait() rather than result(timeout), so a TimeoutError
+    # raised by the request itself isn't taken for "not done yet".
+    while not concurrent.futures.wait([future], timeout=0.1).done:
+        sys.stdout.write(f"\r {message}... {next(spinner)}")
+        sys.stdout.flush()
+    sys.stdout.write("\r" + " " * (len(message) + 7) + "\r")
+    sys.stdout.flush()
+    return future.result()
 
 
 def clear_terminal():
@@ -62,7 +211,9 @@ def main_menu():
     """
     Display the main menu and handle user selection.
     """
-    options = ["Plan crops", "View stored data", "Exit crop calculator"]
+    options = [
+        "Plan crops", "View stored data", "Plan beds", "Exit crop calculator"
+    ]
     while True:
         choice = display_menu(options)
         if choice == 1:
@@ -70,6 +221,9 @@ def main_menu():
         elif choice == 2:
             view_stored_data()
         elif choice == 3:
+            plan_beds()
+        elif choice == 4:
+            finish_pending_writes()
             print(" Thank you for using the Crop Calendar Planner!")
             break
 
@@ -95,11 +249,21 @@ def plan_crops():
     """
     Function to plan crops by selecting plants and calculating dates.
     """
+    refresh_plant_catalog()
     user_list = select_plants()
     if user_list:
+        catalog = get_plant_catalog()
         user_list_data, action, results = get_selected_plants(
-            data_plants, user_list
+            catalog, user_list
         )
+        stages_choice = input(
+            "\n Do you want to see the growth stages? (Y/N): "
+        ).strip().upper()
+        if stages_choice == 'Y' and user_list_data:
+            display_stage_timeline(
+                catalog, [i for i in user_list if i in catalog], action,
+                user_list_data[0][2]
+            )
         store_data_prompt(user_list_data)
 
 
@@ -113,30 +277,210 @@ def view_stored_data():
     email = input(
         " Enter email address: "
     ).strip()
-    user_data = fetch_user_data(email)
-    display_user_data(user_data)
+    pages = fetch_user_data_pages(email)
+    page = next(pages, None)
+    if page is None:
+        display_user_data([])
+        input("\n Press Enter to return to the main menu...")
+        return
+
+    page_number = 1
+    while True:
+        clear_terminal()
+        display_user_data(page, page_number)
+        page = next(pages, None)
+        if page is None:
+            input("\n Press Enter to return to the main menu...")
+            return
+        choice = input(
+            "\n Enter N for the next page, or press Enter to return to"
+            " the main menu: "
+        ).strip().upper()
+        if choice != 'N':
+            pages.close()
+            return
+        page_number += 1
+
+
+def plan_beds():
+    """
+    Fit the user's stored schedules into their beds and suggest crops
+    for the slots left free until the end of the season.
+    """
+    from classes.succession_planner import (
+        SuccessionPlanner, schedule_intervals
+    )
+
+    clear_terminal()
+    print("\n To plan your beds, "
+          "you need to enter your email address.\n")
+    email = input(
+        " Enter email address: "
+    ).strip()
+    intervals = schedule_intervals(fetch_user_data(email))
+    if not intervals:
+        print(" No data found for the provided email address.")
+        input("\n Press Enter to return to the main menu...")
+        return
+
+    beds = get_bed_count()
+    print(" When does your season end?")
+    season_end = date.fromisoformat(get_date())
+    plans, unplaced = SuccessionPlanner(get_plant_catalog()).plan(
+        intervals, beds, season_end
+    )
+    display_bed_plan(plans, unplaced)
     input("\n Press Enter to return to the main menu...")
 
 
+def get_bed_count():
+    """
+    Prompt the user for the number of beds they have.
+
+    Returns:
+        int: The number of beds, at least one.
+    """
+    while True:
+        try:
+            beds = int(input(" Enter the number of beds: ").strip())
+            if beds >= 1:
+                return beds
+            print(" Please enter a number of at least 1.")
+        except ValueError:
+            print(" Invalid input, please enter a number")
+
+
+@timed("render.bed_plan")
+def display_bed_plan(plans, unplaced):
+    """
+    Display the crops in each bed and the crops suggested for its free
+    slots, followed by the schedules that didn't fit.
+
+    Args:
+        plans (list): A list per bed of (start, end, item) tuples from
+            SuccessionPlanner.plan(). Free slots have a list of
+            suggested plants as their item.
+        unplaced (list): The (start, end, plant) tuples that didn't fit.
+    """
+    table = PrettyTable()
+    table.border = False
+    table.align = "l"
+    table.padding_width = 2
+    table.field_names = ["Bed", "Plant", "From", "To"]
+    for bed, entries in enumerate(plans, start=1):
+        for start, end, item in entries:
+            if isinstance(item, list):
+                item = "Free - try " + ", ".join(
+                    plant.name for plant in item
+                )
+            table.add_row([bed, item, start.isoformat(), end.isoformat()])
+
+    print("\n Bed Plan:\n")
+    print(table)
+    if unplaced:
+        print(f"\n {len(unplaced)} schedules don't fit in {len(plans)}"
+              " beds:")
+        for start, end, plant in unplaced:
+            print(f" {plant}: {start.isoformat()} to {end.isoformat()}")
+
+
+@timed("render.plant_page")
+def show_plant_page(table_creator, page, page_count, title="Plant menu"):
+    """
+    Clear the screen and show one page of the plant menu.
+
+    Args:
+        table_creator (TableCreator): The plant menu table.
+        page (int): The page to show, starting at zero.
+        page_count (int): The number of pages in the menu.
+        title (str): The heading shown above the table.
+    """
+    clear_terminal()
+    print(f"\n {title}: \n")
+    print(f"{table_creator.render_page(page)} \n")
+    print(" Type in the plant number from the list, if you want multiple")
+    print(" plants, use comma sign to separate them. Example: 1,8,12")
+    print(" Search with S <name>, C <category> or K <keyword>, "
+          "A shows all plants.")
+    if page_count > 1:
+        print(f" Page {page + 1} of {page_count}. "
+              "Enter N for the next page or B to go back.")
+    print()
+
+
+@timed("compute.search_plants")
+def search_plants(catalog, command):
+    """
+    Run a search command from the plant menu against the catalog's
+    search index.
+
+    Args:
+        catalog (PlantCatalog): The plant catalog.
+        command (str): 'S <name>', 'C <category>' or 'K <keywords>'.
+
+    Returns:
+        tuple: The matching catalog positions and a heading describing
+        the search, or None if command is not a search.
+    """
+    kind, _, text = command.strip().partition(" ")
+    text = text.strip()
+    kind = kind.upper()
+    if not text or kind not in ('S', 'C', 'K'):
+        return None
+
+    index = catalog.search_index
+    if kind == 'S':
+        return index.by_name_substring(text), f"Plants named '{text}'"
+    if kind == 'C':
+        return index.by_category(text), f"Plants in category '{text}'"
+    return index.by_keywords(text), f"Plants described as '{text}'"
+
+
 def select_plants():
     """
-    Display a table of plants and allow the user to select multiple
-    plants by entering their numbers.
+    Display a table of plants, one page at a time, and allow the user
+    to search it and select multiple plants by entering their numbers.
 
     Returns:
         list: A list of selected plant indices.
     """
-    clear_terminal()
-    print("\n Plant menu: \n")
-    table_creator = TableCreator(data_plants)
-    table = table_creator.create_main_table()
+    catalog = get_plant_catalog()
+    table_creator = TableCreator(catalog.rows)
+    title = "Plant menu"
+    page_count = table_creator.page_count()
+    page = 0
 
-    print(f"{table} \n")
-    print(" Type in the plant number from the list, if you want multiple")
-    print(" plants, use comma sign to separate them. Example: 1,8,12\n")
+    show_plant_page(table_creator, page, page_count, title)
 
     while True:
         data_str = input(" Enter one or more plant numbers: ")
+        command = data_str.strip().upper()
+
+        if page_count > 1 and command in ('N', 'B'):
+            page = (page + (1 if command == 'N' else -1)) % page_count
+            show_plant_page(table_creator, page, page_count, title)
+            continue
+
+        if command == 'A':
+            table_creator = TableCreator(catalog.rows)
+            title = "Plant menu"
+            page_count = table_creator.page_count()
+            page = 0
+            show_plant_page(table_creator, page, page_count, title)
+            continue
+
+        search = search_plants(catalog, data_str)
+        if search is not None:
+            positions, search_title = search
+            if not positions:
+                print(" No plants match your search.")
+                continue
+            table_creator = TableCreator(catalog.subset_rows(positions))
+            title = search_title
+            page_count = table_creator.page_count()
+            page = 0
+            show_plant_page(table_creator, page, page_count, title)
+            continue
 
         selected_plants = data_str.split(",")
         user_list = []
@@ -145,18 +489,18 @@ def select_plants():
         for plant_id in selected_plants:
             try:
                 idx = int(plant_id.strip())
-                if str(idx) in data_plants[idx][0]:
-                    user_list.append(idx)
-                elif idx < 0:
+                if idx < 0:
                     print(f" Invalid input '{idx}'. "
                           "Please enter positive numbers only.")
                     valid_input = False
                     break
-            except IndexError:
-                print(f" IndexError: The item {idx} does not exist,")
-                print(f" select a number from the list.")
-                valid_input = False
-                break
+                elif idx in catalog:
+                    user_list.append(idx)
+                else:
+                    print(f" The item {idx} does not exist,")
+                    print(f" select a number from the list.")
+                    valid_input = False
+                    break
             except ValueError:
                 print(f" Invalid input '{plant_id}'.")
                 print(f" Please enter numbers only.")
@@ -212,7 +556,7 @@ def get_selected_plants(data, user_selection):
     user selection.
 
     Args:
-        data (list): The list of plant data from the Google Sheet.
+        data (PlantCatalog): The plant catalog.
         user_selection (list): The list of selected plant indices.
 
     Returns:
@@ -224,41 +568,21 @@ def get_selected_plants(data, user_selection):
 
     input_date = datetime.strptime(date_str, "%Y-%m-%d")
 
-    data_dict = {row[0]: row for row in data}
-
-    matching_rows = [
-        data_dict[str(id)]
-        for id in user_selection
-        if str(id) in data_dict
-    ]
-
-    plants = [Plant(*row) for row in matching_rows]
+    plants = [data.get(id) for id in user_selection if id in data]
 
     results = PrettyTable()
     results.border = False
     results.align = "l"
     results.padding_width = 5
 
-    user_list_data = []
+    user_list_data = schedule_rows(plants, action, input_date)
 
     if action == 'P':
         results.field_names = [
             "Plant", "Planting Date", "Estimated Harvest Date"
         ]
-        for plant in plants:
-            harvest_date = input_date + timedelta(
-                days=plant.total_growth_time()
-            )
-            results.add_row([
-                plant.name,
-                input_date.strftime('%Y-%m-%d'),
-                harvest_date.strftime('%Y-%m-%d')
-            ])
-            user_list_data.append([
-                plant.name, "Planting Date",
-                input_date.strftime('%Y-%m-%d'),
-                harvest_date.strftime('%Y-%m-%d')
-            ])
+        for name, _, planting_date, harvest_date in user_list_data:
+            results.add_row([name, planting_date, harvest_date])
 
         print("\n Planting Schedule: \n")
         print(results)
@@ -267,20 +591,8 @@ def get_selected_plants(data, user_selection):
         results.field_names = [
             "Plant", "Estimated Planting Date", "Harvest Date"
         ]
-        for plant in plants:
-            planting_date = input_date - timedelta(
-                days=plant.total_growth_time()
-            )
-            results.add_row([
-                plant.name,
-                planting_date.strftime('%Y-%m-%d'),
-                input_date.strftime('%Y-%m-%d')
-            ])
-            user_list_data.append([
-                plant.name, "Harvest Date",
-                input_date.strftime('%Y-%m-%d'),
-                planting_date.strftime('%Y-%m-%d')
-            ])
+        for name, _, harvest_date, planting_date in user_list_data:
+            results.add_row([name, planting_date, harvest_date])
 
         print("\n Harvest Schedule:\n")
         print(results)
@@ -288,6 +600,46 @@ def get_selected_plants(data, user_selection):
     return user_list_data, action, results
 
 
+@timed("render.stage_timeline")
+def display_stage_timeline(catalog, plant_ids, action, date_str):
+    """
+    Display the start and end date of every growth stage of the
+    selected plants. Stages without a duration in the catalog are left
+    out.
+
+    Args:
+        catalog (PlantCatalog): The plant catalog.
+        plant_ids (list): The selected plant ids.
+        action (str): 'P' if date_str is the planting date, 'H' if it
+            is the harvest date.
+        date_str (str): The date the user entered, as YYYY-MM-DD.
+    """
+    from classes.plant_catalog import STAGE_COLUMNS
+    from classes.schedule_engine import ScheduleEngine
+
+    timeline = ScheduleEngine(catalog).stage_timeline(
+        plant_ids, date_str, action
+    )
+    stage_names = catalog.rows[0][STAGE_COLUMNS]
+    starts = ScheduleEngine.format_dates(timeline["stage_start"])
+    ends = ScheduleEngine.format_dates(timeline["stage_end"])
+
+    stages = PrettyTable()
+    stages.border = False
+    stages.align = "l"
+    stages.padding_width = 2
+    stages.field_names = ["Plant", "Stage", "Start", "End"]
+    for plant, known, plant_starts, plant_ends in zip(
+            timeline["plant"], timeline["stage_known"], starts, ends):
+        for stage, stage_known, start, end in zip(
+                stage_names, known, plant_starts, plant_ends):
+            if stage_known:
+                stages.add_row([plant, stage, start, end])
+
+    print("\n Growth Stages:\n")
+    print(stages)
+
+
 def store_data_prompt(user_list_data):
     """
     Prompt the user to store data and handle the storage process.
@@ -302,35 +654,67 @@ def store_data_prompt(user_list_data):
     if store_choice == 'Y':
         email = input(" Enter your email address: ").strip()
         user_data = UserData(email, user_list_data)
-        store_results(user_data)
-        print(" Data has been stored successfully.")
+        rows_saved = store_results(user_data)
+        print(f" {rows_saved} rows have been saved and will be stored"
+              " in the background.")
         input("\n Press Enter to return to the main menu...")
     else:
         print(" Data was not stored.")
         input("\n Press Enter to return to the main menu...")
 
 
+@timed("session.store_results")
 def store_results(user_data):
     """
-    Store the user's results in the 'user_results' worksheet.
+    Save the user's results to the local write journal. They are sent
+    to the configured storage backend in the background.
 
     Args:
         user_data (UserData): The user's data object.
+
+    Returns:
+        int: The number of result rows saved.
+    """
+    get_write_queue().enqueue(user_data)
+    return len(user_data.get_data())
+
+
+def drain_write_queue(failure_message):
+    """
+    Wait for results still in the write journal to be stored. If
+    storage can't be reached they stay in the journal, to be stored
+    later.
+
+    Args:
+        failure_message (str): What to tell the user if they couldn't
+            be stored.
     """
-    results_sheet = SHEET.worksheet('user_results')
+    if _write_queue is None or not _write_queue.pending_count():
+        return
+    async_storage = get_async_storage()
+    try:
+        wait_with_progress(
+            async_storage.submit(async_storage.call(_write_queue.drain)),
+            "Storing your data"
+        )
+    except Exception:
+        print(failure_message)
 
-    if len(results_sheet.get_all_values()) == 0:
-        results_sheet.append_row([
-            "Email", "Plant", "Date Type", "Date", "Corresponding Date"
-        ])
 
-    for result in user_data.get_data():
-        results_sheet.append_row([user_data.email] + result)
+def finish_pending_writes():
+    """
+    Wait for results still in the write journal to be stored before
+    the session ends. If storage can't be reached they stay in the
+    journal and are stored by a later session.
+    """
+    drain_write_queue(" Your data could not be stored right now."
+                      " It will be stored next time the planner runs.")
 
 
+@timed("session.fetch_user_data")
 def fetch_user_data(email):
     """
-    Fetch user data from the 'user_results' worksheet
+    Fetch user data from the configured storage backend
     based on the provided email address.
 
     Args:
@@ -339,50 +723,279 @@ def fetch_user_data(email):
     Returns:
         list: A list of user data records.
     """
-    results_sheet = SHEET.worksheet('user_results')
+    store_pending_writes()
+    async_storage = get_async_storage()
+    return wait_with_progress(
+        async_storage.submit(async_storage.fetch_results(email)),
+        "Fetching your data"
+    )
 
-    all_records = results_sheet.get_all_records()
 
-    user_data = [
-        record for record in all_records
-        if record['Email'] == email
-    ]
+def fetch_user_data_pages(email):
+    """
+    Fetch user data a page at a time, sized to fit the terminal. Only
+    the rows of one page are read per request, and the next page is
+    read in the background while the current one is shown.
+
+    Args:
+        email (str): The user's email address.
+
+    Yields:
+        list: The user data records of each page.
+    """
+    store_pending_writes()
+    async_storage = get_async_storage()
+    page_rows = max(
+        MIN_PAGE_ROWS,
+        shutil.get_terminal_size().lines - USER_DATA_RESERVED_LINES
+    )
+    pages = async_storage.storage.iter_results(email, page_rows)
+
+    def read_page():
+        return async_storage.submit(async_storage.call(next, pages, None))
+
+    pending = read_page()
+    while True:
+        page = wait_with_progress(pending, "Fetching your data")
+        if page is None:
+            return
+        pending = read_page()
+        yield page
+
 
-    return user_data
+def store_pending_writes():
+    """
+    Store anything saved this session before reading stored data, so
+    it shows up. If storage can't be reached the results stay in the
+    journal, and the read goes ahead without them.
+    """
+    drain_write_queue(" Recently saved data could not be stored right now,"
+                      " so it may be missing below. It will be stored"
+                      " later.")
 
 
-def display_user_data(user_data):
+@timed("render.user_data")
+def display_user_data(user_data, page_number=None):
     """
     Display the user's stored data in a formatted table.
 
     Args:
         user_data (list): The list of user data records.
+        page_number (int, optional): The page being shown, if the
+            data is shown a page at a time.
     """
     if not user_data:
         print(" No data found for the provided email address.")
         return
 
-    results = PrettyTable()
-
-    results.border = False
-    results.align = "l"
-    results.padding_width = 3
-    results.field_names = [
-        "Plant", "Date Type", "Date", "Corresponding Date"
-    ]
-
-    for record in user_data:
-        results.add_row([
+    results = results_table([
+        [
             record["Plant"],
             record["Date Type"],
             record["Date"],
             record["Corresponding Date"]
-        ])
+        ]
+        for record in user_data
+    ])
 
-    print("\n Your Stored Data:\n")
+    if page_number is None:
+        print("\n Your Stored Data:\n")
+    else:
+        print(f"\n Your Stored Data (page {page_number}):\n")
     print(results)
 
 
+def run_batch(input_path, output_path="-", output_format=None, store=False,
+              workers=1):
+    """
+    Compute schedules for a file of plans without the interactive menu
+    and report the throughput on stderr.
+
+    Args:
+        input_path (str): A CSV or JSON Lines file of plans with the
+            fields email, plants, action and date, or '-' for stdin.
+        output_path (str): Where the results are written, or '-' for
+            stdout.
+        output_format (str, optional): 'csv', 'jsonl' or 'report'.
+            Defaults to the output file's extension, or CSV.
+        store (bool): Store the results in the storage backend instead
+            of writing them to a file.
+        workers (int): The number of worker processes. 1 runs the
+            batch in this process, 0 uses one worker per CPU.
+
+    Returns:
+        BatchStats: The counters for the run.
+    """
+    input_format = "jsonl" if input_path.endswith(".jsonl") else "csv"
+    if output_format is None:
+        output_format = "jsonl" if output_path.endswith(".jsonl") else "csv"
+
+    if workers == 1:
+        runner = BatchRunner(get_plant_catalog())
+    else:
+        runner = ParallelBatchRunner(get_plant_catalog(), workers or None)
+    source = sys.stdin if input_path == "-" else open(input_path, newline="")
+    target = None
+    try:
+        if store:
+            writer = StorageResultWriter(get_storage_backend())
+        else:
+            target = (sys.stdout if output_path == "-"
+                      else open(output_path, "w", newline=""))
+            writer = TextResultWriter(target, output_format)
+        stats = runner.run(read_plans(source, input_format), writer)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target not in (None, sys.stdout):
+            target.close()
+
+    print(f" {stats.report()}", file=sys.stderr)
+    return stats
+
+
+def run_export(email=None, output_path="-", output_format=None):
+    """
+    Export stored schedules without the interactive menu and report
+    the number of records on stderr. Results are streamed from storage
+    to the output, so any number of them can be exported.
+
+    Args:
+        email (str, optional): The user whose schedules are exported.
+            Every user's schedules are exported if not given.
+        output_path (str): Where the export is written, or '-' for
+            stdout.
+        output_format (str, optional): 'csv' or 'ics'. Defaults to ics
+            if output_path ends in .ics, or csv.
+
+    Returns:
+        int: The number of records exported.
+    """
+    from classes.schedule_export import export_results
+
+    if output_format is None:
+        output_format = "ics" if output_path.endswith(".ics") else "csv"
+
+    # Results journaled by an earlier session are stored first, so
+    # they are part of the export.
+    get_write_queue().drain()
+    target = (sys.stdout if output_path == "-"
+              else open(output_path, "w", newline=""))
+    try:
+        count = export_results(
+            get_storage_backend(), target, output_format, email
+        )
+    finally:
+        if target is not sys.stdout:
+            target.close()
+
+    print(f" {count} records exported", file=sys.stderr)
+    return count
+
+
+def run_compaction():
+    """
+    Remove duplicate stored results, keeping the latest of each, and
+    report the space freed on stderr. Sessions can keep storing results
+    while it runs.
+
+    Returns:
+        CompactionStats: The counters for the compaction.
+    """
+    get_write_queue().drain()
+    stats = get_storage_backend().compact_results()
+    print(f" {stats.report()}", file=sys.stderr)
+    return stats
+
+
+def run_reshard(old_count):
+    """
+    Move stored results from old_count shards to the number set in
+    CROP_CALENDAR_RESULT_SHARDS, and report what moved on stderr.
+
+    Args:
+        old_count (int): The number of shards results were stored in.
+
+    Returns:
+        CompactionStats: The counters for the move.
+    """
+    from classes.sharding import reshard_from
+
+    get_write_queue().drain()
+    try:
+        stats = reshard_from(get_storage(), old_count)
+    except ValueError as error:
+        sys.exit(f" {error}.")
+    print(f" {stats.report()}", file=sys.stderr)
+    return stats
+
+
+def parse_args(argv=None):
+    """
+    Parse the command line.
+
+    Args:
+        argv (list, optional): The arguments. Defaults to sys.argv.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Crop Calendar Planner")
+    parser.add_argument(
+        "--batch", metavar="PLANS",
+        help="compute schedules for a CSV or JSON Lines file of plans"
+             " ('-' for stdin) instead of starting the menu"
+    )
+    parser.add_argument(
+        "--output", default="-",
+        help="where batch results are written (default: stdout)"
+    )
+    parser.add_argument(
+        "--format", choices=("csv", "jsonl", "report"),
+        help="batch output format (default: from --output, or csv)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="worker processes for --batch (0: one per CPU, default: 1)"
+    )
+    parser.add_argument(
+        "--store", action="store_true",
+        help="store batch results in the storage backend"
+    )
+    parser.add_argument(
+        "--export", metavar="EMAIL", nargs="?", const="",
+        help="export the stored schedules of EMAIL, or of every user"
+             " if no email is given, to --output"
+    )
+    parser.add_argument(
+        "--export-format", choices=("csv", "ics"),
+        help="export format (default: ics if --output ends in .ics,"
+             " or csv)"
+    )
+    parser.add_argument(
+        "--compact", action="store_true",
+        help="remove duplicate stored results, keeping the latest"
+    )
+    parser.add_argument(
+        "--reshard", metavar="OLD_SHARDS", type=int,
+        help="move stored results from OLD_SHARDS shards to the number"
+             " set in CROP_CALENDAR_RESULT_SHARDS"
+    )
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    welcome_message()
-    main_menu()
+    args = parse_args()
+    if args.batch:
+        run_batch(args.batch, args.output, args.format, args.store,
+                  args.workers)
+    elif args.export is not None:
+        run_export(args.export or None, args.output, args.export_format)
+    elif args.compact:
+        run_compaction()
+    elif args.reshard is not None:
+        run_reshard(args.reshard)
+    else:
+        start_catalog_load()
+        welcome_message()
+        main_menu()
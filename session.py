@@ -0,0 +1,65 @@
+"""
+Connect this terminal to a warm worker of the Crop Calendar pool.
+
+controllers/default.js runs this script in each websocket's terminal
+when the pool is enabled. It only imports what it needs to pass its
+terminal to a pool worker (see pool.py) and then waits for the session
+to end. If the pool isn't running it falls back to running run.py.
+"""
+import json
+import os
+import socket
+import sys
+import tempfile
+
+POOL_SOCKET_ENV = "CROP_CALENDAR_POOL_SOCKET"
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "crop_calendar.sock")
+SESSION_ENV_KEYS = ("TERM", "COLUMNS", "LINES")
+WAIT_NOTICE_AFTER = 0.5
+
+
+def run_standalone():
+    """
+    Replace this process with a normal run.py session.
+    """
+    run_py = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "run.py")
+    os.execv(sys.executable, [sys.executable, run_py])
+
+
+def main():
+    """
+    Hand this terminal to a pool worker and wait for the session to end.
+    """
+    path = os.environ.get(POOL_SOCKET_ENV, DEFAULT_SOCKET)
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+        session_env = {
+            key: os.environ[key] for key in SESSION_ENV_KEYS
+            if key in os.environ
+        }
+        socket.send_fds(
+            connection, [json.dumps(session_env).encode()], [0, 1, 2]
+        )
+    except OSError:
+        connection.close()
+        run_standalone()
+
+    connection.settimeout(WAIT_NOTICE_AFTER)
+    try:
+        connection.recv(1)
+    except socket.timeout:
+        print("\n All planners are busy, please wait a moment...")
+        connection.settimeout(None)
+        connection.recv(1)
+    connection.settimeout(None)
+
+    # Block until the worker closes the connection at the end of the
+    # session.
+    while connection.recv(1024):
+        pass
+
+
+if __name__ == "__main__":
+    main()
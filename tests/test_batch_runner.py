@@ -0,0 +1,74 @@
+import io
+import os
+import tempfile
+import unittest
+
+from classes.batch_runner import (
+    BatchRunner, StorageResultWriter, TextResultWriter, parse_plan
+)
+from classes.fake_sheets import FakeSpreadsheet, synthetic_plant_rows
+from classes.plant_catalog import PlantCatalog
+from classes.storage import RESULTS_HEADER, SheetsStorage
+from classes.user_data import UserData
+
+
+def plan(plants):
+    return {"email": "a@x.com", "plants": plants, "action": "P",
+            "date": "2024-04-01"}
+
+
+class ParsePlanTest(unittest.TestCase):
+
+    def test_single_numeric_id(self):
+        self.assertEqual(parse_plan(plan(3))[1], ["3"])
+
+    def test_other_types_are_invalid(self):
+        for plants in ({"id": 3}, 3.5, True):
+            with self.assertRaises(ValueError):
+                parse_plan(plan(plants))
+
+    def test_invalid_line_is_skipped(self):
+        errors, output = io.StringIO(), io.StringIO()
+        runner = BatchRunner(PlantCatalog(synthetic_plant_rows(5)), errors)
+        stats = runner.run(
+            [(1, plan({"id": 3})), (2, plan(3))],
+            TextResultWriter(output, "jsonl")
+        )
+        self.assertEqual((stats.records, stats.errors), (2, 1))
+        self.assertIn("Line 1:", errors.getvalue())
+        self.assertTrue(output.getvalue())
+
+
+class StorageResultWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        spreadsheet = FakeSpreadsheet({"user_results": [RESULTS_HEADER]})
+        self.sheet = spreadsheet.worksheet("user_results")
+        self.storage = SheetsStorage(
+            spreadsheet=spreadsheet,
+            index_path=os.path.join(directory.name, "index.json")
+        )
+
+    def store(self, plans):
+        writer = StorageResultWriter(self.storage)
+        for key, email in plans:
+            writer.write(key, UserData(email, [
+                ["Kale", "Planting Date", "2024-04-01", "2024-06-01"]
+            ]))
+        writer.close()
+
+    def test_rerun_does_not_store_plans_twice(self):
+        self.store([("k1", "a@x.com"), ("k2", "b@x.com")])
+        self.store([("k1", "a@x.com"), ("k2", "b@x.com"),
+                    ("k3", "a@x.com")])
+
+        self.assertEqual(
+            [row[-1] for row in self.sheet.get_all_values()[1:]],
+            ["k1", "k2", "k3"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
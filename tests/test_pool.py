@@ -0,0 +1,21 @@
+import unittest
+from unittest import mock
+
+import pool
+from classes.storage import SheetsStorage
+
+
+class WarmUpTest(unittest.TestCase):
+
+    @mock.patch("run.get_plant_catalog")
+    @mock.patch("run.get_storage_backend")
+    def test_opens_the_spreadsheet_before_forking(self, get_storage, _):
+        get_storage.return_value = SheetsStorage(index_path="unused.json")
+        with mock.patch.object(SheetsStorage, "spreadsheet",
+                               new_callable=mock.PropertyMock) as spreadsheet:
+            pool.warm_up()
+        spreadsheet.assert_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
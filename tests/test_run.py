@@ -0,0 +1,27 @@
+import concurrent.futures
+import contextlib
+import io
+import unittest
+
+import run
+
+
+class WaitWithProgressTest(unittest.TestCase):
+
+    def wait(self, future):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return run.wait_with_progress(future, "Fetching your data")
+
+    def test_returns_the_result(self):
+        with concurrent.futures.ThreadPoolExecutor() as pool:
+            self.assertEqual(self.wait(pool.submit(lambda: 42)), 42)
+
+    def test_timeout_raised_by_the_request_is_reraised(self):
+        future = concurrent.futures.Future()
+        future.set_exception(TimeoutError("read timed out"))
+        with self.assertRaises(TimeoutError):
+            self.wait(future)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+from classes.fake_sheets import FakeSpreadsheet
+from classes.sharding import (
+    ShardedStorage, reshard, results_sheet_name, sharded_storage,
+    sheets_shards
+)
+from classes.storage import RESULTS_HEADER, SheetsStorage
+from classes.user_data import UserData
+
+
+class ReshardTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spreadsheet = FakeSpreadsheet({
+            "plant_list": [], "user_results": [list(RESULTS_HEADER)]
+        })
+        self.primary = SheetsStorage(
+            spreadsheet=self.spreadsheet,
+            index_path=os.path.join(directory.name, "index.json")
+        )
+        self.emails = [f"user{number}@x.com" for number in range(12)]
+
+    def layout(self, count):
+        return sharded_storage(self.primary, count, [])
+
+    def stored_rows(self, count):
+        return sorted(
+            tuple(row[:5]) for shard in range(count)
+            for row in self.spreadsheet.worksheet(
+                results_sheet_name(shard)
+            ).get_all_values()[1:]
+        )
+
+    def assert_in_place(self, storage):
+        for email in self.emails:
+            self.assertEqual(
+                len(storage.shard_for(email).fetch_results(email)), 2
+            )
+
+    def test_one_to_three_to_two_shards(self):
+        for email in self.emails:
+            self.primary.append_results(UserData(email, [
+                ["Kale", "Planting Date", "2024-04-01", "2024-07-01"],
+                ["Leek", "Planting Date", "2024-04-02", "2024-08-01"]
+            ]))
+        stored = self.stored_rows(1)
+
+        three = self.layout(3)
+        reshard(sheets_shards(self.primary, 1), three, chunk_rows=5)
+        self.assertEqual(self.stored_rows(3), stored)
+        for shard in range(3):
+            self.assertGreater(len(self.spreadsheet.worksheet(
+                results_sheet_name(shard)).get_all_values()), 1)
+        self.assert_in_place(three)
+
+        two = self.layout(2)
+        stats = reshard(three.shards, two, chunk_rows=5)
+        self.assertEqual(self.stored_rows(3), stored)
+        self.assertEqual(
+            len(self.spreadsheet.worksheet(results_sheet_name(2))
+                .get_all_values()), 1
+        )
+        self.assertTrue(stats.rows_resharded)
+        self.assertIsInstance(two, ShardedStorage)
+        self.assert_in_place(two)
+
+
+if __name__ == "__main__":
+    unittest.main()
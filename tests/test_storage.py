@@ -0,0 +1,148 @@
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from classes.fake_sheets import FakeSpreadsheet, synthetic_plant_rows
+from classes.catalog_cache import CatalogCache
+from classes.storage import (
+    DEFAULT_INDEX, RESULTS_HEADER, SheetsStorage, get_storage, local_path
+)
+from classes.write_journal import DEFAULT_JOURNAL, JOURNAL_ENV
+from classes.user_data import UserData
+
+
+def result_rows(count, plant="Kale"):
+    return [[plant, "Planting Date", f"2024-04-{day + 1:02d}", "2024-07-01"]
+            for day in range(count)]
+
+
+class SheetsStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        plants = synthetic_plant_rows(5)
+        plants[0] = plants[0] + ["", "v1"]
+        self.spreadsheet = FakeSpreadsheet({
+            "plant_list": plants,
+            "user_results": [list(RESULTS_HEADER)]
+        })
+        self.storage = SheetsStorage(
+            spreadsheet=self.spreadsheet,
+            index_path=os.path.join(directory.name, "index.json")
+        )
+
+    def test_storing_results_keeps_the_catalog_version(self):
+        version = self.storage.catalog_version()
+        self.storage.append_results(UserData("a@x.com", result_rows(2)))
+        self.assertEqual(self.storage.catalog_version(), version)
+
+        self.spreadsheet.worksheet("plant_list").batch_update(
+            [{"range": "K1", "values": [["v2"]]}]
+        )
+        self.assertNotEqual(self.storage.catalog_version(), version)
+
+    def clear_rows(self, *row_numbers):
+        sheet = self.spreadsheet.worksheet("user_results")
+        sheet.batch_update([
+            {"range": f"A{row}:F{row}", "values": [[""] * 6]}
+            for row in row_numbers
+        ])
+
+    def test_export_reads_past_cleared_rows(self):
+        self.storage.append_results(UserData("a@x.com", result_rows(8)))
+        # Rows 6 and 7 end the first chunk of 6 rows.
+        self.clear_rows(6, 7)
+
+        exported = [
+            result["Date"] for chunk in self.storage.iter_all_results(6)
+            for result in chunk
+        ]
+        dates = [row[2] for row in result_rows(8)]
+        self.assertEqual(exported, dates[:4] + dates[6:])
+
+    def stored_rows(self):
+        sheet = self.spreadsheet.worksheet("user_results")
+        return [row[:5] for row in sheet.get_all_values()[1:]]
+
+    def test_compaction_keeps_rows_after_cleared_rows(self):
+        self.storage.append_results(UserData("a@x.com", result_rows(8)))
+        self.clear_rows(6, 7)
+
+        stats = self.storage.compact_results(6)
+
+        self.assertEqual(stats.blank_rows, 2)
+        rows = [["a@x.com"] + row for row in result_rows(8)]
+        self.assertEqual(self.stored_rows(), rows[:4] + rows[6:])
+
+    def test_compaction_while_results_are_appended(self):
+        self.storage.append_results(UserData("a@x.com", result_rows(3)))
+        self.storage.append_results(UserData("b@x.com", result_rows(2)))
+        self.storage.append_results(UserData("a@x.com", result_rows(3)))
+        session = SheetsStorage(
+            spreadsheet=self.spreadsheet,
+            index_path=f"{self.storage.index_path}.session"
+        )
+        appended = [
+            UserData("c@x.com", result_rows(1, plant="Leek")),
+            UserData("a@x.com", result_rows(1, plant="Pea"))
+        ]
+        sheet = self.spreadsheet.worksheet("user_results")
+        get = sheet.get
+        reads = []
+
+        def get_while_appending(cell_range):
+            # Another session stores results during each pass.
+            reads.append(cell_range)
+            if len(reads) in (3, 6):
+                session.append_results(appended[len(reads) // 3 - 1])
+            return get(cell_range)
+
+        sheet.get = get_while_appending
+        stats = self.storage.compact_results(3)
+
+        self.assertEqual(stats.duplicates, 3)
+        self.assertEqual(self.stored_rows(), [
+            ["b@x.com"] + row for row in result_rows(2)
+        ] + [
+            ["a@x.com"] + row for row in result_rows(3)
+        ] + [
+            [user_data.email] + user_data.get_data()[0]
+            for user_data in appended
+        ])
+        self.assertEqual(
+            len(self.storage.fetch_results("a@x.com")), 4
+        )
+
+
+class GetStorageTest(unittest.TestCase):
+
+    def test_fake_backend_keeps_its_own_local_files(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        sheets = os.path.join(directory.name, "fake.json")
+        environ = {
+            "CROP_CALENDAR_STORAGE": "fake",
+            "CROP_CALENDAR_FAKE_SHEETS": sheets
+        }
+        with unittest.mock.patch.dict(os.environ, environ, clear=True):
+            storage = get_storage()
+            journal = local_path(JOURNAL_ENV, DEFAULT_JOURNAL)
+            cache = CatalogCache.from_env().path
+
+        self.assertEqual(storage.name, "fake")
+        self.assertEqual(
+            [storage.index_path, journal, cache],
+            [f"{sheets}.email_index.json", f"{sheets}.results_journal.jsonl",
+             f"{sheets}.plant_catalog.json"]
+        )
+
+    def test_real_backend_uses_the_default_files(self):
+        with unittest.mock.patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(local_path("CROP_CALENDAR_INDEX", DEFAULT_INDEX),
+                             DEFAULT_INDEX)
+
+
+if __name__ == "__main__":
+    unittest.main()
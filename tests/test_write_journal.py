@@ -0,0 +1,122 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from classes.fake_sheets import FakeSpreadsheet, quota_error
+from classes.storage import RESULTS_HEADER, SheetsStorage
+from classes.user_data import UserData
+from classes.write_journal import WriteBehindQueue, WriteJournal
+
+
+class WriteJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.journal = WriteJournal(os.path.join(directory.name, "j.jsonl"))
+
+    def append(self, email):
+        return self.journal.append(
+            UserData(email, [["Kale", "Planting Date", "2024-04-01",
+                              "2024-06-01"]])
+        )
+
+    def test_record_after_torn_line_survives(self):
+        self.append("torn@x.com")
+        # Cut the last record short, as a crash mid-write would.
+        with open(self.journal.path, "r+b") as journal:
+            journal.truncate(os.path.getsize(self.journal.path) - 10)
+
+        self.append("a@x.com")
+        self.append("b@x.com")
+
+        self.assertEqual(
+            [write["email"] for write in self.journal.pending()],
+            ["a@x.com", "b@x.com"]
+        )
+
+    def test_compact_keeps_only_pending_writes(self):
+        stored = self.append("stored@x.com")
+        sent = self.append("sent@x.com")
+        self.append("new@x.com")
+        self.journal.mark_attempted([stored, sent])
+        self.journal.acknowledge([stored])
+
+        self.journal.compact()
+
+        with open(self.journal.path) as journal:
+            self.assertEqual(len(journal.readlines()), 3)
+        self.assertEqual(
+            [(write["email"], write["attempted"])
+             for write in self.journal.pending()],
+            [("sent@x.com", True), ("new@x.com", False)]
+        )
+        self.append("after@x.com")
+        self.assertEqual(len(self.journal.pending()), 3)
+
+
+class WriteBehindQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.journal = WriteJournal(os.path.join(directory.name, "j.jsonl"))
+        spreadsheet = FakeSpreadsheet({"user_results": [RESULTS_HEADER]})
+        self.sheet = spreadsheet.worksheet("user_results")
+        self.storage = SheetsStorage(
+            spreadsheet=spreadsheet,
+            index_path=os.path.join(directory.name, "index.json")
+        )
+        self.queue = WriteBehindQueue(self.storage, self.journal)
+
+    def enqueue(self, email):
+        return self.queue.enqueue(
+            UserData(email, [["Kale", "Planting Date", "2024-04-01",
+                              "2024-06-01"]])
+        )
+
+    def test_rejected_write_is_dead_lettered(self):
+        self.enqueue("a@x.com")
+        self.enqueue("bad@x.com")
+        self.enqueue("b@x.com")
+        append_rows = self.sheet.append_rows
+
+        def reject_bad(rows, **kwargs):
+            if any(row[0] == "bad@x.com" for row in rows):
+                raise quota_error(400)
+            return append_rows(rows, **kwargs)
+
+        self.sheet.append_rows = reject_bad
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(self.queue.drain(), 2)
+
+        self.assertEqual(self.queue.pending_count(), 0)
+        self.assertEqual(
+            [row[0] for row in self.sheet.get_all_values()[1:]],
+            ["a@x.com", "b@x.com"]
+        )
+        with open(f"{self.journal.path}.dead") as dead:
+            self.assertEqual(
+                [json.loads(line)["email"] for line in dead],
+                ["bad@x.com"]
+            )
+
+    def test_quota_error_leaves_writes_pending(self):
+        self.enqueue("a@x.com")
+
+        def over_quota(rows, **kwargs):
+            raise quota_error(429)
+
+        self.sheet.append_rows = over_quota
+        with unittest.mock.patch("time.sleep"):
+            with self.assertRaises(Exception):
+                self.queue.flush(wait=True)
+        self.assertEqual(self.queue.pending_count(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()